@@ -0,0 +1,301 @@
+"""冷热分层：超过保留期的新闻按批次移出 news_items，写入按月份和来源分区的列式归档
+
+用法:
+    RETENTION_DAYS=90 python archive.py --run   # 执行一次归档，并清理过期的页面快照
+    python archive.py --rebuild-counts          # 为该功能上线前入库的新闻补算每小时计数（见 rollups.py）
+    python archive.py --rebuild-tombstones      # 为已有的归档文件补记归档URL，避免这些新闻被再次抓取入库
+
+归档目录结构为 ARCHIVE_DIR/month=YYYY-MM/source=<来源>/part-<起始id>-<结束id>.parquet，
+可以直接用 pyarrow / DuckDB / pandas 按分区读取，也可以通过 GET /archive 查询。
+"""
+import argparse
+import datetime
+import gzip
+import heapq
+import json
+import logging
+import os
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import quote
+
+from sqlalchemy import delete, insert, select
+
+from cache import response_cache
+from models import ArchivedUrl, NewsItem, get_db
+from search import ensure_search_index, remove_from_index
+from snapshots import prune_snapshots
+
+logger = logging.getLogger(__name__)
+
+RETENTION_DAYS = int(os.environ.get("RETENTION_DAYS", "0"))  # 热表保留的天数（按发布时间），0 表示不归档
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "1000"))  # 每批归档的条数，一批一个事务
+RETENTION_MAX_BATCHES = int(os.environ.get("RETENTION_MAX_BATCHES", "100"))  # 每次归档最多处理的批数
+RETENTION_INTERVAL_SECONDS = int(os.environ.get("RETENTION_INTERVAL_SECONDS", "3600"))  # 定时归档的间隔
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", "./archive"))  # 归档目录
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:  # pyarrow 是可选依赖，未安装时归档为 gzip 压缩的 NDJSON
+    pyarrow = parquet = None
+
+ARCHIVE_FORMAT = os.environ.get("ARCHIVE_FORMAT", "parquet" if parquet is not None else "ndjson")
+FILE_SUFFIXES = {"parquet": ".parquet", "ndjson": ".ndjson.gz"}
+
+# 每次查询归档URL的条数，避免超出数据库的参数个数限制
+TOMBSTONE_CHUNK_SIZE = 500
+
+# 归档的列；去重指纹、图片哈希和补充状态只在热表中有用，不归档
+ARCHIVE_COLUMNS = (
+    NewsItem.id,
+    NewsItem.title,
+    NewsItem.summary,
+    NewsItem.url,
+    NewsItem.image_url,
+    NewsItem.source,
+    NewsItem.cluster_id,
+    NewsItem.author,
+    NewsItem.content,
+    NewsItem.published_at,
+    NewsItem.created_at,
+)
+ARCHIVE_FIELDS = tuple(column.key for column in ARCHIVE_COLUMNS)
+# /archive 返回的字段，不含正文
+LIST_FIELDS = tuple(field for field in ARCHIVE_FIELDS if field != "content")
+DATETIME_FIELDS = ("published_at", "created_at")
+
+
+class ArchiveError(Exception):
+    """归档文件无法读取"""
+
+
+def _schema():
+    return pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("title", pyarrow.string()),
+        ("summary", pyarrow.string()),
+        ("url", pyarrow.string()),
+        ("image_url", pyarrow.string()),
+        ("source", pyarrow.string()),
+        ("cluster_id", pyarrow.int64()),
+        ("author", pyarrow.string()),
+        ("content", pyarrow.string()),
+        ("published_at", pyarrow.timestamp("us")),
+        ("created_at", pyarrow.timestamp("us")),
+    ])
+
+
+def partition_dir(month, source):
+    # 分区值按 URI 编码，与 pyarrow 的 hive 分区约定一致
+    return ARCHIVE_DIR / f"month={month}" / f"source={quote(source or '', safe='')}"
+
+
+def _write_partition(month, source, rows):
+    """把同一分区的一批新闻写成一个文件，返回文件路径
+
+    文件名由该批的起止 id 决定，写入后、提交删除前中断时，重新运行会覆盖同一个文件。
+    """
+    if ARCHIVE_FORMAT == "parquet" and parquet is None:
+        raise ArchiveError("ARCHIVE_FORMAT=parquet 需要安装 pyarrow")
+    directory = partition_dir(month, source)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"part-{rows[0]['id']}-{rows[-1]['id']}{FILE_SUFFIXES[ARCHIVE_FORMAT]}"
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if ARCHIVE_FORMAT == "parquet":
+        parquet.write_table(pyarrow.Table.from_pylist(rows, schema=_schema()), tmp, compression="zstd")
+    else:
+        with gzip.open(tmp, "wt", encoding="utf-8") as output:
+            for row in rows:
+                values = {field: row[field] for field in ARCHIVE_FIELDS}
+                for field in DATETIME_FIELDS:
+                    if values[field] is not None:
+                        values[field] = values[field].isoformat()
+                output.write(json.dumps(values, ensure_ascii=False) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def record_tombstones(db, rows, archived_at=None):
+    """在调用方的事务中记录已归档的URL，已记录的跳过，返回新记录的条数"""
+    archived_at = archived_at or datetime.datetime.utcnow()
+    by_url = {row["url"]: row["id"] for row in rows if row.get("url")}
+    urls = list(by_url)
+    existing = set()
+    for start in range(0, len(urls), TOMBSTONE_CHUNK_SIZE):
+        chunk = urls[start:start + TOMBSTONE_CHUNK_SIZE]
+        existing.update(db.scalars(select(ArchivedUrl.url).where(ArchivedUrl.url.in_(chunk))))
+    params = [{"url": url, "news_id": news_id, "archived_at": archived_at}
+              for url, news_id in by_url.items() if url not in existing]
+    if params:
+        db.execute(insert(ArchivedUrl), params)
+    return len(params)
+
+
+def archive_batch(cutoff, batch_size=RETENTION_BATCH_SIZE):
+    """把一批发布时间早于 cutoff 的新闻写入归档并从热表中删除，返回归档的条数
+
+    先写归档文件，再在一个事务中删除新闻和全文索引并记录归档的URL；事务失败时删除本批写出的文件。
+    """
+    # 全文索引的建表语句需要在写事务开始之前执行
+    ensure_search_index()
+    db = next(get_db())
+    try:
+        rows = [dict(row) for row in db.execute(
+            select(*ARCHIVE_COLUMNS).where(NewsItem.published_at < cutoff).order_by(NewsItem.id).limit(batch_size)
+        ).mappings()]
+        if not rows:
+            return 0
+
+        groups = defaultdict(list)
+        for row in rows:
+            groups[(row["published_at"].strftime("%Y-%m"), row["source"])].append(row)
+        written = []
+        try:
+            for (month, source), group in groups.items():
+                written.append(_write_partition(month, source, group))
+            ids = [row["id"] for row in rows]
+            remove_from_index(db, ids)
+            record_tombstones(db, rows)
+            db.execute(delete(NewsItem.__table__).where(NewsItem.id.in_(ids)))
+            db.commit()
+        except Exception:
+            db.rollback()
+            for path in written:
+                path.unlink(missing_ok=True)
+            raise
+        return len(rows)
+    finally:
+        db.close()
+
+
+def run_retention(days=RETENTION_DAYS, batch_size=RETENTION_BATCH_SIZE, max_batches=RETENTION_MAX_BATCHES):
+    """归档超过保留期的新闻，并清理过期的页面快照，返回 {"archived", "snapshots_removed"}
+
+    每次最多处理 max_batches 批，积压较多时分多次完成，单次运行的耗时有上限。
+    """
+    stats = {"archived": 0, "snapshots_removed": prune_snapshots()}
+    if days <= 0:
+        return stats
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    for _ in range(max_batches):
+        count = archive_batch(cutoff, batch_size)
+        stats["archived"] += count
+        if count < batch_size:
+            break
+    if stats["archived"]:
+        response_cache.invalidate()
+        logger.info(f"归档了 {stats['archived']} 条发布于 {cutoff.isoformat()} 之前的新闻")
+    return stats
+
+
+def _read_file(path, fields=LIST_FIELDS):
+    if path.name.endswith(".parquet"):
+        if parquet is None:
+            raise ArchiveError("读取 Parquet 归档需要安装 pyarrow")
+        return parquet.read_table(path, columns=list(fields)).to_pylist()
+    rows = []
+    with gzip.open(path, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            values = json.loads(line)
+            row = {field: values.get(field) for field in fields}
+            for field in DATETIME_FIELDS:
+                if row.get(field) is not None:
+                    row[field] = datetime.datetime.fromisoformat(row[field])
+            rows.append(row)
+    return rows
+
+
+def read_archive(month, source=None, limit=20, skip=0):
+    """读取某个月（YYYY-MM，按发布时间）的归档新闻，按发布时间倒序分页
+
+    只读取该月（以及指定来源）的分区文件，查询开销与归档的总量无关。文件逐个读取，
+    每读完一个文件只保留排在前 skip + limit 的新闻，内存占用不随该月的归档量增长。
+    """
+    month_dir = ARCHIVE_DIR / f"month={month}"
+    directories = [partition_dir(month, source)] if source else sorted(month_dir.glob("source=*"))
+    wanted = skip + limit
+
+    def sort_key(row):
+        return row["published_at"] or datetime.datetime.min, row["id"]
+
+    candidates = {}
+    for directory in directories:
+        for path in sorted(directory.glob("part-*")):
+            if path.name.endswith(".tmp"):
+                continue
+            for row in _read_file(path):
+                candidates[row["id"]] = row
+            if len(candidates) > wanted:
+                candidates = {row["id"]: row for row in heapq.nlargest(wanted, candidates.values(), key=sort_key)}
+
+    ordered = sorted(candidates.values(), key=sort_key, reverse=True)
+    return [
+        {
+            "id": row["id"],
+            "title": row["title"],
+            "summary": row["summary"],
+            "url": row["url"],
+            "image_url": row["image_url"],
+            "source": row["source"],
+            "story_id": row["cluster_id"] or row["id"],
+            "author": row["author"],
+            "published_at": row["published_at"].isoformat() if row["published_at"] else None,
+            "created_at": row["created_at"].isoformat() if row["created_at"] else None,
+        }
+        for row in ordered[skip:skip + limit]
+    ]
+
+
+def rebuild_tombstones():
+    """读取所有归档文件，为其中还没有记录的URL补记归档，返回补记的条数"""
+    total = 0
+    for path in sorted(ARCHIVE_DIR.glob("month=*/source=*/part-*")):
+        if path.name.endswith(".tmp"):
+            continue
+        rows = _read_file(path, fields=("id", "url"))
+        db = next(get_db())
+        try:
+            total += record_tombstones(db, rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    logger.info(f"补记了 {total} 个已归档的URL")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻归档")
+    parser.add_argument("--run", action="store_true", help="归档超过 RETENTION_DAYS 天的新闻并清理过期快照")
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="热表保留的天数，默认取 RETENTION_DAYS")
+    parser.add_argument("--rebuild-counts", action="store_true", help="为该功能上线前入库的新闻补算每小时计数")
+    parser.add_argument("--rebuild-tombstones", action="store_true", help="为已有的归档文件补记归档URL")
+    args = parser.parse_args()
+
+    from models import init_db
+    from rollups import rebuild_hourly_counts
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    init_db()
+    if args.rebuild_counts:
+        print(f"补充了 {rebuild_hourly_counts()} 个 (小时, 来源) 的新闻计数")
+    if args.rebuild_tombstones:
+        print(f"补记了 {rebuild_tombstones()} 个已归档的URL")
+    if args.run:
+        total = {"archived": 0, "snapshots_removed": 0}
+        while True:
+            stats = run_retention(args.days)
+            for key, value in stats.items():
+                total[key] += value
+            if stats["archived"] < RETENTION_BATCH_SIZE * RETENTION_MAX_BATCHES:
+                break
+        print(f"归档了 {total['archived']} 条新闻，删除了 {total['snapshots_removed']} 个快照文件")
+    if not (args.run or args.rebuild_counts or args.rebuild_tombstones):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""对比逐行写入与批量写入新闻的性能
+
+用法:
+    python -m benchmarks.bench_ingest
+    python -m benchmarks.bench_ingest --sizes 1000 10000 --database-url postgresql://...
+
+每个规模分别测量两轮：首次写入（全部为新数据）和重复写入（全部已存在）。
+逐行写入即原先 save_news_items 的实现：每条新闻一次 SELECT 和一次 flush。
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="逐行写入与批量写入的性能对比")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="每批新闻条数")
+    parser.add_argument("--database-url", default=None, help="数据库URL，默认使用临时SQLite文件")
+    parser.add_argument("--skip-per-row-above", type=int, default=100000,
+                        help="超过该规模时跳过逐行写入（逐行写入在大批量下非常慢）")
+    return parser.parse_args()
+
+
+def make_items(n, prefix):
+    now = datetime.utcnow()
+    return [
+        {
+            "title": f"Benchmark title {i}",
+            "summary": f"Benchmark summary {i} " * 5,
+            "url": f"https://bench.example.com/{prefix}/{i}",
+            "image_url": None,
+            "source": "bench",
+            "published_at": now,
+        }
+        for i in range(n)
+    ]
+
+
+def save_per_row(items):
+    """原先的逐行写入实现，仅用于对比"""
+    from models import NewsItem, get_db
+
+    db = next(get_db())
+    try:
+        saved = 0
+        for item in items:
+            if db.query(NewsItem).filter(NewsItem.url == item["url"]).first():
+                continue
+            db.add(NewsItem(**item))
+            db.flush()
+            saved += 1
+        db.commit()
+        return {"inserted": saved, "skipped": len(items) - saved}
+    finally:
+        db.close()
+
+
+def timed(func, items):
+    start = time.perf_counter()
+    stats = func(items)
+    return time.perf_counter() - start, stats
+
+
+def main():
+    args = parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    else:
+        tmpdir = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir.name}/bench_ingest.db"
+
+    from models import Base, NewsItem, engine
+    from scraper import save_news_items
+
+    logging.getLogger().setLevel(logging.WARNING)
+    Base.metadata.create_all(bind=engine)
+
+    print(f"数据库: {engine.url.render_as_string(hide_password=True)}")
+    print(f"{'方式':<8}{'条数':>10}{'首次写入(s)':>14}{'行/秒':>12}{'重复写入(s)':>14}{'行/秒':>12}")
+
+    for n in args.sizes:
+        for name, func in (("per-row", save_per_row), ("bulk", save_news_items)):
+            if name == "per-row" and n > args.skip_per_row_above:
+                continue
+            items = make_items(n, f"{name}-{n}")
+            first, stats = timed(func, items)
+            second, _ = timed(func, items)
+            assert stats["inserted"] == n, stats
+            print(f"{name:<8}{n:>10}{first:>14.3f}{n / first:>12.0f}{second:>14.3f}{n / second:>12.0f}")
+
+    # 清理基准数据
+    with engine.begin() as conn:
+        conn.execute(NewsItem.__table__.delete().where(NewsItem.source == "bench"))
+    if tmpdir is not None:
+        tmpdir.cleanup()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""对比各解析后端解析新闻页面的速度
+
+用法:
+    python -m benchmarks.bench_parse
+    python -m benchmarks.bench_parse --repeat 50 --backends lxml selectolax
+
+对 benchmarks/fixtures 下的每个页面样本，分别用原先的实现（legacy：html.parser +
+逐个 div 执行 select_one）和 extractors 中每个可用后端解析，输出每页耗时和每秒解析条数。
+RSS 样本（.xml）用 feeds.parse_feed 解析，feed-incr 为只有前 4 条是新条目时的增量解析。
+"""
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+import extractors
+from feeds import parse_feed
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+def legacy_cbs(html):
+    """原先 scrape_cbs_news 中的解析逻辑，仅用于对比"""
+    soup = BeautifulSoup(html, "html.parser")
+    items = []
+    for article in soup.select("article"):
+        title_element = article.select_one("h4")
+        link_element = article.select_one("a")
+        if not title_element or not link_element or not link_element.has_attr("href"):
+            continue
+        summary_element = article.select_one("p")
+        items.append((title_element.text.strip(), summary_element.text.strip() if summary_element else "",
+                      link_element["href"]))
+    return items
+
+
+def legacy_zhitong(html):
+    """原先 scrape_zhitong_news 中的解析逻辑，仅用于对比"""
+    soup = BeautifulSoup(html, "html.parser")
+    articles = soup.select("div.content-box") or soup.select("div.recommend-content") or soup.select("div")
+    items = []
+    for article in articles:
+        title_element = article.select_one("p") or article.select_one("div > p") or article.select_one("a")
+        if not title_element:
+            continue
+        title = title_element.text.strip()
+        if len(title) < 5 or "下载" in title or "备案" in title or "关于" in title or "ICP" in title.upper():
+            continue
+        link_element = article.select_one("a")
+        if not link_element or not link_element.has_attr("href"):
+            continue
+        url = link_element["href"]
+        if "downloadapp" in url or "about" in url or "beian" in url or "icp" in url:
+            continue
+        summary_element = article.select_one("p:not(:first-child)") or article.select_one("div > p:not(:first-child)")
+        items.append((title, summary_element.text.strip() if summary_element else title, url))
+    return items
+
+
+def feed_parsers(data):
+    """完整解析，以及上次已读到第 5 条时的增量解析（读到已见过的条目即停止）"""
+    yield "feed", lambda data: parse_feed(data, "CBS News")[0]
+    seen = [item["url"] for item in parse_feed(data, "CBS News")[0][4:5]]
+    yield "feed-incr", lambda data: parse_feed(data, "CBS News", seen)[0]
+
+
+def parsers_for(page_name, backends, data):
+    if page_name.endswith(".xml"):
+        yield from feed_parsers(data)
+    elif page_name.startswith("cbs"):
+        yield "legacy", legacy_cbs
+        for backend in backends:
+            yield backend, lambda html, b=backend: extractors.extract_cbs_news(html, b)
+    else:
+        yield "legacy", legacy_zhitong
+        for backend in backends:
+            yield backend, lambda html, b=backend: extractors.extract_zhitong_news(html, b)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析后端性能对比")
+    parser.add_argument("--repeat", type=int, default=20, help="每个页面重复解析的次数")
+    parser.add_argument("--backends", nargs="+", default=None, help="要测试的后端，默认测试所有可用后端")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    backends = args.backends or extractors.available_backends()
+
+    print(f"{'页面':<28}{'解析器':<12}{'条数':>6}{'毫秒/页':>10}{'条/秒':>12}")
+    for path in sorted(FIXTURES_DIR.glob("*.*ml")):
+        # feed 按原始字节解析，编码由 XML 声明决定
+        html = path.read_bytes() if path.suffix == ".xml" else path.read_text(encoding="utf-8")
+        for name, parse in parsers_for(path.name, backends, html):
+            items = parse(html)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                parse(html)
+            per_page = (time.perf_counter() - start) / args.repeat
+            print(f"{path.name:<28}{name:<12}{len(items):>6}{per_page * 1000:>10.2f}{len(items) / per_page:>12.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
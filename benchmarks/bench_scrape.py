@@ -0,0 +1,88 @@
+"""离线测量抓取耗时：新闻源指向本地样本服务，不访问外网
+
+用法:
+    python -m benchmarks.bench_scrape
+    python -m benchmarks.bench_scrape --repeat 20 --delay 0.2 --compare
+
+每轮使用新的临时数据库，分别测量：
+    cold      - 首次抓取（下载、解析、全部新闻入库）
+    unchanged - 源站不支持条件请求、页面内容未变（下载后按内容哈希跳过解析）
+    304       - 源站返回 304（不下载页面）
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.loadgen import finish
+from benchmarks.report import DEFAULT_TOLERANCE, summarize
+from benchmarks.stub_server import StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线抓取耗时")
+    parser.add_argument("--repeat", type=int, default=10, help="每个场景的测量次数")
+    parser.add_argument("--delay", type=float, default=0.0, help="样本服务的模拟延迟（秒）")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", action="store_true", help="与基线对比，有退化时以非零状态退出")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的退化比例")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ["DATABASE_URL"] = f"sqlite:///{tmpdir.name}/bench_scrape.db"
+    # 样本中的新闻链接指向外网，基准中不补充详情
+    os.environ.setdefault("ENRICH_ENABLED", "false")
+    # 样本服务在本地，不限制对它的请求速率
+    os.environ.setdefault("HOST_RATE", "0")
+    # 页面快照写入临时目录，计入抓取耗时但不留在仓库中
+    os.environ.setdefault("SNAPSHOT_DIR", f"{tmpdir.name}/snapshots")
+
+    from sqlalchemy import text
+
+    import dedup
+    from models import NewsItem, SourceState, engine, init_db
+    from scraper import scrape_cbs_news, scrape_zhitong_news
+    from search import ensure_search_index
+
+    logging.getLogger().setLevel(logging.WARNING)
+    init_db()
+    ensure_search_index()
+
+    def reset(full=True):
+        """清空新闻和抓取状态；full=False 时只清掉 ETag，让下一次抓取走内容哈希判断"""
+        with engine.begin() as conn:
+            if full:
+                conn.execute(NewsItem.__table__.delete())
+                conn.execute(text("DELETE FROM news_fts"))
+                conn.execute(SourceState.__table__.delete())
+                dedup.near_duplicates = dedup.NearDuplicateIndex()
+            else:
+                conn.execute(SourceState.__table__.update().values(etag=None, last_modified=None))
+
+    scenarios = {}
+    with StubServer(delay=args.delay) as stub:
+        stub.point_sources()
+        for key, scrape in (("cbs", scrape_cbs_news), ("zhitong", scrape_zhitong_news)):
+            timings = {"cold": [], "unchanged": [], "304": []}
+            for _ in range(args.repeat):
+                reset()
+                for name in ("cold", "unchanged", "304"):
+                    if name == "unchanged":
+                        reset(full=False)
+                    start = time.perf_counter()
+                    scrape()
+                    timings[name].append(time.perf_counter() - start)
+            for name, values in timings.items():
+                scenarios[f"{key}_{name}"] = summarize(values, 0, sum(values))
+        print(f"样本服务共处理 {stub.requests} 个请求，其中 304 {stub.not_modified} 个")
+
+    engine.dispose()
+    tmpdir.cleanup()
+    return finish("scrape", scenarios, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""冷启动耗时：导入 main 的时间，以及从启动 API 进程到 /news 返回第一个响应的时间
+
+用法:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --repeats 10 --rows 100000
+    python -m benchmarks.bench_startup --compare
+
+每个场景启动 --repeats 次新进程，结果中的延迟为每次启动的耗时：
+    import_main      - 在新的解释器中 import main（包含表结构检查）
+    first_news_cold  - 启动 uvicorn 到 /news 返回 200，没有预先计算的首页响应
+    first_news_warm  - 同上，使用上次运行保存的 PRECOMPUTED_NEWS_PATH
+API 以 SCHEDULER_MODE=off 启动，不会访问外网。
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from benchmarks.loadgen import finish
+from benchmarks.report import DEFAULT_TOLERANCE, summarize
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+IMPORT_SCRIPT = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def time_import(env):
+    """在新的解释器中导入 main，返回导入耗时（秒）"""
+    output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT_DIR, env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_first_response(env, port, timeout=60):
+    """启动 API 进程，返回从启动到 /news 返回 200 的耗时（秒）"""
+    url = f"http://127.0.0.1:{port}/news"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT_DIR, env=env,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"API 进程启动失败，退出码 {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                pass
+            time.sleep(0.01)
+        raise RuntimeError("等待 /news 响应超时")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def scenario(samples):
+    # 每次启动只有一个样本，吞吐量取平均耗时的倒数，启动变慢时按吞吐量下降对比
+    return summarize(samples, 0, sum(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="冷启动耗时")
+    parser.add_argument("--rows", type=int, default=10000, help="合成数据条数")
+    parser.add_argument("--repeats", type=int, default=5, help="每个场景启动的次数")
+    parser.add_argument("--port", type=int, default=8902, help="API 监听端口")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", action="store_true", help="与基线对比，有退化时以非零状态退出")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的退化比例")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    database_url = f"sqlite:///{tmpdir.name}/bench_startup.db"
+    precomputed = os.path.join(tmpdir.name, "precomputed_news.json")
+    os.environ["DATABASE_URL"] = database_url
+
+    from benchmarks.seed import seed
+    from models import engine, init_db
+
+    init_db()
+    elapsed = seed(args.rows)
+    print(f"写入 {args.rows} 条合成数据，耗时 {elapsed:.1f} 秒")
+    engine.dispose()
+
+    env = dict(os.environ, DATABASE_URL=database_url, SCHEDULER_MODE="off", ENRICH_ENABLED="false",
+               SNAPSHOT_DIR=os.path.join(tmpdir.name, "snapshots"), PRECOMPUTED_NEWS_PATH=precomputed)
+    results = {}
+    try:
+        results["import_main"] = scenario([time_import(env) for _ in range(args.repeats)])
+        cold = []
+        for _ in range(args.repeats):
+            if os.path.exists(precomputed):
+                os.remove(precomputed)
+            cold.append(time_first_response(env, args.port))
+        results["first_news_cold"] = scenario(cold)
+        # 最后一次冷启动已经保存了首页响应
+        results["first_news_warm"] = scenario([time_first_response(env, args.port) for _ in range(args.repeats)])
+    finally:
+        tmpdir.cleanup()
+    return finish("startup", results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""生成解析基准使用的页面样本
+
+样本按CBS世界版块和智通财经推荐页的页面结构构造（导航、脚本、多层嵌套容器等），
+内容是确定性生成的，重新运行本脚本会得到完全相同的文件：
+
+    python -m benchmarks.fixtures.generate
+"""
+import random
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).resolve().parent
+
+WORDS = ("world", "leaders", "talks", "ceasefire", "election", "storm", "markets", "summit", "border",
+         "climate", "trade", "protest", "minister", "sanctions", "earthquake", "rescue", "vote", "treaty")
+CN_WORDS = ("港股", "美股", "财报", "业绩", "公告", "回购", "增持", "央行", "利率", "新能源", "芯片",
+            "医药", "券商", "指数", "收涨", "大涨", "下跌", "评级", "目标价", "营收")
+
+
+def sentence(rng, words, n, sep=" "):
+    return sep.join(rng.choice(words) for _ in range(n))
+
+
+def page_chrome(rng, title, lang):
+    """页头：导航、样式和大量内联脚本，模拟真实页面的噪音"""
+    scripts = "".join(
+        f"<script>window.__data{i}={{\"k\":\"{sentence(rng, WORDS, 40)}\"}};</script>" for i in range(60)
+    )
+    nav = "".join(f'<li class="nav__item"><a href="/section/{i}/">Section {i}</a></li>' for i in range(40))
+    return (f'<!DOCTYPE html><html lang="{lang}"><head><meta charset="utf-8"><title>{title}</title>'
+            f'<style>{"." + sentence(rng, WORDS, 200, "{color:red}.")}{{}}</style>{scripts}</head>'
+            f'<body><header class="site-header"><nav><ul>{nav}</ul></nav></header>')
+
+
+def cbs_world(rng, count=80):
+    parts = [page_chrome(rng, "World - CBS News", "en"), '<main><section class="component list-river">']
+    for i in range(count):
+        slug = "-".join(rng.choice(WORDS) for _ in range(6))
+        parts.append(
+            f'<article class="item" data-index="{i}"><a href="/news/{slug}-{i}/" class="item__anchor">'
+            f'<div class="item__thumb"><figure><picture><source type="image/webp" '
+            f'srcset="https://assets1.cbsnewsstatic.com/hub/i/r/{i}/thumbnail/640x360.webp">'
+            f'<img src="https://assets1.cbsnewsstatic.com/hub/i/r/{i}/thumbnail/320x180.jpg" alt=""></picture></figure></div>'
+            f'<div class="item__text"><h4 class="item__hed">{sentence(rng, WORDS, 8).title()}</h4>'
+            f'<p class="item__dek">{sentence(rng, WORDS, 24).capitalize()}.</p>'
+            f'<ul class="item__metadata"><li class="item__date">{rng.randint(1, 59)}M AGO</li></ul></div></a></article>'
+        )
+    parts.append('</section></main><footer><p>Copyright CBS Interactive</p></footer></body></html>')
+    return "".join(parts)
+
+
+def cbs_world_rss(rng, count=80):
+    """CBS 世界版块的 RSS，条目与页面数量相同，用于对比 feed 与页面解析的开销"""
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>'
+             '<rss version="2.0" xmlns:media="http://search.yahoo.com/mrss/"><channel>'
+             '<title>World - CBS News</title><link>https://www.cbsnews.com/world/</link>'
+             '<image><url>https://www.cbsnews.com/logo.png</url><title>CBS News</title></image>']
+    for i in range(count):
+        slug = "-".join(rng.choice(WORDS) for _ in range(6))
+        url = f"https://www.cbsnews.com/news/{slug}-{i}/"
+        parts.append(
+            f'<item><title>{sentence(rng, WORDS, 8).title()}</title><link>{url}</link>'
+            f'<description>{sentence(rng, WORDS, 24).capitalize()}.</description>'
+            f'<pubDate>Sat, 01 Jun 2024 {23 - i % 24:02d}:{59 - i % 60:02d}:00 +0000</pubDate>'
+            f'<guid isPermaLink="true">{url}</guid>'
+            f'<media:thumbnail url="https://assets1.cbsnewsstatic.com/hub/i/r/{i}/thumbnail/320x180.jpg"/></item>'
+        )
+    parts.append("</channel></rss>")
+    return "".join(parts)
+
+
+def zhitong_item(rng, i):
+    return (f'<div class="info-item"><div class="info-item__text"><p>{sentence(rng, CN_WORDS, 10, "")}</p>'
+            f'<p>{sentence(rng, CN_WORDS, 40, "")}</p></div>'
+            f'<div class="info-item__meta"><a href="/content/detail/{900000 + i}.html">阅读全文</a>'
+            f'<span>{rng.randint(1, 59)}分钟前</span></div></div>')
+
+
+def zhitong_recommend(rng, count=60, depth=6):
+    """没有 content-box 容器的页面，解析器需要退回到遍历所有 <div>"""
+    parts = [page_chrome(rng, "智通财经", "zh")]
+    parts.append("<div>" * depth)
+    for i in range(count):
+        # 每条新闻外面再套几层无意义的 div，模拟多层嵌套布局
+        wrap = rng.randint(1, 4)
+        parts.append("<div class=\"row\">" * wrap + zhitong_item(rng, i) + "</div>" * wrap)
+    parts.append("</div>" * depth)
+    parts.append('<div class="footer"><div><p>下载智通财经APP</p><a href="/downloadapp.html">下载</a></div>'
+                 '<div><p>粤ICP备12345678号</p><a href="https://beian.miit.gov.cn/">备案</a></div></div>')
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def zhitong_content_box(rng, count=60):
+    """带 content-box 容器的页面"""
+    parts = [page_chrome(rng, "智通财经", "zh"), '<div class="main"><div class="list">']
+    for i in range(count):
+        parts.append(f'<div class="content-box">{zhitong_item(rng, i)}</div>')
+    parts.append("</div></div></body></html>")
+    return "".join(parts)
+
+
+def main():
+    rng = random.Random(20240601)
+    pages = {
+        "cbs_world.html": cbs_world(rng),
+        "zhitong_recommend.html": zhitong_recommend(rng),
+        "zhitong_content_box.html": zhitong_content_box(rng),
+        "cbs_world_rss.xml": cbs_world_rss(rng),
+    }
+    for name, html in pages.items():
+        (FIXTURES_DIR / name).write_text(html, encoding="utf-8")
+        print(f"{name}: {len(html.encode('utf-8'))} 字节")
+
+
+if __name__ == "__main__":
+    main()
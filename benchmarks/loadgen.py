@@ -0,0 +1,161 @@
+"""并发压测读接口和抓取接口，输出吞吐量和 p50/p95/p99 延迟
+
+用法:
+    python -m benchmarks.loadgen --base-url http://127.0.0.1:8000 --concurrency 50 --duration 30
+    python -m benchmarks.loadgen --mix list=5,page=3,item=10,scrape=1 --output results.json
+    python -m benchmarks.loadgen --compare                      # 与 benchmarks/baseline.json 对比
+
+场景：
+    list   - GET /news 第一页
+    page   - GET /news?cursor=...，游标取自之前的响应
+    item   - GET /news/{id}，id 取自之前的响应
+    scrape - POST /scrape-now（服务端在后台执行抓取，建议配合 benchmarks.stub_server 使用）
+
+完整的离线流程（写入合成数据、启动样本服务和 API、压测、对比基线）见 benchmarks.bench_service。
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.report import DEFAULT_TOLERANCE, compare, load_baseline, print_results, save_baseline, summarize
+
+PAGE_SIZE = 12
+DEFAULT_MIX = "list=5,page=3,item=10,scrape=0"
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ("list", "page", "item", "scrape"):
+            raise argparse.ArgumentTypeError(f"未知的场景: {name}")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class LoadGenerator:
+    """按权重随机选择场景，用固定数量的并发协程持续发送请求"""
+
+    def __init__(self, base_url, mix, concurrency=20, seed=0):
+        self.base_url = base_url.rstrip("/")
+        self.mix = mix
+        self.concurrency = concurrency
+        self.rng = random.Random(seed)
+        self.latencies = {name: [] for name in mix}
+        self.errors = {name: 0 for name in mix}
+        self.cursors = []
+        self.ids = []
+
+    async def _request(self, session, name):
+        if name == "page" and self.cursors:
+            method, path = "GET", f"/news?limit={PAGE_SIZE}&cursor={self.rng.choice(self.cursors)}"
+        elif name == "item" and self.ids:
+            method, path = "GET", f"/news/{self.rng.choice(self.ids)}"
+        elif name == "scrape":
+            method, path = "POST", "/scrape-now"
+        else:
+            method, path = "GET", f"/news?limit={PAGE_SIZE}"
+
+        start = time.perf_counter()
+        try:
+            async with session.request(method, self.base_url + path) as response:
+                body = await response.read()
+                elapsed = time.perf_counter() - start
+                if response.status >= 400:
+                    self.errors[name] += 1
+                    return
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.errors[name] += 1
+            return
+
+        self.latencies[name].append(elapsed)
+        if method == "GET" and path.startswith("/news?"):
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor and len(self.cursors) < 1000:
+                self.cursors.append(cursor)
+            if len(self.ids) < 5000:
+                self.ids.extend(item["id"] for item in json.loads(body))
+
+    async def _worker(self, session, deadline, remaining):
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await self._request(session, self.rng.choices(names, weights)[0])
+
+    async def run(self, duration=None, requests=None, warmup=2.0):
+        """运行压测，duration（秒）和 requests（总请求数）至少指定一个，返回各场景的结果"""
+        timeout = aiohttp.ClientTimeout(total=60)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            if warmup:
+                # 预热：建立连接并收集游标和 id，不计入结果
+                await asyncio.gather(*(self._worker(session, time.perf_counter() + warmup, None)
+                                       for _ in range(self.concurrency)))
+                self.latencies = {name: [] for name in self.mix}
+                self.errors = {name: 0 for name in self.mix}
+
+            deadline = time.perf_counter() + (duration if duration else float("inf"))
+            remaining = [requests] if requests else None
+            start = time.perf_counter()
+            await asyncio.gather(*(self._worker(session, deadline, remaining) for _ in range(self.concurrency)))
+            elapsed = time.perf_counter() - start
+
+        return {name: summarize(self.latencies[name], self.errors[name], elapsed) for name in self.mix}
+
+
+def add_arguments(parser):
+    parser.add_argument("--concurrency", type=int, default=20, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10, help="压测时长（秒）")
+    parser.add_argument("--requests", type=int, default=None, help="总请求数，指定后达到该数量即停止")
+    parser.add_argument("--warmup", type=float, default=2, help="预热时长（秒），不计入结果")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"场景权重，默认 {DEFAULT_MIX}")
+    parser.add_argument("--output", default=None, help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", action="store_true", help="与基线对比，有退化时以非零状态退出")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="允许的退化比例")
+
+
+def finish(name, results, args):
+    """输出结果，按参数保存或对比基线，返回退出状态"""
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        save_baseline(name, results)
+        print("已保存为基线")
+    if args.compare:
+        baseline = load_baseline(name)
+        if baseline is None:
+            print("没有找到基线，使用 --save-baseline 保存")
+            return 1
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"性能退化: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.base_url, args.mix, args.concurrency)
+    duration = None if args.requests else args.duration
+    results = asyncio.run(generator.run(duration, args.requests, args.warmup))
+    return finish("service", results, args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
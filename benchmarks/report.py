@@ -0,0 +1,80 @@
+"""基准结果的统计、输出以及与基线的对比
+
+结果格式为 {场景: {"requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms"}}。
+基线文件 benchmarks/baseline.json 按基准名称保存各自的结果：{"service": {...}, "scrape": {...}}。
+"""
+import json
+import math
+from pathlib import Path
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# 与基线相比超过该比例视为性能退化
+DEFAULT_TOLERANCE = 0.25
+
+
+def percentile(sorted_values, pct):
+    """最近秩法计算百分位数，sorted_values 需已排序"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values), math.ceil(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[rank]
+
+
+def summarize(latencies, errors, elapsed):
+    """把一个场景的延迟列表（秒）汇总成结果字典"""
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "errors": errors,
+        "rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+def print_results(results):
+    print(f"{'场景':<20}{'请求数':>8}{'错误':>6}{'请求/秒':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, row in results.items():
+        print(f"{name:<20}{row['requests']:>8}{row['errors']:>6}{row['rps']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+
+def load_baseline(name, path=BASELINE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8")).get(name)
+
+
+def save_baseline(name, results, path=BASELINE_PATH):
+    path = Path(path)
+    data = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+    data[name] = results
+    path.write_text(json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, throughput=True):
+    """与基线对比并打印差异，返回退化的场景列表
+
+    p95 延迟比基线高出 tolerance 以上、出现新的错误，或者（throughput=True 时）吞吐量比基线低 tolerance 以上，
+    都视为退化。基线中没有的场景只打印不比较。
+    """
+    regressions = []
+    print(f"{'场景':<20}{'p95 基线':>10}{'p95 当前':>10}{'变化':>9}{'请求/秒 基线':>14}{'请求/秒 当前':>14}{'变化':>9}")
+    for name, row in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<20}{'（基线中没有该场景）':>20}")
+            continue
+        p95_change = row["p95_ms"] / base["p95_ms"] - 1 if base["p95_ms"] else 0.0
+        rps_change = row["rps"] / base["rps"] - 1 if base["rps"] else 0.0
+        regressed = p95_change > tolerance or (row["errors"] and not base["errors"])
+        if throughput and rps_change < -tolerance:
+            regressed = True
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<20}{base['p95_ms']:>10.2f}{row['p95_ms']:>10.2f}{p95_change:>+9.0%}"
+              f"{base['rps']:>14.1f}{row['rps']:>14.1f}{rps_change:>+9.0%}{'  退化' if regressed else ''}")
+    return regressions
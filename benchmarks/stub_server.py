@@ -0,0 +1,143 @@
+"""在本地提供新闻源页面样本的 HTTP 服务，用于离线测量抓取性能
+
+用法:
+    python -m benchmarks.stub_server --port 8900 --delay 0.2
+
+    # 另一个终端中，让服务抓取本地样本
+    CBS_NEWS_URL=http://127.0.0.1:8900/cbs_world.html \\
+    ZHITONG_NEWS_URL=http://127.0.0.1:8900/zhitong_recommend.html uvicorn main:app
+
+页面来自 benchmarks/fixtures。支持 ETag / If-None-Match（返回 304），
+可以用 --delay 模拟源站响应延迟。
+"""
+import argparse
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fixtures.generate import FIXTURES_DIR
+
+# 默认使用的页面样本
+CBS_PAGE = "cbs_world.html"
+CBS_FEED = "cbs_world_rss.xml"
+ZHITONG_PAGE = "zhitong_recommend.html"
+
+
+def load_pages():
+    pages = {}
+    for path in FIXTURES_DIR.glob("*.*ml"):
+        body = path.read_bytes()
+        pages[f"/{path.name}"] = (body, f'"{hashlib.sha1(body).hexdigest()}"')
+    return pages
+
+
+class StubServer:
+    """在后台线程中运行的样本页面服务
+
+        with StubServer(delay=0.1) as stub:
+            stub.point_sources()
+            scrape_all_news()
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, delay=0.0):
+        self.pages = load_pages()
+        self.delay = delay
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if stub.delay:
+                    time.sleep(stub.delay)
+                page = stub.pages.get(self.path.split("?", 1)[0])
+                with stub._lock:
+                    stub.requests += 1
+                if page is None:
+                    self.send_error(404)
+                    return
+                body, etag = page
+                if self.headers.get("If-None-Match") == etag:
+                    with stub._lock:
+                        stub.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                content_type = "application/rss+xml" if self.path.endswith(".xml") else "text/html; charset=utf-8"
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, page):
+        return f"{self.base_url}/{page}"
+
+    def source_urls(self):
+        """返回让服务抓取本地样本的环境变量"""
+        return {"CBS_NEWS_URL": self.url(CBS_PAGE), "CBS_FEED_URL": self.url(CBS_FEED),
+                "ZHITONG_NEWS_URL": self.url(ZHITONG_PAGE)}
+
+    def point_sources(self):
+        """把当前进程中已注册的新闻源指向本地样本"""
+        from scraper import SOURCES
+
+        SOURCES["cbs"].url = self.url(CBS_PAGE)
+        SOURCES["cbs"].feed_url = self.url(CBS_FEED)
+        SOURCES["zhitong"].url = self.url(ZHITONG_PAGE)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻源页面样本服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--delay", type=float, default=0.0, help="每个请求的模拟延迟（秒）")
+    args = parser.parse_args()
+
+    stub = StubServer(args.host, args.port, args.delay)
+    for name, value in stub.source_urls().items():
+        print(f"{name}={value}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import os
+
+from models import NewsItem
+
+logger = logging.getLogger(__name__)
+
+# 跨进程广播地址（如 redis://localhost:6379/0），为空时只在当前进程内广播
+BROADCAST_URL = os.environ.get("BROADCAST_URL")
+BROADCAST_CHANNEL = os.environ.get("BROADCAST_CHANNEL", "news")
+# 每个订阅者最多积压的消息数，超过后断开该订阅者，由客户端重连
+SUBSCRIBER_QUEUE_SIZE = int(os.environ.get("SUBSCRIBER_QUEUE_SIZE", "100"))
+
+# 推送给客户端的新闻字段，与 NewsItem.to_dict 的结果一致
+NEWS_FIELDS = ("id", "title", "summary", "url", "image_url", "source", "cluster_id", "published_at", "created_at")
+
+
+class Subscriber:
+    """一个 SSE 连接的消息队列"""
+
+    def __init__(self, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+
+class LocalBackend:
+    """进程内广播：消息直接交给本进程的 hub 分发"""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def publish(self, message):
+        self.hub.deliver_threadsafe(message)
+
+
+class RedisBackend:
+    """通过 Redis 发布/订阅在多个进程间广播，需要安装 redis 包
+
+    抓取进程（可能是独立的 worker）把消息发布到频道，每个 web 进程订阅该频道并分发给自己的连接。
+    任何实现了 publish / pubsub 接口的兼容服务都可以替代 Redis。
+    """
+
+    def __init__(self, hub, url, channel=BROADCAST_CHANNEL):
+        import redis
+        import redis.asyncio
+
+        self.hub = hub
+        self.channel = channel
+        self._publisher = redis.Redis.from_url(url)
+        self._subscriber = redis.asyncio.Redis.from_url(url)
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+        await self._subscriber.close()
+
+    async def _listen(self):
+        while True:
+            try:
+                async with self._subscriber.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.hub.deliver(message["data"].decode("utf-8"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"订阅广播频道出错，5 秒后重试: {e}")
+                await asyncio.sleep(5)
+
+    def publish(self, message):
+        self._publisher.publish(self.channel, message)
+
+
+class BroadcastHub:
+    """把新入库的新闻推送给所有 SSE 连接
+
+    publish() 可以在任意线程中调用（抓取在线程中入库），消息在事件循环中分发。
+    每个订阅者有一个有界队列，消费太慢、队列满时直接断开该订阅者，不会拖慢入库或其它订阅者。
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.loop = None
+        self.backend = None
+        self.published = 0
+        self.dropped = 0
+
+    async def start(self, backend=None):
+        """在事件循环中启动 hub，backend 为空时根据 BROADCAST_URL 选择"""
+        self.loop = asyncio.get_running_loop()
+        if backend is None:
+            backend = RedisBackend(self, BROADCAST_URL) if BROADCAST_URL else LocalBackend(self)
+        self.backend = backend
+        await self.backend.start()
+
+    async def stop(self):
+        if self.backend is not None:
+            await self.backend.stop()
+        self.loop = None
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish_items(self, rows):
+        """发布新插入的新闻，rows 为 save_news_items 插入的行"""
+        if not rows:
+            return
+        backend = self.backend
+        if backend is None:
+            if BROADCAST_URL:
+                # 没有事件循环的进程（例如独立 worker）只负责发布
+                backend = self.backend = RedisBackend(self, BROADCAST_URL)
+            else:
+                return
+        items = [NewsItem(**{column: row.get(column) for column in NEWS_FIELDS}).to_dict() for row in rows]
+        try:
+            backend.publish(json.dumps(items, ensure_ascii=False))
+            self.published += 1
+        except Exception as e:
+            logger.error(f"广播新闻时出错: {e}")
+
+    def deliver_threadsafe(self, message):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.deliver, message)
+
+    def deliver(self, message):
+        """在事件循环中把消息放入每个订阅者的队列"""
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
+                self.dropped += 1
+                logger.info("SSE 订阅者消费过慢，已断开")
+
+    def stats(self):
+        return {
+            "subscribers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+            "backend": type(self.backend).__name__ if self.backend else None,
+        }
+
+# 进程内共用的广播 hub
+hub = BroadcastHub()
@@ -0,0 +1,266 @@
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import CacheGeneration, get_db
+
+# 缓存参数，可通过环境变量覆盖
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))  # 最多缓存的响应数
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "300"))  # 每条缓存的存活时间（秒）
+# 多久检查一次其它进程（其它 web worker、独立的抓取 worker）是否写入了新数据，也是其它进程缓存最多过期的时间
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL", "1"))  # 秒
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))  # 超过该大小的响应才压缩
+# 预先计算的 /news 首页响应，进程重启后在首次查询数据库之前直接返回；为空表示不保存
+PRECOMPUTED_NEWS_PATH = os.environ.get("PRECOMPUTED_NEWS_PATH", "./precomputed_news.json")
+PRECOMPUTED_NEWS_MAX_AGE = float(os.environ.get("PRECOMPUTED_NEWS_MAX_AGE", "3600"))  # 超过该时间（秒）的文件不再使用
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，未安装时只使用 gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    """一条已序列化的响应"""
+    body: bytes
+    etag: str
+    headers: dict = field(default_factory=dict)
+    expires_at: float = 0.0
+    encoded: dict = field(default_factory=dict)  # {压缩方式: 压缩后的内容}，首次需要时生成
+
+    @property
+    def compressible(self):
+        return len(self.body) >= RESPONSE_COMPRESS_MIN_BYTES
+
+    def etag_for(self, encoding=None):
+        """不同压缩方式的内容不同，强 ETag 也需要区分"""
+        return self.etag if encoding is None else f'{self.etag[:-1]}-{encoding}"'
+
+    def compressed(self, encoding):
+        """返回压缩后的内容，同一条缓存只压缩一次"""
+        body = self.encoded.get(encoding)
+        if body is None:
+            if encoding == "br":
+                body = brotli.compress(self.body, quality=5)
+            else:
+                body = gzip.compress(self.body, compresslevel=6, mtime=0)
+            self.encoded[encoding] = body
+        return body
+
+
+def make_etag(body):
+    """根据响应内容生成强 ETag"""
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def negotiate_encoding(accept_encoding):
+    """按 Accept-Encoding 选择压缩方式：优先 br（已安装 brotli 时），其次 gzip，都不接受时返回 None"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """判断请求头 If-None-Match 是否命中当前 ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class SharedGeneration:
+    """保存在数据库 cache_generations 表中的数据代数，所有进程共用
+
+    写入新数据的进程调用 bump() 加一，其它进程通过 current() 发现变化后清空自己的缓存。
+    """
+
+    def __init__(self, name="news"):
+        self.name = name
+
+    def current(self):
+        db = next(get_db())
+        try:
+            return db.scalar(select(CacheGeneration.generation).where(CacheGeneration.name == self.name)) or 0
+        finally:
+            db.close()
+
+    def bump(self):
+        db = next(get_db())
+        try:
+            for _ in range(2):
+                updated = db.execute(
+                    update(CacheGeneration).where(CacheGeneration.name == self.name).values(
+                        generation=CacheGeneration.generation + 1, updated_at=datetime.datetime.utcnow())
+                ).rowcount
+                if not updated:
+                    db.add(CacheGeneration(name=self.name, generation=1, updated_at=datetime.datetime.utcnow()))
+                try:
+                    db.commit()
+                    return
+                except IntegrityError:
+                    # 另一个进程同时插入了该行，回滚后改为更新
+                    db.rollback()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"更新共享的缓存代数失败，其它进程的缓存将在 TTL 到期后更新: {e}")
+        finally:
+            db.close()
+
+
+class ResponseCache:
+    """进程内的 LRU + TTL 响应缓存
+
+    缓存的是序列化后的响应字节。每次写入新数据后调用 invalidate()，
+    抓取代数 generation 加一并清空缓存，保证读接口不会返回过期的列表。
+    设置了 shared（SharedGeneration）时 invalidate() 同时更新共享的代数，
+    其它进程定期调用 sync()，发现共享代数变化后同样清空缓存。
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL, shared=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self.shared_generation = None  # 上次 sync() 读到的共享代数
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, headers=None, generation=None):
+        """写入缓存；generation 为开始查询时的抓取代数，期间若已失效则不写入"""
+        entry = CachedResponse(
+            body=body,
+            etag=make_etag(body),
+            headers=headers or {},
+            expires_at=time.monotonic() + self.ttl,
+        )
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def invalidate(self):
+        """在写入新数据的事务提交之后调用"""
+        self._clear()
+        if self.shared is not None:
+            self.shared.bump()
+
+    def sync(self):
+        """读取共享代数，与上次读到的不同时清空缓存，返回是否清空；读取失败时保留缓存"""
+        if self.shared is None:
+            return False
+        try:
+            current = self.shared.current()
+        except Exception as e:
+            logger.warning(f"读取共享的缓存代数失败: {e}")
+            return False
+        changed = self.shared_generation is not None and current != self.shared_generation
+        self.shared_generation = current
+        if changed:
+            self._clear()
+        return changed
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "generation": self.generation,
+                "shared_generation": self.shared_generation,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+def save_precomputed(path, entry, generation=None):
+    """把一条缓存的响应写入文件，先写临时文件再替换，读取方不会读到写了一半的文件
+
+    generation 为生成该响应时的共享缓存代数，加载时与当前代数比较。
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"
+    record = {"saved_at": time.time(), "generation": generation, "headers": entry.headers,
+              "body": entry.body.decode("utf-8")}
+    try:
+        with open(tmp, "w", encoding="utf-8") as output:
+            json.dump(record, output, ensure_ascii=False)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"保存预先计算的响应失败: {path} {e}")
+
+
+def load_precomputed(cache, key, path, max_age=PRECOMPUTED_NEWS_MAX_AGE):
+    """把 save_precomputed 保存的响应放入缓存，文件不存在、无法读取、已过期，
+    或保存之后其它进程写入过新数据（共享代数不同）时返回 False
+
+    放入的缓存与普通缓存一样在 TTL 到期或 invalidate() 后失效。
+    """
+    try:
+        with open(path, encoding="utf-8") as source:
+            record = json.load(source)
+        age = time.time() - record["saved_at"]
+        body = record["body"].encode("utf-8")
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return False
+    if age > max_age:
+        return False
+    if cache.shared_generation is not None and record.get("generation") != cache.shared_generation:
+        return False
+    cache.set(key, body, record.get("headers") or {})
+    return True
+
+
+# 读接口共用的响应缓存，各进程通过数据库中的共享代数同步失效
+response_cache = ResponseCache(shared=SharedGeneration())
@@ -0,0 +1,253 @@
+import datetime
+import hashlib
+import logging
+import os
+import threading
+from collections import Counter, deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from sqlalchemy import bindparam, func, select, update
+
+from models import NewsItem, get_db
+from search import tokenize
+
+logger = logging.getLogger(__name__)
+
+# 近似重复处理方式：group - 归入已有的新闻簇；suppress - 直接丢弃；off - 不做近似去重
+DEDUP_MODE = os.environ.get("DEDUP_MODE", "group")
+DEDUP_MAX_DISTANCE = int(os.environ.get("DEDUP_MAX_DISTANCE", "3"))  # SimHash 汉明距离不超过该值视为重复
+DEDUP_WINDOW_HOURS = int(os.environ.get("DEDUP_WINDOW_HOURS", "72"))  # 只与最近这段时间内的新闻比较
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", "50000"))  # 内存索引最多保留的新闻数
+
+# 跟踪参数，规范化URL时去掉
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "ftag", "cmpid", "spm", "share", "from", "ref", "ref_src"}
+TRACKING_PREFIXES = ("utm_",)
+
+SIMHASH_BITS = 64
+# LSH 分段：64 位指纹分成 4 段，每段 16 位。汉明距离不超过 3 的两个指纹至少有一段完全相同
+BANDS = 4
+BAND_BITS = SIMHASH_BITS // BANDS
+
+
+def canonicalize_url(url):
+    """规范化URL：协议和域名转小写，去掉默认端口、锚点和跟踪参数，其余参数排序"""
+    if not url:
+        return url
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(sorted(query)), ""))
+
+
+def simhash(value):
+    """计算文本的 64 位 SimHash 指纹，分词方式与全文检索一致"""
+    weights = [0] * SIMHASH_BITS
+    for token, count in Counter(tokenize(value)).items():
+        token_hash = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if token_hash >> bit & 1 else -count
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def to_signed(value):
+    """把 64 位无符号指纹转换为有符号整数，以便存入 BIGINT 列"""
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+
+def _bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [(band, fingerprint >> (band * BAND_BITS) & mask) for band in range(BANDS)]
+
+
+def _distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class NearDuplicateIndex:
+    """最近新闻的 SimHash 指纹索引
+
+    按 LSH 分段建立倒排表，查询时只需比较与新指纹至少有一段相同的候选，
+    不需要与窗口内的所有新闻逐一比较。索引保存在内存中，首次使用时从数据库加载最近的新闻，
+    之后每次查重前调用 refresh() 补充 id 大于已读最大 id 的新闻（其它进程或线程写入的）。
+    """
+
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE, window_hours=DEDUP_WINDOW_HOURS, max_entries=DEDUP_MAX_ENTRIES):
+        self.max_distance = max_distance
+        self.window = datetime.timedelta(hours=window_hours)
+        self.max_entries = max_entries
+        self._buckets = {}
+        self._entries = deque()  # (加入时间, 新闻id, 指纹, 簇id)，按加入顺序排列
+        self._ids = set()  # 索引中的新闻id，避免 refresh 重复加入本进程已经 add 的新闻
+        self._last_id = None  # 从数据库读到的最大新闻id，为 None 表示还没有加载
+        self._lock = threading.RLock()
+
+    def _load(self):
+        if self._last_id is None:
+            self.refresh()
+
+    def refresh(self):
+        """从数据库读取上次之后新写入的新闻（首次调用时读取窗口内最近的新闻），返回读到的条数"""
+        with self._lock:
+            since = datetime.datetime.utcnow() - self.window
+            query = (
+                select(NewsItem.id, NewsItem.simhash, NewsItem.cluster_id, NewsItem.created_at)
+                .where(NewsItem.created_at >= since, NewsItem.simhash.is_not(None))
+                .order_by(NewsItem.id.desc())
+                .limit(self.max_entries)
+            )
+            first = self._last_id is None
+            db = next(get_db())
+            try:
+                if first:
+                    # 首次加载：先记下当前的最大id，之后写入的新闻由下一次 refresh 读取
+                    self._last_id = db.scalar(select(func.max(NewsItem.id))) or 0
+                    query = query.where(NewsItem.id <= self._last_id)
+                else:
+                    query = query.where(NewsItem.id > self._last_id)
+                rows = db.execute(query).all()
+            finally:
+                db.close()
+            for news_id, fingerprint, cluster_id, created_at in reversed(rows):
+                self._add(news_id, to_unsigned(fingerprint), cluster_id or news_id, created_at)
+                self._last_id = max(self._last_id, news_id)
+            self._evict()
+            if first:
+                logger.info(f"近似去重索引已加载 {len(rows)} 条最近的新闻")
+            elif rows:
+                logger.debug(f"近似去重索引补充了 {len(rows)} 条新写入的新闻")
+            return len(rows)
+
+    def _add(self, news_id, fingerprint, cluster_id, added_at):
+        if news_id in self._ids:
+            return
+        entry = (added_at, news_id, fingerprint, cluster_id)
+        self._ids.add(news_id)
+        self._entries.append(entry)
+        for key in _bands(fingerprint):
+            self._buckets.setdefault(key, []).append(entry)
+
+    def _evict(self):
+        cutoff = datetime.datetime.utcnow() - self.window
+        while self._entries and (len(self._entries) > self.max_entries or self._entries[0][0] < cutoff):
+            entry = self._entries.popleft()
+            self._ids.discard(entry[1])
+            for key in _bands(entry[2]):
+                bucket = self._buckets.get(key)
+                if bucket:
+                    bucket.remove(entry)
+                    if not bucket:
+                        del self._buckets[key]
+
+    def find(self, fingerprint):
+        """返回与指纹最接近的已有新闻所在的簇id，没有近似重复时返回 None"""
+        with self._lock:
+            self._load()
+            best = None
+            for key in _bands(fingerprint):
+                for entry in self._buckets.get(key, ()):
+                    distance = _distance(fingerprint, entry[2])
+                    if distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, entry[3])
+            return best[1] if best else None
+
+    def add(self, news_id, fingerprint, cluster_id):
+        with self._lock:
+            self._load()
+            self._add(news_id, fingerprint, cluster_id, datetime.datetime.utcnow())
+            self._evict()
+
+
+# 进程内共用的近似去重索引
+near_duplicates = NearDuplicateIndex()
+
+# 同一进程中的多个批次（例如并发抓取的来源在各自的线程中入库）依次执行查重、插入和提交，
+# 后一个批次才能与前一个批次刚写入的新闻比较。调用方在 plan_clusters 到 remember 期间持有该锁
+cluster_lock = threading.RLock()
+
+
+def plan_clusters(rows, index=None, mode=None):
+    """插入前为每条新闻计算指纹并查找近似重复
+
+    为每一行写入 simhash 和 cluster_id（与已有新闻重复时为已有簇的id）。
+    同一批次内互相重复的新闻要等插入后才知道id，返回 {行号: 代表行的行号}，由 apply_clusters 处理。
+    suppress 模式下重复的新闻直接从结果中去掉。返回 (保留的行, 批内关联)。
+    查重前先从数据库补充其它进程写入的新闻；同一进程内的并发批次由调用方持有 cluster_lock 串行执行。
+    """
+    index = index or near_duplicates
+    mode = mode or DEDUP_MODE
+    if mode == "off":
+        return rows, {}
+    index.refresh()
+
+    kept = []
+    links = {}
+    batch = {}  # 批内指纹分段 -> [(指纹, 在 kept 中的行号)]
+    for row in rows:
+        fingerprint = simhash(f"{row.get('title') or ''} {row.get('summary') or ''}")
+        cluster_id = index.find(fingerprint)
+        local = None
+        if cluster_id is None:
+            for key in _bands(fingerprint):
+                for other, position in batch.get(key, ()):
+                    if _distance(fingerprint, other) <= index.max_distance:
+                        local = position
+                        break
+                if local is not None:
+                    break
+
+        if (cluster_id is not None or local is not None) and mode == "suppress":
+            logger.debug(f"丢弃近似重复的新闻: {row.get('title')}")
+            continue
+
+        row["simhash"] = to_signed(fingerprint)
+        row["cluster_id"] = cluster_id
+        if local is not None:
+            links[len(kept)] = local
+        else:
+            for key in _bands(fingerprint):
+                batch.setdefault(key, []).append((fingerprint, len(kept)))
+        kept.append(row)
+    return kept, links
+
+
+def apply_clusters(db, rows, inserted, links):
+    """插入后补齐批内重复新闻的簇id，在调用方的事务中执行
+
+    rows 和 links 为 plan_clusters 的返回值，inserted 为实际插入的行（包含 id），其中的 cluster_id 会被同步更新。
+    """
+    inserted_by_url = {row["url"]: row for row in inserted}
+    updates = []
+    for position, representative in links.items():
+        row = inserted_by_url.get(rows[position]["url"])
+        leader = rows[representative]
+        leader_row = inserted_by_url.get(leader["url"])
+        cluster_id = leader.get("cluster_id") or (leader_row["id"] if leader_row else None)
+        if row is not None and cluster_id is not None:
+            row["cluster_id"] = cluster_id
+            updates.append({"news_id": row["id"], "cluster_id": cluster_id})
+
+    if updates:
+        table = NewsItem.__table__
+        db.execute(
+            update(table).where(table.c.id == bindparam("news_id")).values(cluster_id=bindparam("cluster_id")),
+            updates,
+        )
+    return len(updates)
+
+
+def remember(inserted, index=None):
+    """事务提交后，把新插入的新闻加入指纹索引"""
+    index = index or near_duplicates
+    for row in inserted:
+        if row.get("simhash") is not None:
+            index.add(row["id"], to_unsigned(row["simhash"]), row.get("cluster_id") or row["id"])
@@ -0,0 +1,294 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from lxml import etree
+from lxml import html as lxml_html
+from sqlalchemy import bindparam, func, select, update
+
+from cache import response_cache
+from feeds import parse_datetime
+from fetcher import Fetcher
+from metrics import ENRICH_ITEMS
+from models import NewsItem, get_db
+
+logger = logging.getLogger(__name__)
+
+# 抓取完成后是否为新插入的新闻补充详情（发布时间、作者、正文）
+ENRICH_ENABLED = os.environ.get("ENRICH_ENABLED", "true").lower() in ("1", "true", "yes")
+ENRICH_CONCURRENCY = int(os.environ.get("ENRICH_CONCURRENCY", "8"))  # 同时抓取的详情页数
+ENRICH_HOST_INTERVAL = float(os.environ.get("ENRICH_HOST_INTERVAL", "0.5"))  # 同一域名两次请求的最小间隔（秒）
+ENRICH_BATCH_SIZE = int(os.environ.get("ENRICH_BATCH_SIZE", "50"))  # 每次写回数据库的条数
+ENRICH_MAX_PER_RUN = int(os.environ.get("ENRICH_MAX_PER_RUN", "500"))  # 每轮最多处理的条数
+ENRICH_MAX_ATTEMPTS = int(os.environ.get("ENRICH_MAX_ATTEMPTS", "3"))  # 超过后标记为 failed，不再重试
+ENRICH_MAX_CONTENT_CHARS = int(os.environ.get("ENRICH_MAX_CONTENT_CHARS", "20000"))  # 正文最多保存的字数
+
+# 详情页中常见的发布时间和作者的 meta 标签
+PUBLISHED_META = ("article:published_time", "og:article:published_time", "pubdate", "publishdate",
+                  "datePublished", "date", "dc.date")
+AUTHOR_META = ("author", "article:author", "dc.creator", "byl")
+
+
+def _json_ld_article(root):
+    """从 JSON-LD 中找出 NewsArticle / Article 对象"""
+    for script in root.iter("script"):
+        if (script.get("type") or "").lower() != "application/ld+json" or not script.text:
+            continue
+        try:
+            data = json.loads(script.text)
+        except ValueError:
+            continue
+        candidates = data if isinstance(data, list) else data.get("@graph", [data]) if isinstance(data, dict) else []
+        for candidate in candidates:
+            if not isinstance(candidate, dict):
+                continue
+            kind = candidate.get("@type")
+            kinds = kind if isinstance(kind, list) else [kind]
+            if any(k in ("NewsArticle", "Article", "ReportageNewsArticle", "BlogPosting") for k in kinds):
+                return candidate
+    return {}
+
+
+def _author_name(value):
+    if isinstance(value, list):
+        names = [_author_name(item) for item in value]
+        return ", ".join(name for name in names if name)
+    if isinstance(value, dict):
+        return value.get("name") or ""
+    return value or ""
+
+
+def _meta(root, names):
+    values = {}
+    for meta in root.iter("meta"):
+        key = (meta.get("property") or meta.get("name") or meta.get("itemprop") or "").lower()
+        if key and meta.get("content"):
+            values.setdefault(key, meta.get("content").strip())
+    for name in names:
+        if values.get(name.lower()):
+            return values[name.lower()]
+    return None
+
+
+def _body_text(root):
+    """正文：优先取 <article> 中的段落，没有时取页面中所有较长的段落"""
+    containers = root.xpath("//article") or [root]
+    paragraphs = []
+    for container in containers:
+        for p in container.iter("p"):
+            text = " ".join(p.text_content().split())
+            if len(text) >= 20:
+                paragraphs.append(text)
+        if paragraphs:
+            break
+    return "\n\n".join(paragraphs)
+
+
+def extract_article(html):
+    """从详情页中提取 {"published_at", "author", "content"}，提取不到的字段为 None"""
+    try:
+        root = lxml_html.fromstring(html)
+    except (etree.ParserError, ValueError):
+        return {"published_at": None, "author": None, "content": None}
+    article = _json_ld_article(root)
+
+    published_at = parse_datetime(article.get("datePublished")) or parse_datetime(_meta(root, PUBLISHED_META))
+    if published_at is None:
+        times = root.xpath("//time[@datetime]/@datetime")
+        published_at = parse_datetime(times[0]) if times else None
+
+    author = _author_name(article.get("author")) or _meta(root, AUTHOR_META)
+    if not author:
+        links = root.xpath("//*[@rel='author']")
+        author = links[0].text_content().strip() if links else None
+
+    content = article.get("articleBody") or _body_text(root)
+    return {
+        "published_at": published_at,
+        "author": (author or "")[:255] or None,
+        "content": (content or "")[:ENRICH_MAX_CONTENT_CHARS] or None,
+    }
+
+
+class HostRateLimiter:
+    """同一域名的请求之间至少间隔 interval 秒，不同域名互不影响"""
+
+    def __init__(self, interval=ENRICH_HOST_INTERVAL):
+        self.interval = interval
+        self._next_allowed = {}
+        self._locks = defaultdict(asyncio.Lock)
+
+    async def wait(self, host):
+        async with self._locks[host]:
+            loop = asyncio.get_running_loop()
+            delay = self._next_allowed.get(host, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next_allowed[host] = loop.time() + self.interval
+
+
+def _claim_pending(limit):
+    """取出待补充的新闻 (id, url, 已尝试次数)，按 id 顺序"""
+    db = next(get_db())
+    try:
+        return db.execute(
+            select(NewsItem.id, NewsItem.url, NewsItem.enrich_attempts)
+            .where(NewsItem.enrichment_status == "pending")
+            .order_by(NewsItem.id)
+            .limit(limit)
+        ).all()
+    finally:
+        db.close()
+
+
+def _write_results(results):
+    """批量写回补充结果，在一个事务中完成"""
+    table = NewsItem.__table__
+    # executemany 的参数中与列同名的键会被加入 SET 子句，这里只传入各语句需要的参数
+    done = [
+        {"news_id": row["news_id"], "new_author": row["author"], "new_content": row["content"],
+         "new_enriched_at": row["enriched_at"]}
+        for row in results if row["status"] == "done"
+    ]
+    dated = [
+        {"news_id": row["news_id"], "new_published_at": row["published_at"]}
+        for row in results if row["status"] == "done" and row["published_at"] is not None
+    ]
+    retry = [{"news_id": row["news_id"], "new_status": row["status"]} for row in results if row["status"] != "done"]
+    db = next(get_db())
+    try:
+        if done:
+            db.execute(
+                update(table).where(table.c.id == bindparam("news_id")).values(
+                    author=bindparam("new_author"),
+                    content=bindparam("new_content"),
+                    enrichment_status="done",
+                    enriched_at=bindparam("new_enriched_at"),
+                    enrich_attempts=func.coalesce(table.c.enrich_attempts, 0) + 1,
+                ),
+                done,
+            )
+        if dated:
+            # 只替换入库时用抓取时间填充的占位值（与 created_at 相同）；列表页和来源已给出的发布时间不变，
+            # 否则已经返回给客户端的新闻会在 (published_at, id) 游标分页中换到别的位置
+            db.execute(
+                update(table)
+                .where(table.c.id == bindparam("news_id"), table.c.published_at == table.c.created_at)
+                .values(published_at=bindparam("new_published_at")),
+                dated,
+            )
+        if retry:
+            db.execute(
+                update(table).where(table.c.id == bindparam("news_id")).values(
+                    enrichment_status=bindparam("new_status"),
+                    enrich_attempts=func.coalesce(table.c.enrich_attempts, 0) + 1,
+                ),
+                retry,
+            )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    if done:
+        # 发布时间可能变了，列表接口的缓存需要失效
+        response_cache.invalidate()
+
+
+async def _enrich_one(fetcher, limiter, news_id, url, attempts):
+    await limiter.wait(urlsplit(url).netloc)
+    result = await fetcher.fetch(url)
+    if not result.ok:
+        status = "failed" if attempts + 1 >= ENRICH_MAX_ATTEMPTS else "pending"
+        logger.warning(f"补充新闻详情失败（第 {attempts + 1} 次）: {url} {result.error}")
+        return {"news_id": news_id, "status": status, "attempts": attempts}
+    fields = await asyncio.to_thread(extract_article, result.text)
+    return dict(fields, news_id=news_id, status="done", attempts=attempts, enriched_at=datetime.datetime.utcnow())
+
+
+async def enrich_pending(fetcher=None, max_items=ENRICH_MAX_PER_RUN, concurrency=ENRICH_CONCURRENCY):
+    """为待补充（pending）的新闻抓取详情页，返回 {"done", "retry", "failed"} 计数
+
+    固定数量的 worker 从队列中取任务，同一域名的请求按 ENRICH_HOST_INTERVAL 限速，
+    结果每满 ENRICH_BATCH_SIZE 条写回一次数据库。状态保存在 news_items 中，
+    中途退出后重新运行只会处理仍为 pending 的新闻，已完成的不会重复抓取。
+    """
+    if fetcher is None:
+        async with Fetcher() as own_fetcher:
+            return await enrich_pending(own_fetcher, max_items, concurrency)
+
+    counts = {"done": 0, "retry": 0, "failed": 0}
+    rows = await asyncio.to_thread(_claim_pending, max_items)
+    if not rows:
+        return counts
+
+    queue = asyncio.Queue()
+    for row in rows:
+        queue.put_nowait(row)
+    limiter = HostRateLimiter()
+    pending_results = []
+
+    async def flush():
+        batch = pending_results[:]
+        pending_results.clear()
+        if not batch:
+            return
+        try:
+            await asyncio.to_thread(_write_results, batch)
+        except Exception as e:
+            # 写回失败不中断本轮补充，也不影响调度；这批新闻按失败计一次尝试，仍为 pending 的下一轮重试
+            logger.error(f"写回 {len(batch)} 条新闻详情失败: {e}")
+            retry = [
+                {"news_id": row["news_id"],
+                 "status": "failed" if row["attempts"] + 1 >= ENRICH_MAX_ATTEMPTS else "pending"}
+                for row in batch
+            ]
+            try:
+                await asyncio.to_thread(_write_results, retry)
+            except Exception as e:
+                logger.error(f"记录新闻详情的补充状态失败，下一轮重新处理: {e}")
+
+    async def worker():
+        while True:
+            try:
+                news_id, url, attempts = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                result = await _enrich_one(fetcher, limiter, news_id, url, attempts or 0)
+            except Exception as e:
+                logger.error(f"补充新闻详情时出错: {url} {e}")
+                result = {"news_id": news_id, "status": "pending", "attempts": attempts or 0}
+            key = "done" if result["status"] == "done" else "failed" if result["status"] == "failed" else "retry"
+            counts[key] += 1
+            ENRICH_ITEMS.labels(result=key).inc()
+            pending_results.append(result)
+            if len(pending_results) >= ENRICH_BATCH_SIZE:
+                await flush()
+
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, len(rows)))))
+    await flush()
+    logger.info(f"新闻详情补充完成：成功 {counts['done']} 条，待重试 {counts['retry']} 条，放弃 {counts['failed']} 条")
+    return counts
+
+
+def mark_pending(news_ids=None):
+    """把新闻标记为待补充；news_ids 为空时把所有未记录状态的旧新闻标记为待补充，返回更新的条数"""
+    table = NewsItem.__table__
+    statement = update(table).values(enrichment_status="pending", enrich_attempts=0)
+    if news_ids is None:
+        statement = statement.where(table.c.enrichment_status.is_(None))
+    else:
+        statement = statement.where(table.c.id.in_(news_ids))
+    db = next(get_db())
+    try:
+        count = db.execute(statement).rowcount
+        db.commit()
+        return count
+    finally:
+        db.close()
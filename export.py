@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import zlib
+
+from sqlalchemy import select
+
+from models import NewsItem, read_engine
+
+# 导出的列，顺序即CSV的列顺序
+EXPORT_COLUMNS = (
+    NewsItem.id,
+    NewsItem.title,
+    NewsItem.summary,
+    NewsItem.url,
+    NewsItem.image_url,
+    NewsItem.source,
+    NewsItem.cluster_id,
+    NewsItem.published_at,
+    NewsItem.created_at,
+)
+EXPORT_FIELDS = tuple(column.key for column in EXPORT_COLUMNS)
+
+# 服务端游标每次取回的行数
+EXPORT_BATCH_SIZE = 1000
+
+_json_encoder = json.JSONEncoder(ensure_ascii=False)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def _row_values(row):
+    values = dict(zip(EXPORT_FIELDS, row))
+    for field in ("published_at", "created_at"):
+        if values[field] is not None:
+            values[field] = values[field].isoformat()
+    return values
+
+
+def _encode_ndjson(rows):
+    return "".join(_json_encoder.encode(_row_values(row)) + "\n" for row in rows).encode("utf-8")
+
+
+def _encode_csv(rows, header=False):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        values = _row_values(row)
+        writer.writerow([values[field] for field in EXPORT_FIELDS])
+    return buffer.getvalue().encode("utf-8")
+
+
+def iter_export(fmt="ndjson", since=None, source=None, compress=False, batch_size=EXPORT_BATCH_SIZE):
+    """按批次流式导出新闻
+
+    只执行一条查询，通过服务端游标（stream_results / yield_per）逐批取回，
+    每批编码后立即产出，内存占用与总行数无关。since 按入库时间 created_at 过滤，便于增量导出。
+    """
+    statement = select(*EXPORT_COLUMNS).order_by(NewsItem.id)
+    if since is not None:
+        statement = statement.where(NewsItem.created_at >= since)
+    if source:
+        statement = statement.where(NewsItem.source == source)
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+
+    def emit(chunk):
+        return compressor.compress(chunk) if compressor else chunk
+
+    with read_engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        if fmt == "csv":
+            yield emit(_encode_csv([], header=True))
+        for rows in result.partitions():
+            chunk = emit(_encode_csv(rows) if fmt == "csv" else _encode_ndjson(rows))
+            if chunk:
+                yield chunk
+
+    if compressor:
+        yield compressor.flush()
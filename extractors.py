@@ -0,0 +1,351 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+CBS_BASE_URL = "https://www.cbsnews.com"
+ZHITONG_BASE_URL = "https://www.zhitongcaijing.com"
+
+# 智通财经页面中需要过滤的标题关键词和链接关键词
+ZHITONG_TITLE_BLACKLIST = ("下载", "备案", "关于")
+ZHITONG_URL_BLACKLIST = ("downloadapp", "about", "beian", "icp")
+
+# 智通财经的文章容器 class，依次尝试
+ZHITONG_CONTAINER_CLASSES = ("content-box", "recommend-content")
+
+
+class Bs4Backend:
+    """BeautifulSoup + html.parser，兼容性最好但最慢"""
+    name = "bs4"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, Tag
+
+        self._soup = BeautifulSoup
+        self._tag_type = Tag
+
+    def parse(self, html):
+        return self._soup(html, "html.parser")
+
+    def cbs_articles(self, root):
+        return root.select("article")
+
+    def first(self, element, tag):
+        return element.find(tag)
+
+    def text(self, element):
+        return element.get_text()
+
+    def attr(self, element, name):
+        return element.get(name)
+
+    def tag(self, element):
+        return element.name
+
+    def classes(self, element):
+        return element.get("class") or []
+
+    def key(self, element):
+        return id(element)
+
+    def walk(self, root):
+        """后序遍历所有元素，产出 (元素, 子元素列表)"""
+        stack = [(root, False)]
+        while stack:
+            element, visited = stack.pop()
+            children = [child for child in element.children if isinstance(child, self._tag_type)]
+            if visited:
+                yield element, children
+                continue
+            stack.append((element, True))
+            stack.extend((child, False) for child in reversed(children))
+
+
+class LxmlBackend:
+    """lxml，使用预编译的 XPath 选择器"""
+    name = "lxml"
+
+    def __init__(self):
+        from lxml import etree, html as lxml_html
+
+        self._etree = etree
+        self._parser = lxml_html.HTMLParser(encoding="utf-8")
+        self._fromstring = lxml_html.document_fromstring
+        self._articles = etree.XPath("//article")
+        self._first = {tag: etree.XPath(f"(.//{tag})[1]") for tag in ("h4", "p", "a", "img")}
+
+    def parse(self, html):
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+        return self._fromstring(html, parser=self._parser)
+
+    def cbs_articles(self, root):
+        return self._articles(root)
+
+    def first(self, element, tag):
+        found = self._first[tag](element)
+        return found[0] if found else None
+
+    def text(self, element):
+        return element.text_content()
+
+    def attr(self, element, name):
+        return element.get(name)
+
+    def tag(self, element):
+        return element.tag
+
+    def classes(self, element):
+        return (element.get("class") or "").split()
+
+    def key(self, element):
+        return element
+
+    def walk(self, root):
+        for _, element in self._etree.iterwalk(root, events=("end",)):
+            if isinstance(element.tag, str):
+                yield element, [child for child in element if isinstance(child.tag, str)]
+
+
+class SelectolaxBackend:
+    """selectolax（lexbor 引擎），需要额外安装 selectolax"""
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+
+        self._parser = LexborHTMLParser
+
+    def parse(self, html):
+        return self._parser(html).root
+
+    def cbs_articles(self, root):
+        return root.css("article")
+
+    def first(self, element, tag):
+        return element.css_first(tag)
+
+    def text(self, element):
+        return element.text(deep=True)
+
+    def attr(self, element, name):
+        return element.attributes.get(name)
+
+    def tag(self, element):
+        return element.tag
+
+    def classes(self, element):
+        return (element.attributes.get("class") or "").split()
+
+    def key(self, element):
+        return element.mem_id
+
+    def walk(self, root):
+        stack = [(root, False)]
+        while stack:
+            element, visited = stack.pop()
+            children = [child for child in element.iter(include_text=False) if not child.tag.startswith("-")]
+            if visited:
+                yield element, children
+                continue
+            stack.append((element, True))
+            stack.extend((child, False) for child in reversed(children))
+
+
+BACKENDS = {
+    "bs4": Bs4Backend,
+    "lxml": LxmlBackend,
+    "selectolax": SelectolaxBackend,
+}
+
+_instances = {}
+
+
+def available_backends():
+    """返回当前环境中可用的解析后端名称"""
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(name=None):
+    """按名称获取解析后端，默认使用环境变量 EXTRACTOR_BACKEND，未设置时优先 lxml"""
+    if name is None:
+        name = os.environ.get("EXTRACTOR_BACKEND")
+        if name is None:
+            try:
+                return get_backend("lxml")
+            except ImportError:
+                return get_backend("bs4")
+    if name not in _instances:
+        if name not in BACKENDS:
+            raise ValueError(f"未知的解析后端: {name}")
+        _instances[name] = BACKENDS[name]()
+    return _instances[name]
+
+
+def _absolute_url(url, base_url):
+    return url if url.startswith("http") else f"{base_url}{url}"
+
+
+def extract_cbs_news(html, backend=None):
+    """从CBS新闻世界版块页面中解析新闻项"""
+    backend = get_backend(backend)
+    root = backend.parse(html)
+
+    news_items = []
+    for article in backend.cbs_articles(root):
+        try:
+            # 提取标题
+            title_element = backend.first(article, "h4")
+            if title_element is None:
+                continue
+            title = backend.text(title_element).strip()
+
+            # 提取摘要
+            summary_element = backend.first(article, "p")
+            summary = backend.text(summary_element).strip() if summary_element is not None else ""
+
+            # 提取链接
+            link_element = backend.first(article, "a")
+            href = backend.attr(link_element, "href") if link_element is not None else None
+            if not href:
+                continue
+            url = _absolute_url(href, CBS_BASE_URL)
+
+            # 提取图片URL
+            img_element = backend.first(article, "img")
+            image_url = backend.attr(img_element, "src") if img_element is not None else None
+
+            news_items.append({
+                "title": title,
+                "summary": summary,
+                "url": url,
+                "image_url": image_url,
+                "source": "CBS News",
+                # 列表页没有发布时间，入库时以抓取时间占位，之后由 enrichment.py 从详情页补充
+                "published_at": None
+            })
+        except Exception as e:
+            logger.error(f"解析文章时出错: {e}")
+            continue
+
+    return news_items
+
+
+def _zhitong_item(backend, info):
+    """根据容器的摘要信息生成智通财经新闻项，不符合条件时返回 None"""
+    first_p, first_a, summary_p, first_img = info[0], info[1], info[2], info[4]
+
+    title_element = first_p if first_p is not None else first_a
+    if title_element is None:
+        return None
+    title = backend.text(title_element).strip()
+
+    # 如果标题太短或为空，则跳过
+    if len(title) < 5:
+        return None
+
+    # 过滤掉下载、备案号和关于相关的标题
+    if any(word in title for word in ZHITONG_TITLE_BLACKLIST) or "ICP" in title.upper():
+        logger.debug(f"跳过不需要的标题: {title}")
+        return None
+
+    # 提取链接
+    href = backend.attr(first_a, "href") if first_a is not None else None
+    if not href:
+        return None
+    url = _absolute_url(href, ZHITONG_BASE_URL)
+
+    # 过滤掉下载链接、备案号和关于页面
+    if any(word in url for word in ZHITONG_URL_BLACKLIST):
+        logger.debug(f"跳过不需要的链接: {url}")
+        return None
+
+    # 提取摘要，找不到时使用标题作为摘要
+    summary = backend.text(summary_p).strip() if summary_p is not None else title
+
+    # 图片通过 /images 代理加载（带 Referer 绕过防盗链）；懒加载的图片真实地址在 data-src / data-original 中
+    image_url = None
+    if first_img is not None:
+        src = backend.attr(first_img, "data-src") or backend.attr(first_img, "data-original") or backend.attr(first_img, "src")
+        if src and not src.startswith("data:"):
+            image_url = f"https:{src}" if src.startswith("//") else _absolute_url(src, ZHITONG_BASE_URL)
+
+    return {
+        "title": title,
+        "summary": summary,
+        "url": url,
+        "image_url": image_url,
+        "source": "智通财经",
+        # 列表页没有发布时间，入库时以抓取时间占位，之后由 enrichment.py 从详情页补充
+        "published_at": None
+    }
+
+
+def extract_zhitong_news(html, backend=None):
+    """从智通财经推荐页面中解析新闻项
+
+    整个文档只做一次后序遍历，自底向上汇总每个元素子树中的第一个 <p>、第一个 <a>
+    和第一个非首子元素的 <p>（对应原先的 select_one 查询）以及第一个 <img>，因此每个元素只访问一次。
+    优先使用 content-box / recommend-content 容器；两者都不存在时退回到所有 <div>，
+    此时只保留最内层的候选容器，嵌套的外层容器不会产生重复的新闻。
+    """
+    backend = get_backend(backend)
+    root = backend.parse(html)
+
+    # 元素 -> (第一个p, 第一个a, 第一个非首子元素的p, 子树中是否已有候选容器, 第一个img)
+    info = {}
+    containers = {name: [] for name in ZHITONG_CONTAINER_CLASSES}
+    innermost = []
+
+    for element, children in backend.walk(root):
+        first_p = first_a = summary_p = first_img = None
+        has_candidate = False
+        for index, child in enumerate(children):
+            child_tag = backend.tag(child)
+            child_info = info.pop(backend.key(child))
+            if first_p is None:
+                first_p = child if child_tag == "p" else child_info[0]
+            if first_a is None:
+                first_a = child if child_tag == "a" else child_info[1]
+            if summary_p is None:
+                summary_p = child if child_tag == "p" and index > 0 else child_info[2]
+            if first_img is None:
+                first_img = child if child_tag == "img" else child_info[4]
+            has_candidate = has_candidate or child_info[3]
+
+        element_info = (first_p, first_a, summary_p, has_candidate, first_img)
+        if backend.tag(element) == "div":
+            for name in set(backend.classes(element)) & containers.keys():
+                containers[name].append(element_info)
+            if not has_candidate:
+                item = _zhitong_item(backend, element_info)
+                if item is not None:
+                    innermost.append(item)
+                    element_info = element_info[:3] + (True,) + element_info[4:]
+        info[backend.key(element)] = element_info
+
+    for name in ZHITONG_CONTAINER_CLASSES:
+        if containers[name]:
+            items = (_zhitong_item(backend, container) for container in containers[name])
+            break
+    else:
+        items = innermost
+
+    # 按URL去重，保持页面顺序
+    news_items = []
+    seen = set()
+    for item in items:
+        if item is None or item["url"] in seen:
+            continue
+        seen.add(item["url"])
+        news_items.append(item)
+
+    logger.info(f"找到 {len(news_items)} 条智通财经候选新闻")
+    return news_items
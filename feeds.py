@@ -0,0 +1,167 @@
+import datetime
+import logging
+import os
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+
+from lxml import etree
+from lxml import html as lxml_html
+
+logger = logging.getLogger(__name__)
+
+# 单次最多读取的条目数
+FEED_MAX_ITEMS = int(os.environ.get("FEED_MAX_ITEMS", "200"))
+# 记住最近一次读取到的前若干条目，下次读到其中任意一条即停止（防止最新的一条被删除后无法停止）
+FEED_SEEN_LIMIT = int(os.environ.get("FEED_SEEN_LIMIT", "20"))
+
+# 条目元素的本地名：RSS 的 item、Atom 的 entry、站点地图的 url
+ENTRY_TAGS = {"item", "entry", "url"}
+
+
+def _localname(element):
+    tag = element.tag
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _children(element):
+    """按本地名（忽略命名空间）索引子元素，同名时保留第一个"""
+    children = {}
+    for child in element.iter():
+        if child is element:
+            continue
+        children.setdefault(_localname(child), child)
+    return children
+
+
+def _text(element):
+    if element is None:
+        return ""
+    return "".join(element.itertext()).strip()
+
+
+def _plain_text(value):
+    """RSS 的 description 常常是转义后的 HTML，只保留文字"""
+    if "<" not in value:
+        return value
+    try:
+        return lxml_html.fromstring(value).text_content().strip()
+    except (etree.ParserError, ValueError):
+        return value
+
+
+def parse_datetime(value):
+    """解析 RFC 822（RSS）或 ISO 8601（Atom、站点地图）格式的时间，返回不带时区的 UTC 时间，无法解析时返回 None"""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _atom_link(element):
+    alternate = None
+    for child in element:
+        if _localname(child) != "link":
+            continue
+        rel = child.get("rel", "alternate")
+        if rel == "alternate" and alternate is None:
+            alternate = child.get("href")
+    return alternate
+
+
+def _image_url(element):
+    """media:thumbnail / media:content、图片类型的 enclosure 或站点地图的 image:loc"""
+    for child in element.iter():
+        name = _localname(child)
+        if name in ("thumbnail", "content") and child.get("url") and child.get("medium", "image") == "image":
+            return child.get("url")
+        if name == "enclosure" and (child.get("type") or "").startswith("image/"):
+            return child.get("url")
+        if name == "loc" and _localname(child.getparent()) == "image":
+            return _text(child)
+    return None
+
+
+def _entry(element, source_name):
+    """把一个 item / entry / url 元素转换成新闻项，缺少标题或链接时返回 None"""
+    children = _children(element)
+    kind = _localname(element)
+    if kind == "item":
+        url = _text(children.get("link"))
+        guid = _text(children.get("guid")) or url
+        summary = _plain_text(_text(children.get("description")))
+        published_at = parse_datetime(_text(children.get("pubDate")) or _text(children.get("date")))
+        title = _text(children.get("title"))
+    elif kind == "entry":
+        url = _atom_link(element)
+        guid = _text(children.get("id")) or url
+        summary = _plain_text(_text(children.get("summary")) or _text(children.get("content")))
+        published_at = parse_datetime(_text(children.get("published")) or _text(children.get("updated")))
+        title = _text(children.get("title"))
+    else:
+        # 新闻站点地图：url/loc + news:news/news:title、news:publication_date
+        url = _text(children.get("loc"))
+        guid = url
+        summary = ""
+        published_at = parse_datetime(_text(children.get("publication_date")) or _text(children.get("lastmod")))
+        title = _text(children.get("title"))
+
+    if not title or not url:
+        return None
+    return {
+        "guid": guid,
+        "title": title,
+        "summary": summary,
+        "url": url,
+        "image_url": _image_url(element),
+        "source": source_name,
+        "published_at": published_at,
+    }
+
+
+def parse_feed(data, source_name, seen=None, max_items=FEED_MAX_ITEMS):
+    """增量解析 RSS / Atom / 新闻站点地图，返回 (新闻项列表, 本次读到的前若干条目的 guid)
+
+    条目按从新到旧排列，读到 seen 中已有的 guid（RSS 的 guid、Atom 的 id，没有时为链接）即停止，
+    后面的旧条目不再解析。data 为原始字节，编码由 XML 声明决定。
+    """
+    seen = set(seen or ())
+    items = []
+    guids = []
+    parser = etree.iterparse(BytesIO(data), events=("end",), recover=True, resolve_entities=False,
+                             no_network=True, huge_tree=False)
+    try:
+        for _, element in parser:
+            if _localname(element) not in ENTRY_TAGS:
+                continue
+            # RSS 频道图片 <image><url> 的本地名也是 url，只有 urlset 下的 url 才是站点地图条目
+            parent = element.getparent()
+            if _localname(element) == "url" and parent is not None and _localname(parent) != "urlset":
+                continue
+            item = _entry(element, source_name)
+            # 已处理的条目从树中删除，内存占用不随 feed 大小增长
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+            if item is None:
+                continue
+            guid = item.pop("guid")
+            if guid in seen:
+                logger.debug(f"{source_name} 读到已见过的条目，停止解析: {guid}")
+                break
+            if len(guids) < FEED_SEEN_LIMIT:
+                guids.append(guid)
+            items.append(item)
+            if len(items) >= max_items:
+                break
+    except etree.XMLSyntaxError as e:
+        logger.error(f"解析 {source_name} 的 feed 出错: {e}")
+    return items, guids
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import os
+import re
+import socket
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+import aiohttp
+import yarl
+from aiohttp.abc import AbstractResolver
+
+from resilience import FETCH_RETRY_AFTER_MAX, RETRYABLE_STATUSES, FetchPolicy, host_guards, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# 默认请求头，与原先 requests.get 使用的保持一致
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+}
+
+# 抓取参数，可通过环境变量覆盖
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "30"))  # 单次请求总超时（秒）
+FETCH_CONNECT_TIMEOUT = float(os.environ.get("FETCH_CONNECT_TIMEOUT", "10"))  # 建立连接超时（秒）
+FETCH_MAX_CONNECTIONS = int(os.environ.get("FETCH_MAX_CONNECTIONS", "20"))  # 全局并发连接上限
+FETCH_MAX_PER_HOST = int(os.environ.get("FETCH_MAX_PER_HOST", "4"))  # 单个域名并发连接上限
+FETCH_KEEPALIVE = float(os.environ.get("FETCH_KEEPALIVE", "30"))  # 空闲连接保活时间（秒）
+
+# 计算页面内容哈希前需要去掉的部分：脚本、样式和注释中常含有时间戳、随机数等每次请求都不同的内容
+_VOLATILE_HTML = re.compile(r"<script\b.*?</script>|<style\b.*?</style>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+_WHITESPACE = re.compile(r"\s+")
+
+
+class BlockedAddressError(aiohttp.ClientError):
+    """请求的地址不是公网地址（内网、回环、链路本地等）"""
+
+
+def is_public_address(address):
+    """地址是否为公网地址；IPv4 映射的 IPv6 地址按其中的 IPv4 地址判断"""
+    try:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+    except ValueError:
+        return False
+    if ip.version == 6 and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global
+
+
+def is_ip_literal(host):
+    try:
+        ipaddress.ip_address(host.strip("[]").split("%", 1)[0])
+        return True
+    except ValueError:
+        return False
+
+
+class PublicResolver(AbstractResolver):
+    """只返回公网地址的 DNS 解析器，域名解析到内网或回环地址时连接失败"""
+
+    def __init__(self):
+        self._resolver = aiohttp.DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = await self._resolver.resolve(host, port, family=family)
+        public = [address for address in addresses if is_public_address(address["host"])]
+        if not public:
+            raise BlockedAddressError(f"{host} 没有解析到公网地址")
+        return public
+
+    async def close(self):
+        await self._resolver.close()
+
+
+def _check_ip_host(host):
+    if host and is_ip_literal(host) and not is_public_address(host.strip("[]")):
+        raise BlockedAddressError(f"不允许请求非公网地址 {host}")
+
+
+async def _reject_private_ip(session, context, params):
+    """发出请求之前检查 IP 地址形式的域名，它们不经过解析器"""
+    _check_ip_host(params.url.host)
+
+
+async def _reject_private_redirect(session, context, params):
+    """跟随重定向之前检查目标地址，重定向到 IP 地址形式的内网地址时中止"""
+    location = params.response.headers.get("Location")
+    if location:
+        _check_ip_host(params.response.url.join(yarl.URL(location)).host)
+
+
+def content_hash(html):
+    """计算页面规范化后的内容哈希，用于判断页面内容是否发生变化"""
+    normalized = _WHITESPACE.sub(" ", _VOLATILE_HTML.sub("", html)).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FetchResult:
+    """一次抓取的结果"""
+    url: str
+    status: int = 0
+    text: str = ""
+    body: bytes = b""  # 原始响应体，XML 等自带编码声明的内容应使用它解析
+    encoding: str = "utf-8"  # 解码 text 时使用的编码
+    headers: dict = field(default_factory=dict)
+    elapsed: float = 0.0
+    size: int = 0  # 下载的响应体字节数
+    error: str = None
+    attempts: int = 0  # 实际发出的请求次数，熔断时为 0
+    blocked: bool = False  # 目标不是公网地址而被拒绝（Fetcher 的 public_only），不会重试
+
+    @property
+    def ok(self):
+        return self.error is None and 200 <= self.status < 300
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+
+class Fetcher:
+    """共享的异步抓取器
+
+    一个 Fetcher 对应一个 aiohttp 会话：同一域名的请求复用 keep-alive 连接，
+    全局和单域名的并发数由连接池限制。请求按 FetchPolicy 超时和重试，
+    并经过该域名的熔断器和请求预算（见 resilience.py）。
+    public_only=True 时只连接公网地址，用于请求来自抓取内容的URL（例如图片代理），避免访问内网服务。用法：
+
+        async with Fetcher() as fetcher:
+            results = await fetcher.fetch_many([url1, url2])
+    """
+
+    def __init__(self, max_connections=FETCH_MAX_CONNECTIONS, max_per_host=FETCH_MAX_PER_HOST,
+                 timeout=FETCH_TIMEOUT, connect_timeout=FETCH_CONNECT_TIMEOUT, headers=None, policy=None,
+                 public_only=False):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.policy = policy or FetchPolicy()
+        self.headers = dict(DEFAULT_HEADERS, **(headers or {}))
+        self.public_only = public_only
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=FETCH_KEEPALIVE,
+            ttl_dns_cache=300,
+            resolver=PublicResolver() if self.public_only else None,
+        )
+        trace_configs = []
+        if self.public_only:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(_reject_private_ip)
+            trace_config.on_request_redirect.append(_reject_private_redirect)
+            trace_configs.append(trace_config)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=self.headers,
+                                             trace_configs=trace_configs)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _timeout(self, policy):
+        if policy.timeout is None and policy.connect_timeout is None:
+            return None
+        return aiohttp.ClientTimeout(
+            total=self.timeout.total if policy.timeout is None else policy.timeout,
+            connect=self.timeout.connect if policy.connect_timeout is None else policy.connect_timeout,
+        )
+
+    async def _read_limited(self, response, max_bytes):
+        """边下载边累计字节数，超过 max_bytes 时停止下载并返回 None"""
+        if response.content_length is not None and response.content_length > max_bytes:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if size > max_bytes:
+                return None
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _fetch_once(self, url, headers, timeout, max_bytes=None):
+        start = time.perf_counter()
+        try:
+            async with self.session.get(url, headers=headers, timeout=timeout) as response:
+                if max_bytes is None:
+                    body = await response.read()
+                else:
+                    body = await self._read_limited(response, max_bytes)
+                    if body is None:
+                        # 响应本身正常，不重试也不计入熔断
+                        return FetchResult(url=url, status=response.status, elapsed=time.perf_counter() - start,
+                                           error=f"响应超过 {max_bytes} 字节")
+                try:
+                    encoding = response.get_encoding()
+                except RuntimeError:
+                    encoding = "utf-8"
+                result = FetchResult(
+                    url=url,
+                    status=response.status,
+                    text=body.decode(encoding, errors="replace"),
+                    body=body,
+                    encoding=encoding,
+                    headers=response.headers.copy(),  # 保留大小写不敏感的响应头
+                    elapsed=time.perf_counter() - start,
+                    size=len(body),
+                )
+                if response.status >= 400:
+                    result.error = f"HTTP {response.status}"
+                return result
+        except asyncio.TimeoutError:
+            error = "请求超时"
+        except BlockedAddressError as e:
+            return FetchResult(url=url, elapsed=time.perf_counter() - start, error=str(e), blocked=True)
+        except aiohttp.ClientError as e:
+            error = f"{type(e).__name__}: {e}"
+        return FetchResult(url=url, elapsed=time.perf_counter() - start, error=error)
+
+    async def fetch(self, url, headers=None, policy=None, max_bytes=None):
+        """抓取单个URL，出错时不抛异常，而是在结果的 error 字段中返回
+
+        max_bytes 为响应体的大小上限，超过时不再继续下载，返回带 error 的结果。
+
+        连接失败、超时、429 和 5xx 按 policy 重试，重试前随机退避，服务器返回 Retry-After 时按它等待；
+        Retry-After 超过 FETCH_RETRY_AFTER_MAX 时不再重试，并在这段时间内熔断该域名。
+        """
+        if self.session is None:
+            raise RuntimeError("Fetcher 未启动，请使用 async with Fetcher() as fetcher")
+
+        policy = policy or self.policy
+        guard = host_guards.get(urlsplit(url).netloc)
+        if not guard.breaker.allow():
+            logger.warning(f"{urlsplit(url).netloc} 熔断中，跳过 {url}")
+            return FetchResult(url=url, error="熔断中，跳过请求")
+
+        timeout = self._timeout(policy)
+        start = time.perf_counter()
+        retry_after = None
+        result = None
+        try:
+            for attempt in range(policy.retries + 1):
+                wait = guard.bucket.reserve()
+                if wait:
+                    await asyncio.sleep(wait)
+                result = await self._fetch_once(url, headers, timeout, max_bytes)
+                retryable = result.status == 0 or result.status in RETRYABLE_STATUSES
+                if not retryable or result.blocked:
+                    break
+                retry_after = parse_retry_after(result.headers.get("Retry-After"))
+                if attempt == policy.retries or (retry_after is not None and retry_after > FETCH_RETRY_AFTER_MAX):
+                    break
+                delay = policy.backoff(attempt) if retry_after is None else retry_after
+                logger.info(f"抓取 {url} 失败（{result.error}），{delay:.1f} 秒后第 {attempt + 1} 次重试")
+                await asyncio.sleep(delay)
+        finally:
+            if result is not None and (result.status == 0 or result.status in RETRYABLE_STATUSES):
+                hold = retry_after if retry_after is not None and retry_after > FETCH_RETRY_AFTER_MAX else None
+                guard.breaker.record_failure(result.error, hold)
+            elif result is not None:
+                guard.breaker.record_success()
+            else:
+                # 第一次请求之前就被取消
+                guard.breaker.release()
+
+        result.attempts = attempt + 1
+        result.elapsed = time.perf_counter() - start
+        if result.status == 0:
+            logger.error(f"抓取 {url} 失败: {result.error}")
+        return result
+
+    async def fetch_many(self, urls, headers=None, policy=None, max_bytes=None):
+        """并发抓取多个URL，返回与输入顺序一致的结果列表，policy 和 max_bytes 的含义同 fetch"""
+        return await asyncio.gather(*(self.fetch(url, headers=headers, policy=policy, max_bytes=max_bytes)
+                                      for url in urls))
@@ -0,0 +1,258 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from sqlalchemy import select, update
+
+from fetcher import Fetcher, is_ip_literal, is_public_address
+from models import NewsItem, get_db, get_read_db
+
+logger = logging.getLogger(__name__)
+
+IMAGE_CACHE_DIR = Path(os.environ.get("IMAGE_CACHE_DIR", "./image_cache"))  # 图片缓存目录
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 缓存目录的容量上限
+IMAGE_MAX_SOURCE_BYTES = int(os.environ.get("IMAGE_MAX_SOURCE_BYTES", str(10 * 1024 * 1024)))  # 原图大小上限
+# 可选的缩略图宽度，请求的宽度向上取到其中之一，避免任意宽度产生大量缓存文件
+IMAGE_WIDTHS = tuple(int(w) for w in os.environ.get("IMAGE_WIDTHS", "160,320,640,1280").split(","))
+# 设置后不由应用读取文件，而是返回 X-Accel-Redirect 头，由 nginx 用 sendfile 发送缓存目录中的文件
+IMAGE_ACCEL_REDIRECT = os.environ.get("IMAGE_ACCEL_REDIRECT")  # 例如 /_image_cache
+# 允许下载图片的域名（逗号分隔，包含子域名），为空时允许任意公网域名；内网和回环地址总是拒绝
+IMAGE_ALLOWED_HOSTS = tuple(host.strip().lower().lstrip(".")
+                            for host in os.environ.get("IMAGE_ALLOWED_HOSTS", "").split(",") if host.strip())
+
+FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+# 命中时距离上次更新修改时间超过该秒数才再次更新，LRU 只需要粗略的访问顺序
+TOUCH_INTERVAL = 3600
+
+
+class ImageError(Exception):
+    """原图无法获取或无法识别"""
+
+
+def pick_width(width):
+    """把请求的宽度向上取到允许的宽度之一"""
+    for allowed in IMAGE_WIDTHS:
+        if width <= allowed:
+            return allowed
+    return IMAGE_WIDTHS[-1]
+
+
+def host_allowed(host, allowed_hosts=IMAGE_ALLOWED_HOSTS):
+    """图片地址的域名是否允许下载：IP 地址形式的域名必须是公网地址，设置了 IMAGE_ALLOWED_HOSTS 时还需在其中
+
+    域名解析到的地址在连接时检查（见 fetcher.PublicResolver）。
+    """
+    host = (host or "").lower().rstrip(".")
+    if not host or host == "localhost" or host.endswith(".localhost"):
+        return False
+    if is_ip_literal(host) and not is_public_address(host.strip("[]")):
+        return False
+    if allowed_hosts:
+        return any(host == allowed or host.endswith(f".{allowed}") for allowed in allowed_hosts)
+    return True
+
+
+def resolve_image_url(image_url, page_url=None):
+    """把新闻的图片地址转换为可以下载的绝对地址，相对地址按新闻页面解析
+
+    data: 等非 HTTP 地址、内网地址和不在 IMAGE_ALLOWED_HOSTS 中的域名返回 None。
+    """
+    if not image_url:
+        return None
+    try:
+        url = urljoin(page_url or "", image_url.strip())
+        parts = urlsplit(url)
+        host = parts.hostname
+    except ValueError:
+        return None
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        return None
+    if not host_allowed(host):
+        return None
+    return url
+
+
+def make_thumbnail(data, width, fmt):
+    """把原图缩放到不超过 width 的宽度并编码为 WebP 或 JPEG，原图比 width 小时不放大"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        # 图片数据在 thumbnail() 中才真正解码，截断的文件在这里才会出错
+        image.thumbnail((width, width * 4))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+        # DecompressionBombError 不是 OSError 的子类，需要单独捕获
+        raise ImageError(f"无法识别的图片: {e}") from e
+    pil_format, _ = FORMATS[fmt]
+    if pil_format == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    if pil_format == "JPEG":
+        image.save(output, "JPEG", quality=82, optimize=True, progressive=True)
+    else:
+        image.save(output, "WEBP", quality=80, method=4)
+    return output.getvalue()
+
+
+class ImageStore:
+    """按内容寻址的图片磁盘缓存
+
+    原图按 sha256 保存在 originals/ 下，相同的图片只保存一份；缩略图按 (哈希, 宽度, 格式) 保存在 thumbs/ 下。
+    命中时更新文件的修改时间，总大小超过 IMAGE_CACHE_MAX_BYTES 时按修改时间删除最久未用的文件。
+    """
+
+    def __init__(self, root=IMAGE_CACHE_DIR, max_bytes=IMAGE_CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._size = None
+        self._size_lock = threading.Lock()
+        self._inflight = {}
+        self._fetcher = None
+
+    def original_path(self, digest):
+        return self.root / "originals" / digest[:2] / digest
+
+    def thumbnail_path(self, digest, width, fmt):
+        return self.root / "thumbs" / digest[:2] / f"{digest}_{width}.{fmt}"
+
+    def _files(self):
+        return [path for path in self.root.rglob("*") if path.is_file() and not path.name.endswith(".tmp")]
+
+    def _write(self, path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+        with self._size_lock:
+            if self._size is None:
+                self._size = sum(f.stat().st_size for f in self._files())
+            else:
+                self._size += len(data)
+            over = self._size > self.max_bytes
+        if over:
+            self.evict(keep=path)
+
+    def touch(self, path):
+        """更新最近使用时间"""
+        try:
+            if time.time() - path.stat().st_mtime > TOUCH_INTERVAL:
+                os.utime(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self, target_ratio=0.9, keep=None):
+        """删除最久未用的文件，直到总大小降到上限的 target_ratio 以下，返回删除的文件数
+
+        keep 为刚写入的文件，即使超过上限也保留，避免原图在生成缩略图之前就被删除。
+        """
+        files = []
+        for path in self._files():
+            if path == keep:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        kept = keep.stat().st_size if keep is not None and keep.exists() else 0
+        total = sum(size for _, size, _ in files) + kept
+        target = self.max_bytes * target_ratio
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        with self._size_lock:
+            self._size = total
+        if removed:
+            logger.info(f"图片缓存超过上限，删除了 {removed} 个最久未用的文件")
+        return removed
+
+    def save_original(self, data):
+        """保存原图，返回内容哈希"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.original_path(digest)
+        if not path.exists():
+            self._write(path, data)
+        return digest
+
+    def thumbnail(self, digest, width, fmt):
+        """返回缩略图路径，不存在时由原图生成；原图也不在缓存中时返回 None"""
+        path = self.thumbnail_path(digest, width, fmt)
+        if path.exists():
+            self.touch(path)
+            return path
+        original = self.original_path(digest)
+        try:
+            data = original.read_bytes()
+        except FileNotFoundError:
+            return None
+        self.touch(original)
+        self._write(path, make_thumbnail(data, width, fmt))
+        return path
+
+    async def fetch_original(self, url, referer=None):
+        """下载原图并保存，返回内容哈希；同一URL同时有多个请求时只下载一次"""
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._download(url, referer))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, url, referer):
+        if self._fetcher is None:
+            # 图片地址来自抓取的内容，只允许连接公网地址（包括重定向之后的地址），避免被用来访问内网服务
+            self._fetcher = await Fetcher(public_only=True).__aenter__()
+        # 带上新闻页面作为 Referer，绕过图片站的防盗链
+        headers = {"Referer": referer} if referer else None
+        # 按 Content-Length 和已下载的字节数限制大小，过大的图片不会整个读入内存
+        result = await self._fetcher.fetch(url, headers=headers, max_bytes=IMAGE_MAX_SOURCE_BYTES)
+        if not result.ok:
+            raise ImageError(f"下载图片失败: {result.error}")
+        return await asyncio.to_thread(self.save_original, result.body)
+
+    async def close(self):
+        if self._fetcher is not None:
+            await self._fetcher.close()
+            self._fetcher = None
+
+
+def load_image_source(news_id):
+    """返回新闻的 (图片URL, 已缓存的图片哈希, 新闻URL)，新闻不存在时返回 None
+
+    图片URL是数据库中的原始值，下载前用 resolve_image_url 转换为绝对地址。
+    """
+    db = next(get_read_db())
+    try:
+        return db.execute(
+            select(NewsItem.image_url, NewsItem.image_hash, NewsItem.url).where(NewsItem.id == news_id)
+        ).first()
+    finally:
+        db.close()
+
+
+def save_image_hash(news_id, digest):
+    """记录新闻图片的内容哈希，之后的请求不再需要下载原图"""
+    db = next(get_db())
+    try:
+        db.execute(update(NewsItem).where(NewsItem.id == news_id).values(image_hash=digest))
+        db.commit()
+    finally:
+        db.close()
+
+
+# 进程内共用的图片缓存
+image_store = ImageStore()
@@ -0,0 +1,76 @@
+import datetime
+import logging
+import os
+import socket
+import uuid
+
+from sqlalchemy import delete, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from models import SchedulerLock, engine
+
+logger = logging.getLogger(__name__)
+
+# leader 租约时长（秒），leader 需要在租约过期前续约
+LEADER_LEASE_SECONDS = int(os.environ.get("LEADER_LEASE_SECONDS", "60"))
+
+
+class LeaderElector:
+    """基于数据库锁行的 leader 选举
+
+    scheduler_locks 表中每个锁名对应一行，记录持有者和租约过期时间。
+    抢锁和续约都是一条带条件的 UPDATE（持有者是自己，或者租约已过期），
+    在 SQLite 和 PostgreSQL 上都是原子操作，因此同一时刻最多只有一个进程成为 leader。
+    进程崩溃后，其它进程会在租约过期后接手。
+    """
+
+    def __init__(self, name="scrape", lease_seconds=LEADER_LEASE_SECONDS, owner=None):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+
+    def try_acquire(self):
+        """尝试成为 leader 或为已持有的租约续约，返回当前是否为 leader"""
+        table = SchedulerLock.__table__
+        now = datetime.datetime.utcnow()
+        expires_at = now + datetime.timedelta(seconds=self.lease_seconds)
+
+        try:
+            try:
+                with engine.begin() as conn:
+                    conn.execute(insert(table).values(name=self.name, owner=self.owner, expires_at=expires_at))
+                acquired = True
+            except IntegrityError:
+                # 锁行已存在：只有持有者本人或租约已过期时才能更新
+                with engine.begin() as conn:
+                    result = conn.execute(
+                        update(table)
+                        .where(table.c.name == self.name)
+                        .where(or_(table.c.owner == self.owner, table.c.expires_at < now))
+                        .values(owner=self.owner, expires_at=expires_at)
+                    )
+                acquired = result.rowcount == 1
+        except Exception as e:
+            logger.error(f"leader 选举时出错: {e}")
+            acquired = False
+
+        if acquired != self.is_leader:
+            if acquired:
+                logger.info(f"成为调度 leader: {self.owner}")
+            else:
+                logger.info(f"失去调度 leader 身份: {self.owner}")
+        self.is_leader = acquired
+        return acquired
+
+    def release(self):
+        """主动释放锁，让其它进程无需等待租约过期即可接手"""
+        if not self.is_leader:
+            return
+        table = SchedulerLock.__table__
+        try:
+            with engine.begin() as conn:
+                conn.execute(delete(table).where(table.c.name == self.name).where(table.c.owner == self.owner))
+        except Exception as e:
+            logger.error(f"释放 leader 锁时出错: {e}")
+        self.is_leader = False
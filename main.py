@@ -1,21 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Request
+from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
-from apscheduler.schedulers.background import BackgroundScheduler
 import uvicorn
+import asyncio
+import hmac
 import logging
+import time
 import os
-import json
+import sys
+from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Optional
+from dataclasses import asdict
+from urllib.parse import urlsplit
 
-from models import NewsItem, Base, get_db, engine
-from scraper import scrape_cbs_news, scrape_zhitong_news
+from models import NewsItem, engine, get_db, get_read_db, init_db, read_engine
+from pagination import encode_cursor, decode_cursor
+from serialization import dumps, news_columns, news_row, parse_fields, project
+from cache import (CACHE_SYNC_INTERVAL, PRECOMPUTED_NEWS_PATH, response_cache, etag_matches, load_precomputed, negotiate_encoding,
+                   save_precomputed)
+from search import ensure_search_index, search_news
+from export import iter_export, MEDIA_TYPES
+from broadcast import hub
+from source_state import load_all_source_states
+from polling import interval_bounds
+from resilience import host_guards
+from metrics import HTTP_REQUEST_SECONDS, RESPONSE_BUILD_SECONDS, instrument_pool, observe, render_metrics
+from profiling import profile_call, profile_for
+# 抓取（bs4、lxml、aiohttp）、调度（apscheduler）、图片（Pillow）、归档等模块导入较慢，
+# 在首次使用时才导入，进程启动后可以尽快开始处理请求
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+# 表结构与模型一致时只执行一次查询，否则建表并补建列和索引（见 models.init_db）
+init_db()
+ensure_search_index()
+# 统计连接池取连接的等待时间
+instrument_pool(engine)
+if read_engine is not engine:
+    instrument_pool(read_engine)
 
 # 配置日志
 logging.basicConfig(
@@ -49,48 +77,367 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
-# 创建调度器
-scheduler = BackgroundScheduler()
+# 调度器在启动后的后台任务中创建（多进程部署时只有 leader 执行抓取，见 scheduling.py）
+scheduler = None
+
+# 启动时首次抓取的状态，供 /ready 查询
+readiness = {"ready": False, "started_at": None, "finished_at": None, "found": None, "error": None}
+initial_scrape_task = None
+# 定期检查其它进程是否写入了新数据，见 sync_response_cache
+cache_sync_task = None
+
+# 不带参数的 /news 首页，响应会保存到 PRECOMPUTED_NEWS_PATH，重启后首个请求直接返回
+DEFAULT_NEWS_KEY = ("/news", ())
+
+# 管理接口（如 /admin/profile）的访问令牌，未设置时管理接口不可用
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+# SSE 连接空闲时发送心跳的间隔（秒），避免被代理当作空闲连接断开
+SSE_HEARTBEAT_SECONDS = float(os.environ.get("SSE_HEARTBEAT_SECONDS", "15"))
 
 # 定义API路由
+def route_template(request: Request):
+    """返回请求匹配的路由模板（如 /news/{news_id}），作为指标标签不会因路径参数而无限增长"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """按路由模板统计请求耗时"""
+    start = time.perf_counter()
+    response = await call_next(request)
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method, route=route_template(request), status=response.status_code,
+    ).observe(time.perf_counter() - start)
+    return response
+
 @app.get("/", response_class=HTMLResponse)
 async def root():
     # 重定向到静态HTML页面
     return RedirectResponse(url="/static/index.html")
 
+async def cached_json_response(request: Request, build):
+    """返回带缓存和 ETag 的 JSON 响应
+
+    缓存按路径和查询参数区分；未命中时调用 build() 得到 (内容, 额外响应头) 并序列化后缓存。
+    请求头 If-None-Match 与 ETag 一致时直接返回 304。
+    """
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = response_cache.get(key)
+    if entry is None:
+        # 未命中时的数据库查询和序列化都是阻塞操作，放到线程池中执行，不占用事件循环
+        generation = response_cache.generation
+        shared_generation = response_cache.shared_generation
+        route = route_template(request)
+        with observe(RESPONSE_BUILD_SECONDS, route=route, stage="build"):
+            content, headers = await run_in_threadpool(build)
+        with observe(RESPONSE_BUILD_SECONDS, route=route, stage="serialize"):
+            body = await run_in_threadpool(dumps, content)
+        entry = response_cache.set(key, body, headers, generation=generation)
+        if key == DEFAULT_NEWS_KEY and PRECOMPUTED_NEWS_PATH and generation == response_cache.generation:
+            await run_in_threadpool(save_precomputed, PRECOMPUTED_NEWS_PATH, entry, shared_generation)
+
+    headers = dict(entry.headers)
+    headers["Cache-Control"] = "no-cache"
+    encoding = None
+    if entry.compressible:
+        # 较大的响应按 Accept-Encoding 压缩，压缩结果随缓存保存，同一条缓存只压缩一次
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        headers["Vary"] = "Accept-Encoding"
+    headers["ETag"] = entry.etag_for(encoding)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+    body = entry.encoded.get(encoding) or await run_in_threadpool(entry.compressed, encoding)
+    headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def list_fields(fields):
+    """解析列表接口的 fields 参数"""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/news")
-async def get_news(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    """获取新闻列表"""
-    news = db.query(NewsItem).order_by(NewsItem.published_at.desc()).offset(skip).limit(limit).all()
-    # 将ORM对象转换为字典
-    return [item.to_dict() for item in news]
+async def get_news(request: Request, skip: int = 0, limit: int = 10, cursor: Optional[str] = None,
+                   source: Optional[str] = None, collapse: bool = False, fields: Optional[str] = None,
+                   db: Session = Depends(get_read_db)):
+    """获取新闻列表
+
+    推荐使用游标分页：下一页的游标通过响应头 X-Next-Cursor 返回，没有该响应头表示已到最后一页。
+    skip 参数仅为兼容旧客户端保留，翻页较深时会变慢。
+    collapse=true 时近似重复的新闻只返回每个簇的代表新闻（story_id 与 id 相同的那条）。
+    fields 为逗号分隔的字段列表（如 fields=id,title,url），列表页不需要摘要时可以少查询、少传输。
+    """
+    selected = list_fields(fields)
+
+    def build():
+        # 只查询需要的列，不构造 ORM 对象
+        query = select(*news_columns(selected))
+        if source:
+            query = query.where(NewsItem.source == source)
+        if collapse:
+            query = query.where(NewsItem.cluster_id.is_(None))
+        if cursor:
+            try:
+                published_at, last_id = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            query = query.where(tuple_(NewsItem.published_at, NewsItem.id) < tuple_(published_at, last_id))
+        query = query.order_by(NewsItem.published_at.desc(), NewsItem.id.desc())
+        if skip and not cursor:
+            query = query.offset(skip)
+
+        news = db.execute(query.limit(limit)).all()
+        headers = {}
+        if len(news) == limit and news[-1].published_at is not None:
+            headers["X-Next-Cursor"] = encode_cursor(news[-1])
+        return [news_row(row, selected) for row in news], headers
+
+    return await cached_json_response(request, build)
+
+@app.get("/news/export")
+async def export_news(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), since: Optional[datetime] = None,
+                      source: Optional[str] = None, gzip: bool = False):
+    """流式导出新闻（NDJSON 或 CSV），since 按入库时间过滤，gzip=true 时下载 .gz 压缩文件
+
+    压缩文件以 application/gzip 类型下载，不设置 Content-Encoding，客户端不会自动解压后再以 .gz 的名字保存。
+    """
+    headers = {"Content-Disposition": f'attachment; filename="news.{format}{".gz" if gzip else ""}"'}
+    return StreamingResponse(
+        iter_export(format, since=since, source=source, compress=gzip),
+        media_type="application/gzip" if gzip else MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+async def news_events(subscriber):
+    """把 hub 推送的新闻转换成 SSE 事件流，空闲时定期发送注释行保持连接"""
+    try:
+        # 断线后客户端等待 5 秒重连
+        yield "retry: 5000\n\n"
+        while not subscriber.dropped:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            yield f"event: news\ndata: {message}\n\n"
+    finally:
+        hub.unsubscribe(subscriber)
+
+@app.get("/news/stream")
+async def news_stream():
+    """通过 Server-Sent Events 推送新入库的新闻，每条事件的 data 为新闻列表（JSON）"""
+    return StreamingResponse(
+        news_events(hub.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/news/search")
+async def search(request: Request, q: str, limit: int = Query(10, ge=1, le=100), skip: int = Query(0, ge=0),
+                 source: Optional[str] = None, fields: Optional[str] = None, db: Session = Depends(get_read_db)):
+    """全文检索新闻标题和摘要，按相关度排序，fields 的用法同 /news"""
+    selected = list_fields(fields)
+
+    def build():
+        news = search_news(db, q, limit=limit, skip=skip, source=source)
+        return project([item.to_dict() for item in news], selected), {}
+
+    return await cached_json_response(request, build)
 
 @app.get("/news/{news_id}")
-async def get_news_item(news_id: int, db: Session = Depends(get_db)):
+async def get_news_item(request: Request, news_id: int, db: Session = Depends(get_read_db)):
     """获取单条新闻"""
-    news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
-    if news_item is None:
-        raise HTTPException(status_code=404, detail="News item not found")
-    return news_item.to_dict()
+    def build():
+        news_item = db.query(NewsItem).filter(NewsItem.id == news_id).first()
+        if news_item is None:
+            raise HTTPException(status_code=404, detail="News item not found")
+        # 正文只在详情中返回，列表接口不带
+        return dict(news_item.to_dict(), content=news_item.content,
+                    enrichment_status=news_item.enrichment_status), {}
+
+    return await cached_json_response(request, build)
+
+@app.get("/archive")
+async def get_archive(request: Request, month: str = Query(..., pattern=r"^\d{4}-\d{2}$"), source: Optional[str] = None,
+                      limit: int = Query(20, ge=1, le=100), skip: int = Query(0, ge=0), fields: Optional[str] = None):
+    """查询已移出热表的归档新闻，month 为发布月份（YYYY-MM），fields 的用法同 /news"""
+    selected = list_fields(fields)
+
+    from archive import ArchiveError, read_archive
+
+    def build():
+        try:
+            return project(read_archive(month, source=source, limit=limit, skip=skip), selected), {}
+        except ArchiveError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    return await cached_json_response(request, build)
+
+@app.get("/stats/hourly")
+async def stats_hourly(request: Request, hours: int = Query(24, ge=1, le=24 * 90), source: Optional[str] = None):
+    """最近 hours 小时内每小时各来源新入库的新闻条数，读取增量维护的计数表，归档不影响统计"""
+    from rollups import hourly_counts
+
+    def build():
+        since = datetime.utcnow() - timedelta(hours=hours)
+        return hourly_counts(since, source=source), {}
+
+    return await cached_json_response(request, build)
+
+@app.get("/images/{news_id}")
+async def get_image(request: Request, news_id: int, w: int = Query(320, ge=1, le=4096),
+                    format: Optional[str] = Query(None, pattern="^(webp|jpeg)$")):
+    """新闻图片的缩略图：原图只下载一次并按内容哈希缓存在本地，缩略图为 WebP（浏览器支持时）或 JPEG
+
+    w 向上取到 IMAGE_WIDTHS 中的宽度；响应可被浏览器和 CDN 长期缓存。
+    """
+    from images import (FORMATS, IMAGE_ACCEL_REDIRECT, ImageError, image_store, load_image_source, pick_width,
+                        resolve_image_url, save_image_hash)
+
+    fmt = format or ("webp" if "image/webp" in request.headers.get("accept", "") else "jpeg")
+    width = pick_width(w)
+    source = await run_in_threadpool(load_image_source, news_id)
+    # data: 等无法代理的地址、内网地址和不允许的域名与没有图片一样返回 404
+    image_url = resolve_image_url(source.image_url, source.url) if source is not None else None
+    if image_url is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    if source.image_hash and etag_matches(request.headers.get("if-none-match"),
+                                          f'"{source.image_hash[:16]}-{width}-{fmt}"'):
+        return Response(status_code=304, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+    try:
+        digest = source.image_hash
+        path = await run_in_threadpool(image_store.thumbnail, digest, width, fmt) if digest else None
+        if path is None:
+            # 首次请求，或者缓存的文件已被淘汰
+            digest = await image_store.fetch_original(image_url, referer=source.url)
+            if digest != source.image_hash:
+                await run_in_threadpool(save_image_hash, news_id, digest)
+            path = await run_in_threadpool(image_store.thumbnail, digest, width, fmt)
+            if path is None:
+                raise ImageError("原图在生成缩略图之前被淘汰")
+    except ImageError as e:
+        logger.warning(f"获取新闻 {news_id} 的图片失败: {e}")
+        raise HTTPException(status_code=502, detail="Image unavailable")
+
+    media_type = FORMATS[fmt][1]
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{digest[:16]}-{width}-{fmt}"'}
+    if format is None:
+        headers["Vary"] = "Accept"
+    if IMAGE_ACCEL_REDIRECT:
+        # 由 nginx 直接发送缓存文件（sendfile）
+        headers["X-Accel-Redirect"] = f"{IMAGE_ACCEL_REDIRECT}/{path.relative_to(image_store.root).as_posix()}"
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """查看响应缓存的命中情况"""
+    return response_cache.stats()
+
+@app.get("/stream/stats")
+async def stream_stats():
+    """查看推送连接数和因消费过慢被断开的连接数"""
+    return hub.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的指标"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+@app.post("/admin/profile")
+async def admin_profile(request: Request, seconds: float = Query(10, gt=0, le=300), scrape: bool = False):
+    """采样分析，返回折叠栈格式（可用 flamegraph.pl / speedscope 生成火焰图）
+
+    scrape=true 时分析一次完整的抓取，否则对整个进程采样 seconds 秒。需要请求头 X-Admin-Token。
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if scrape:
+        from scraper import scrape_all_news
+
+        _, folded = await run_in_threadpool(profile_call, scrape_all_news)
+    else:
+        folded = await run_in_threadpool(profile_for, seconds)
+    return PlainTextResponse(folded)
+
+@app.get("/ready")
+async def ready():
+    """就绪检查：启动后的首次抓取入库完成前返回 503"""
+    status_code = 200 if readiness["ready"] else 503
+    return JSONResponse(status_code=status_code, content=jsonable_encoder(readiness))
+
+@app.get("/sources")
+async def list_sources():
+    """查看已注册的新闻源及其抓取状态（当前抓取间隔、下次抓取时间、跳过解析次数、节省的流量等）
+
+    fetch_policy 为超时和重试设置，host 为该来源域名的熔断和请求预算状态（当前进程还没有请求过时为空）。
+    """
+    from scraper import SOURCES
+
+    states = await run_in_threadpool(load_all_source_states)
+    return [
+        {
+            "key": source.key,
+            "name": source.name,
+            "url": source.url,
+            "kind": source.kind,
+            "feed_url": source.feed_url,
+            "interval_bounds": interval_bounds(source),
+            "fetch_policy": asdict(source.fetch_policy),
+            "host": host_guards.status(urlsplit(source.fetch_url).netloc),
+            "state": states.get(source.key, {}),
+        }
+        for source in SOURCES.values()
+    ]
+
+@app.get("/hosts")
+async def list_hosts():
+    """当前进程请求过的所有域名（新闻源、详情页、图片）的熔断和请求预算状态"""
+    return host_guards.stats()
+
+@app.get("/scheduler")
+async def scheduler_status():
+    """查看当前进程的调度模式和 leader 状态，调度器尚未启动时 running 为 false"""
+    if scheduler is None:
+        return {"mode": None, "running": False, "owner": None, "is_leader": False, "jobs": {}}
+    return scheduler.status()
 
 @app.post("/scrape-now")
 async def scrape_now(background_tasks: BackgroundTasks):
     """手动触发所有抓取任务"""
-    background_tasks.add_task(scrape_cbs_news)
-    background_tasks.add_task(scrape_zhitong_news)
+    from scraper import scrape_all_news
+
+    background_tasks.add_task(scrape_all_news)
     return {"message": "All scraping tasks started"}
 
 @app.post("/scrape-cbs")
 async def scrape_cbs(background_tasks: BackgroundTasks):
     """手动触发CBS新闻抓取任务"""
+    from scraper import scrape_cbs_news
+
     background_tasks.add_task(scrape_cbs_news)
     return {"message": "CBS News scraping task started"}
 
 @app.post("/scrape-zhitong")
 async def scrape_zhitong(background_tasks: BackgroundTasks):
     """手动触发智通财经抓取任务"""
+    from scraper import scrape_zhitong_news
+
     background_tasks.add_task(scrape_zhitong_news)
     return {"message": "Zhitong Finance scraping task started"}
 
@@ -102,25 +449,84 @@ async def global_exception_handler(request: Request, exc: Exception):
         content={"message": "Internal server error"},
     )
 
+async def initial_scrape():
+    """启动后在后台并发抓取所有来源一次，完成后标记服务就绪"""
+    from scraper import scrape_sources_async
+
+    readiness["started_at"] = datetime.utcnow()
+    try:
+        results = await scrape_sources_async()
+        readiness["found"] = {key: len(items) for key, items in results.items()}
+    except Exception as e:
+        logger.error(f"启动时抓取出错: {e}", exc_info=True)
+        readiness["error"] = str(e)
+    finally:
+        readiness["finished_at"] = datetime.utcnow()
+        readiness["ready"] = True
+        logger.info("Initial scrape finished, service is ready")
+
+def create_scheduler():
+    """导入抓取和调度模块并启动调度器（包含 leader 选举的数据库操作），在线程池中执行"""
+    from scheduling import ScrapeScheduler
+
+    new_scheduler = ScrapeScheduler()
+    new_scheduler.start()
+    return new_scheduler
+
+async def warm_up():
+    """启动调度器，是 leader 时接着执行首次抓取；放在后台执行，不推迟开始处理请求的时间"""
+    global scheduler
+    try:
+        scheduler = await run_in_threadpool(create_scheduler)
+    except Exception as e:
+        logger.error(f"启动调度器出错: {e}", exc_info=True)
+        readiness["error"] = str(e)
+        readiness["ready"] = True
+        return
+
+    if scheduler.should_run():
+        await initial_scrape()
+    else:
+        # 抓取由其它进程负责，当前进程直接就绪
+        readiness["ready"] = True
+        logger.info("Not the scrape leader, skipping initial scrape")
+
+async def sync_response_cache():
+    """抓取可能在其它进程中写入（其它 web worker 是 leader，或独立的 worker），
+    每 CACHE_SYNC_INTERVAL 秒读取一次数据库中的共享缓存代数，变化时清空本进程的响应缓存"""
+    while True:
+        await asyncio.sleep(CACHE_SYNC_INTERVAL)
+        if await run_in_threadpool(response_cache.sync):
+            logger.debug("Response cache invalidated by another process")
+
 # 启动时运行一次抓取
 @app.on_event("startup")
 async def startup_event():
+    global initial_scrape_task, cache_sync_task
     logger.info("Starting up the application")
-    # 启动时立即抓取一次
-    scrape_cbs_news()
-    scrape_zhitong_news()
-    
-    # 设置定时任务，每小时抓取一次
-    scheduler.add_job(scrape_cbs_news, 'interval', hours=1, id='scrape_cbs')
-    scheduler.add_job(scrape_zhitong_news, 'interval', hours=1, id='scrape_zhitong')
-    scheduler.start()
-    logger.info("Scheduled all scraping jobs every hour")
+    # 先读取共享缓存代数，保存之后其它进程写入过新数据的首页响应不再使用
+    await run_in_threadpool(response_cache.sync)
+    cache_sync_task = asyncio.create_task(sync_response_cache())
+    # 上次保存的首页响应放入缓存，首次请求 /news 不需要查询数据库
+    if PRECOMPUTED_NEWS_PATH and load_precomputed(response_cache, DEFAULT_NEWS_KEY, PRECOMPUTED_NEWS_PATH):
+        logger.info(f"Loaded precomputed /news response from {PRECOMPUTED_NEWS_PATH}")
+    # 绑定事件循环，抓取线程中入库的新闻通过 hub 推送给 SSE 连接
+    await hub.start()
+    # 调度器和首次抓取都放到后台执行，服务启动后立即可以处理请求
+    initial_scrape_task = asyncio.create_task(warm_up())
 
 # 关闭时停止调度器
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down the application")
-    scheduler.shutdown()
+    if cache_sync_task is not None:
+        cache_sync_task.cancel()
+    if scheduler is not None:
+        scheduler.shutdown()
+    await hub.stop()
+    # 图片模块只在请求过 /images 时才会导入
+    if "images" in sys.modules:
+        await sys.modules["images"].image_store.close()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,77 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+
+# 多进程部署（uvicorn --workers）时设置该目录，各进程的指标写入其中，/metrics 汇总后输出
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+# 抓取各阶段耗时：fetch - 下载页面，parse - 解析，persist - 写库
+SCRAPE_STAGE_SECONDS = Histogram(
+    "scrape_stage_duration_seconds", "抓取各阶段耗时", ["source", "stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+SCRAPE_BYTES = Counter("scrape_bytes_downloaded_total", "下载的页面字节数", ["source"])
+# result 取值：found - 解析出的条数，inserted - 新入库，skipped - 已存在或被去重
+SCRAPE_ITEMS = Counter("scrape_items_total", "抓取到的新闻条数", ["source", "result"])
+# result 取值：ok、not_modified（304）、unchanged（内容哈希未变）、error
+SCRAPE_RUNS = Counter("scrape_runs_total", "抓取次数", ["source", "result"])
+# result 取值：done - 已补充，retry - 失败待重试，failed - 超过重试次数
+ENRICH_ITEMS = Counter("enrich_items_total", "补充新闻详情的条数", ["result"])
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时（流式响应只统计到开始返回）", ["method", "route", "status"],
+)
+# stage 取值：build - 查询数据库，serialize - JSON 序列化；只统计响应缓存未命中的请求
+RESPONSE_BUILD_SECONDS = Histogram(
+    "response_build_duration_seconds", "读接口缓存未命中时生成响应的耗时", ["route", "stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds", "从连接池取得数据库连接的等待时间",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+
+@contextmanager
+def observe(histogram, **labels):
+    """统计代码块的耗时"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+
+
+def instrument_pool(engine):
+    """统计连接池的取连接等待时间
+
+    包装连接池的 _do_get：连接池已满时这里会阻塞等待，空闲连接充足时耗时接近零。
+    engine.dispose() 会重建连接池，之后需要重新调用。
+    """
+    pool = engine.pool
+    if getattr(pool, "_metrics_instrumented", False):
+        return
+    original = pool._do_get
+
+    def _do_get():
+        start = time.perf_counter()
+        try:
+            return original()
+        finally:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+    pool._do_get = _do_get
+    pool._metrics_instrumented = True
+
+
+def render_metrics():
+    """返回 (Prometheus 文本格式的指标, Content-Type)"""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
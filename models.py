@@ -1,18 +1,70 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, create_engine
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Index, PrimaryKeyConstraint, create_engine, delete, event, insert, inspect, make_url, select, text, update
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateColumn
+import argparse
 import datetime
+import hashlib
+import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # 数据库URL，使用SQLite作为开发环境，生产环境可以替换为PostgreSQL
 # 更改数据库文件名为news_v2.db，避免使用旧数据
 DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./news_v2.db")
+# 只读副本的URL，设置后读接口从副本读取，抓取写入仍使用 DATABASE_URL；为空时读写使用同一个库
+READ_DATABASE_URL = os.environ.get("READ_DATABASE_URL") or None
+
+# 引擎配置：auto - 按数据库URL选择 sqlite 或 postgresql；default - 使用 SQLAlchemy 的默认参数
+DB_PROFILE = os.environ.get("DB_PROFILE", "auto")
+DB_PROFILES = ("auto", "sqlite", "postgresql", "default")
+# sqlite 配置的 PRAGMA
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # 等待写锁的时间（毫秒）
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # 内存映射读取的字节数
+# postgresql 配置的连接池，每个进程一个连接池：workers × (DB_POOL_SIZE + DB_MAX_OVERFLOW) 不应超过数据库的 max_connections
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))  # 连接池已满时等待连接的时间（秒）
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))  # 连接的最长使用时间（秒），避免被服务端或代理断开
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL 模式下读写互不阻塞；synchronous=NORMAL 在 WAL 下只在检查点时 fsync，断电最多丢失最近的事务"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
+
+def create_db_engine(url, profile=DB_PROFILE):
+    """按引擎配置创建引擎"""
+    if profile not in DB_PROFILES:
+        raise ValueError(f"未知的引擎配置: {profile}")
+    backend = make_url(url).get_backend_name()
+    if profile == "auto":
+        profile = backend if backend in ("sqlite", "postgresql") else "default"
+    if profile == "sqlite":
+        db_engine = create_engine(url)
+        event.listen(db_engine, "connect", _sqlite_pragmas)
+        return db_engine
+    if profile == "postgresql":
+        return create_engine(url, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT,
+                             pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+    return create_engine(url)
+
 
 # 创建SQLAlchemy引擎
-engine = create_engine(DATABASE_URL)
+engine = create_db_engine(DATABASE_URL)
+read_engine = create_db_engine(READ_DATABASE_URL) if READ_DATABASE_URL else engine
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 # 创建基类
 Base = declarative_base()
@@ -26,9 +78,29 @@ class NewsItem(Base):
     summary = Column(Text)
     url = Column(String(255), unique=True, index=True)
     image_url = Column(String(255), nullable=True)
+    image_hash = Column(String(64), nullable=True)  # 图片缓存中原图的 sha256，见 images.py
     source = Column(String(50), nullable=True)  # 添加来源字段
+    simhash = Column(BigInteger, nullable=True)  # 标题+摘要的 SimHash 指纹，用于近似去重
+    cluster_id = Column(Integer, nullable=True)  # 近似重复新闻所属簇的代表新闻id，为空表示自身即代表
     published_at = Column(DateTime, default=datetime.datetime.utcnow)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # 详情页补充的信息，见 enrichment.py
+    author = Column(String(255), nullable=True)
+    content = Column(Text, nullable=True)  # 正文
+    # pending / done / failed，为空表示不需要补充；补列时已有的新闻按 server_default 标记为 pending
+    enrichment_status = Column(String(16), nullable=True, default="pending", server_default="pending")
+    enriched_at = Column(DateTime, nullable=True)
+    enrich_attempts = Column(Integer, nullable=True, default=0)
+
+    __table_args__ = (
+        # 游标分页按 (published_at, id) 倒序扫描，按来源筛选时使用带 source 前缀的索引
+        Index("ix_news_items_published_at_id", "published_at", "id"),
+        Index("ix_news_items_source_published_at_id", "source", "published_at", "id"),
+        # collapse=true 时按 cluster_id IS NULL 筛选后按 (published_at, id) 倒序扫描，不需要额外排序
+        Index("ix_news_items_cluster_id_published_at_id", "cluster_id", "published_at", "id"),
+        # 补充详情时按状态取待处理的新闻
+        Index("ix_news_items_enrichment_status_id", "enrichment_status", "id"),
+    )
 
     def __repr__(self):
         return f"<NewsItem(id={self.id}, title='{self.title}')>"
@@ -41,14 +113,254 @@ class NewsItem(Base):
             "url": self.url,
             "image_url": self.image_url,
             "source": self.source,
+            "story_id": self.cluster_id or self.id,
+            "author": self.author,
             "published_at": self.published_at.isoformat() if self.published_at else None,
             "created_at": self.created_at.isoformat()
         }
 
+# 调度器锁：多个进程中只有持有该锁的进程（leader）执行抓取任务
+class SchedulerLock(Base):
+    __tablename__ = "scheduler_locks"
+
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(255), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<SchedulerLock(name='{self.name}', owner='{self.owner}')>"
+
+# 新闻源的抓取状态：用于条件请求（ETag / Last-Modified）和内容哈希比对，并累计节省的流量和解析次数
+class SourceState(Base):
+    __tablename__ = "source_states"
+
+    source = Column(String(50), primary_key=True)
+    etag = Column(String(255), nullable=True)
+    last_modified = Column(String(64), nullable=True)
+    content_hash = Column(String(64), nullable=True)
+    content_length = Column(Integer, default=0)
+    fetch_count = Column(Integer, default=0)
+    not_modified_count = Column(Integer, default=0)  # 服务器返回 304 的次数
+    unchanged_count = Column(Integer, default=0)  # 返回 200 但内容哈希未变的次数
+    bytes_downloaded = Column(BigInteger, default=0)
+    bytes_saved = Column(BigInteger, default=0)
+    # 自适应抓取间隔
+    interval_seconds = Column(Integer, nullable=True)  # 当前的基础抓取间隔
+    next_run_at = Column(DateTime, nullable=True)
+    last_new_items = Column(Integer, nullable=True)  # 最近一次抓取新增的条数
+    consecutive_errors = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    seen_ids = Column(Text, nullable=True)  # feed 类型的来源最近读到的条目 guid（JSON 列表）
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "source": self.source,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "content_hash": self.content_hash,
+            "content_length": self.content_length or 0,
+            "fetch_count": self.fetch_count or 0,
+            "not_modified_count": self.not_modified_count or 0,
+            "unchanged_count": self.unchanged_count or 0,
+            "parses_skipped": (self.not_modified_count or 0) + (self.unchanged_count or 0),
+            "bytes_downloaded": self.bytes_downloaded or 0,
+            "bytes_saved": self.bytes_saved or 0,
+            "interval_seconds": self.interval_seconds,
+            "next_run_at": self.next_run_at.isoformat() if self.next_run_at else None,
+            "last_new_items": self.last_new_items,
+            "consecutive_errors": self.consecutive_errors or 0,
+            "last_error": self.last_error,
+            "seen_ids": json.loads(self.seen_ids) if self.seen_ids else [],
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+# 抓取到的原始页面的索引，页面内容按哈希压缩保存在快照目录中，见 snapshots.py
+class PageSnapshot(Base):
+    __tablename__ = "page_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    source = Column(String(50), nullable=False)  # 新闻源 key
+    kind = Column(String(16), nullable=False)  # 抓取时的新闻源类型：html / feed / sitemap
+    url = Column(String(255), nullable=False)
+    fetched_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+    content_hash = Column(String(64), nullable=False)  # 原始响应体的 sha256
+    encoding = Column(String(32), nullable=True)
+    size = Column(Integer, default=0)  # 压缩前的字节数
+
+    __table_args__ = (
+        Index("ix_page_snapshots_source_fetched_at", "source", "fetched_at"),
+        Index("ix_page_snapshots_content_hash", "content_hash"),
+    )
+
+# 每小时各来源新入库的新闻条数（按 created_at），入库时增量累加，归档后仍然保留，见 rollups.py
+class NewsHourlyCount(Base):
+    __tablename__ = "news_hourly_counts"
+
+    hour = Column(DateTime, nullable=False)
+    source = Column(String(50), nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint("hour", "source"),
+    )
+
+# 已应用的表结构指纹，启动时与模型的指纹比较，一致时跳过建表和补列检查，见 init_db
+class SchemaState(Base):
+    __tablename__ = "schema_state"
+
+    name = Column(String(50), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+# 已归档新闻的URL：归档后新闻不在 news_items 的唯一索引中，抓取和重新解析时据此跳过，不会作为新新闻再次入库
+class ArchivedUrl(Base):
+    __tablename__ = "archived_urls"
+
+    url = Column(String(255), primary_key=True)
+    news_id = Column(Integer, nullable=True)  # 归档前的新闻id
+    archived_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+# 读接口响应缓存的数据代数：写入新数据的进程加一，各 web 进程定期读取，变化时清空自己的缓存，见 cache.py
+class CacheGeneration(Base):
+    __tablename__ = "cache_generations"
+
+    name = Column(String(50), primary_key=True)
+    generation = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
+
 # 数据库依赖项
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# 只读接口使用的会话：设置了 READ_DATABASE_URL 时连接只读副本（可能略有复制延迟），否则与 get_db 相同
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def schema_fingerprint():
+    """模型中所有表、列（名称、类型、是否可空、服务端默认值）和索引的哈希，模型变化时指纹随之变化"""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(f"table {table.name}")
+        for column in table.columns:
+            server_default = column.server_default.arg if column.server_default is not None else None
+            parts.append(f"column {column.name} {column.type} {column.nullable} {server_default}")
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            parts.append(f"index {index.name} {','.join(column.name for column in index.columns)} {index.unique}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def _applied_fingerprint():
+    """读取上次迁移记录的指纹，表不存在（新库或旧版本的库）时返回 None"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(SchemaState.fingerprint).where(SchemaState.name == "models")
+            ).scalar_one_or_none()
+    except DBAPIError:
+        return None
+
+
+# 初始化数据库：表结构指纹与模型一致时只执行一次查询，否则执行迁移并记录新的指纹
+def init_db(force=False):
+    """返回是否执行了迁移；force=True 时总是执行（例如手动删除过索引之后）"""
+    fingerprint = schema_fingerprint()
+    if not force and _applied_fingerprint() == fingerprint:
+        return False
+    migrate()
+    with engine.begin() as conn:
+        conn.execute(delete(SchemaState.__table__).where(SchemaState.name == "models"))
+        conn.execute(insert(SchemaState.__table__).values(
+            name="models", fingerprint=fingerprint, applied_at=datetime.datetime.utcnow()))
+    return True
+
+# 已被其它索引取代的旧索引，迁移时删除
+OBSOLETE_INDEXES = (
+    "ix_news_items_cluster_id",  # 由 ix_news_items_cluster_id_published_at_id 取代
+)
+
+# 迁移：建表，并为已存在的表补建新增的列和索引，删除已取代的旧索引
+# 多个 uvicorn worker 启动时会同时迁移，每一步都容忍其它进程已经完成了同样的修改；
+# 也可以在部署时先执行 python models.py --migrate，之后启动的进程指纹一致，不再迁移
+def migrate():
+    # create_all 逐个检查表是否存在，另一个进程同时建表时会失败，重试时跳过已经建好的表
+    _applied_elsewhere(lambda: Base.metadata.create_all(bind=engine), lambda: False, "建表")
+    _add_missing_columns()
+    _backfill_enrichment_status()
+    with engine.begin() as conn:
+        for name in OBSOLETE_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            _applied_elsewhere(lambda: index.create(bind=engine, checkfirst=True),
+                               lambda: index.name in {item["name"] for item in inspect(engine).get_indexes(table.name)},
+                               f"创建索引 {index.name}")
+
+
+def _applied_elsewhere(apply, applied, description, attempts=3):
+    """执行一步迁移；失败时如果 applied() 表明其它进程已经完成了这一步则忽略，否则重试，最后一次仍失败时抛出异常"""
+    for attempt in range(attempts):
+        try:
+            apply()
+            return
+        except DBAPIError as e:
+            if applied():
+                logger.info(f"{description}已由其它进程完成: {e.orig}")
+                return
+            if attempt == attempts - 1:
+                raise
+            logger.info(f"{description}失败，可能有其它进程同时迁移，重试: {e.orig}")
+
+# 为已存在的表补充模型中新增的列（新增列都允许为空，有 server_default 的列按默认值填充已有的行）
+def _add_missing_columns():
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = CreateColumn(column).compile(dialect=engine.dialect)
+
+            def add_column():
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+
+            _applied_elsewhere(add_column,
+                               lambda: column.name in {item["name"] for item in inspect(engine).get_columns(table.name)},
+                               f"补充列 {table.name}.{column.name}")
+
+# 之前的迁移补充 enrichment_status 时没有默认值，旧新闻的状态和尝试次数都为空、不会被处理，这里标记为 pending；
+# 入库的新闻尝试次数至少为 0，不会被误标
+def _backfill_enrichment_status():
+    with engine.begin() as conn:
+        count = conn.execute(
+            update(NewsItem.__table__)
+            .where(NewsItem.enrichment_status.is_(None), NewsItem.enrich_attempts.is_(None))
+            .values(enrichment_status="pending", enrich_attempts=0)
+        ).rowcount
+    if count:
+        logger.info(f"已将 {count} 条旧新闻标记为待补充详情")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    parser.add_argument("--migrate", action="store_true", help="检查表结构，与模型不一致时执行迁移")
+    parser.add_argument("--force", action="store_true", help="不比较指纹，总是执行迁移")
+    args = parser.parse_args()
+    if not (args.migrate or args.force):
+        parser.print_help()
+        return
+    migrated = init_db(force=args.force)
+    print(f"已执行迁移，表结构指纹 {schema_fingerprint()[:12]}" if migrated else "表结构与模型一致，无需迁移")
+
+
+if __name__ == "__main__":
+    main()
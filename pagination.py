@@ -0,0 +1,18 @@
+import base64
+import datetime
+
+
+def encode_cursor(item):
+    """把一条新闻的 (published_at, id) 编码成不透明的分页游标"""
+    raw = f"{item.published_at.isoformat()}|{item.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """解析分页游标，返回 (published_at, id)，格式错误时抛出 ValueError"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        published_at, news_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(published_at), int(news_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
@@ -0,0 +1,42 @@
+import os
+import random
+
+# 自适应抓取间隔的参数（秒），可通过环境变量覆盖，单个新闻源也可以在 SOURCES 中单独设置上下限
+POLL_MIN_SECONDS = int(os.environ.get("POLL_MIN_SECONDS", "300"))
+POLL_MAX_SECONDS = int(os.environ.get("POLL_MAX_SECONDS", "7200"))
+POLL_TARGET_NEW_ITEMS = float(os.environ.get("POLL_TARGET_NEW_ITEMS", "3"))  # 期望每次抓取平均新增的条数
+POLL_IDLE_GROWTH = float(os.environ.get("POLL_IDLE_GROWTH", "1.5"))  # 没有新内容时间隔的增长倍数
+POLL_JITTER = float(os.environ.get("POLL_JITTER", "0.1"))  # 随机抖动比例，避免多个来源同时抓取
+
+
+def interval_bounds(source):
+    """返回新闻源的 (最小间隔, 最大间隔)"""
+    min_seconds = source.min_interval or POLL_MIN_SECONDS
+    max_seconds = max(source.max_interval or POLL_MAX_SECONDS, min_seconds)
+    return min_seconds, max_seconds
+
+
+def next_interval(current, new_items, min_seconds, max_seconds):
+    """根据最近一次抓取的新增条数计算下一次的基础抓取间隔
+
+    有新内容时，按新增速率估算出每次抓取约新增 POLL_TARGET_NEW_ITEMS 条所需的间隔，
+    并与当前间隔取平均以平滑波动；没有新内容时按 POLL_IDLE_GROWTH 倍放慢。
+    """
+    if new_items > 0:
+        ideal = current * POLL_TARGET_NEW_ITEMS / new_items
+        interval = (current + ideal) / 2
+    else:
+        interval = current * POLL_IDLE_GROWTH
+    return int(min(max(interval, min_seconds), max_seconds))
+
+
+def backoff_delay(interval, consecutive_errors, max_seconds):
+    """连续出错时按指数退避推迟下一次抓取，最长不超过最大间隔"""
+    if consecutive_errors <= 0:
+        return interval
+    return int(min(interval * 2 ** consecutive_errors, max_seconds))
+
+
+def with_jitter(seconds, jitter=POLL_JITTER):
+    """给抓取延迟加上随机抖动"""
+    return max(1, int(seconds * random.uniform(1 - jitter, 1 + jitter)))
@@ -0,0 +1,76 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+# 采样间隔（秒）
+PROFILE_INTERVAL = 0.005
+
+
+class SamplingProfiler:
+    """定时采样所有线程调用栈的分析器，开销与采样间隔有关，与被分析的代码无关
+
+    结果为折叠栈格式（每行「线程;函数;函数... 次数」），可直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+    用法：
+
+        with SamplingProfiler() as profiler:
+            scrape_all_news()
+        print(profiler.folded())
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """返回折叠栈格式的采样结果"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def profile_call(func, *args, interval=PROFILE_INTERVAL):
+    """在采样分析下执行 func，返回 (func 的返回值, 折叠栈)"""
+    with SamplingProfiler(interval) as profiler:
+        result = func(*args)
+    return result, profiler.folded()
+
+
+def profile_for(seconds, interval=PROFILE_INTERVAL):
+    """对整个进程采样指定的秒数，返回折叠栈"""
+    with SamplingProfiler(interval) as profiler:
+        time.sleep(seconds)
+    return profiler.folded()
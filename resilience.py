@@ -0,0 +1,226 @@
+"""按域名的抓取保护：重试退避、Retry-After、熔断和请求预算
+
+每个域名一个熔断器和一个令牌桶，状态保存在进程内，多个 Fetcher（每轮抓取、补充详情、图片代理）共享。
+熔断器在连续失败 BREAKER_FAILURE_THRESHOLD 次后打开，BREAKER_RESET_SECONDS 秒内对该域名的请求直接失败，
+之后放行一个试探请求，成功则关闭、失败则重新打开。令牌桶限制对同一域名的请求速率，超出时等待而不是失败。
+"""
+import datetime
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass, replace
+from email.utils import parsedate_to_datetime
+
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "2"))  # 请求失败后的重试次数
+FETCH_BACKOFF_BASE = float(os.environ.get("FETCH_BACKOFF_BASE", "1"))  # 第一次重试前最多等待的秒数，之后每次翻倍
+FETCH_BACKOFF_MAX = float(os.environ.get("FETCH_BACKOFF_MAX", "30"))  # 两次重试之间最多等待的秒数
+FETCH_RETRY_AFTER_MAX = float(os.environ.get("FETCH_RETRY_AFTER_MAX", "60"))  # Retry-After 超过该秒数时不再等待重试
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))  # 连续失败多少次后熔断
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "300"))  # 熔断后多久放行试探请求
+HOST_RATE = float(os.environ.get("HOST_RATE", "2"))  # 每个域名每秒补充的请求令牌数，0 表示不限制
+HOST_BURST = float(os.environ.get("HOST_BURST", "10"))  # 每个域名最多积攒的令牌数
+
+# 可以重试的状态码；其它 4xx 说明请求本身有问题，重试没有意义，也不计入熔断
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+@dataclass(frozen=True)
+class FetchPolicy:
+    """一个新闻源的抓取策略，超时为空时使用 Fetcher 的默认值"""
+    timeout: float = None  # 单次请求总超时（秒）
+    connect_timeout: float = None  # 建立连接超时（秒）
+    retries: int = FETCH_RETRIES
+    backoff_base: float = FETCH_BACKOFF_BASE
+    backoff_max: float = FETCH_BACKOFF_MAX
+
+    @classmethod
+    def for_source(cls, key, policy=None):
+        """在 policy 的基础上应用环境变量 <KEY>_FETCH_TIMEOUT / _FETCH_CONNECT_TIMEOUT / _FETCH_RETRIES"""
+        policy = policy or cls()
+        overrides = {}
+        for name, convert in (("timeout", float), ("connect_timeout", float), ("retries", int)):
+            value = os.environ.get(f"{key.upper()}_FETCH_{name.upper()}")
+            if value:
+                overrides[name] = convert(value)
+        return replace(policy, **overrides) if overrides else policy
+
+    def backoff(self, attempt):
+        """第 attempt 次重试（从 0 开始）前等待的秒数，在 [0, 上限] 中随机取值，避免多个请求同时重试"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def parse_retry_after(value, now=None):
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需要等待的秒数，无法解析时返回 None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+class CircuitBreaker:
+    """连续失败时熔断，状态为 closed（正常）、open（熔断中）和 half_open（等待试探请求的结果）"""
+
+    def __init__(self, threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.open_until = 0.0
+        self.probing = False
+        self.rejected = 0  # 熔断期间直接拒绝的请求数
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() >= self.open_until:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """是否放行一次请求；熔断到期后只放行一个试探请求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() >= self.open_until and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            self.last_error = None
+
+    def release(self):
+        """放行的请求没有发出（例如被取消）时调用，不影响熔断状态"""
+        with self._lock:
+            self.probing = False
+
+    def record_failure(self, error, hold_seconds=None):
+        """记录一次失败；hold_seconds 为服务器要求的等待时间（Retry-After），超过熔断时长时按它熔断"""
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            trip = self.probing or self.failures >= self.threshold
+            if not (trip or hold_seconds):
+                return
+            now = time.monotonic()
+            self.opened_at = self.opened_at or now
+            self.open_until = now + max(self.reset_seconds if trip else 0, hold_seconds or 0)
+            self.probing = False
+
+    def to_dict(self):
+        with self._lock:
+            retry_in = max(0.0, self.open_until - time.monotonic()) if self.opened_at is not None else 0.0
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "retry_in_seconds": round(retry_in, 1),
+                "rejected": self.rejected,
+                "last_error": self.last_error,
+            }
+
+
+class TokenBucket:
+    """请求预算：每秒补充 rate 个令牌，最多积攒 capacity 个，每个请求消耗一个
+
+    reserve() 在锁内预订令牌并返回需要等待的秒数，调用方在锁外等待，不同事件循环和线程中的请求可以共用。
+    """
+
+    def __init__(self, rate=HOST_RATE, capacity=HOST_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.granted = 0
+        self.delayed = 0  # 需要等待令牌的请求数
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self):
+        with self._lock:
+            self.granted += 1
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if wait:
+                self.delayed += 1
+                self.waited_seconds += wait
+            return wait
+
+    def to_dict(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "available": round(max(self.tokens, 0.0), 2),
+                "granted": self.granted,
+                "delayed": self.delayed,
+                "waited_seconds": round(self.waited_seconds, 1),
+            }
+
+
+@dataclass
+class HostGuard:
+    """一个域名的熔断器和请求预算"""
+    breaker: CircuitBreaker
+    bucket: TokenBucket
+
+
+class HostGuards:
+    """按域名（含端口）保存 HostGuard，首次请求某个域名时创建"""
+
+    def __init__(self):
+        self._guards = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            guard = self._guards.get(host)
+            if guard is None:
+                guard = self._guards[host] = HostGuard(CircuitBreaker(), TokenBucket())
+            return guard
+
+    def status(self, host):
+        """某个域名的熔断和预算状态，还没有请求过时返回 None"""
+        with self._lock:
+            guard = self._guards.get(host)
+        if guard is None:
+            return None
+        return {"host": host, "breaker": guard.breaker.to_dict(), "budget": guard.bucket.to_dict()}
+
+    def stats(self):
+        with self._lock:
+            hosts = sorted(self._guards)
+        return [self.status(host) for host in hosts]
+
+    def reset(self):
+        with self._lock:
+            self._guards.clear()
+
+
+# 进程内共享的域名状态
+host_guards = HostGuards()
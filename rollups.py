@@ -0,0 +1,89 @@
+import logging
+from collections import Counter
+
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import NewsHourlyCount, NewsItem, engine, get_db, get_read_db
+
+logger = logging.getLogger(__name__)
+
+
+def _hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def record_hourly_counts(db, rows):
+    """把新插入的新闻累加到每小时各来源的计数中，在调用方的事务中执行
+
+    rows 中每一项需要包含 created_at 和 source。
+    """
+    counts = Counter((_hour(row["created_at"]), row.get("source") or "") for row in rows if row.get("created_at"))
+    if not counts:
+        return
+    params = [{"hour": hour, "source": source, "count": count} for (hour, source), count in counts.items()]
+    table = NewsHourlyCount.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=["hour", "source"],
+                                          set_={"count": table.c.count + stmt.excluded["count"]})
+        db.execute(stmt, params)
+        return
+    for param in params:
+        updated = db.execute(
+            update(table).where(table.c.hour == param["hour"], table.c.source == param["source"])
+            .values(count=table.c.count + param["count"])
+        ).rowcount
+        if not updated:
+            db.execute(insert(table), [param])
+
+
+def hourly_counts(since, until=None, source=None):
+    """返回 [since, until) 内每小时各来源的新闻条数，按小时排序"""
+    statement = select(NewsHourlyCount.hour, NewsHourlyCount.source, NewsHourlyCount.count).where(
+        NewsHourlyCount.hour >= _hour(since)).order_by(NewsHourlyCount.hour, NewsHourlyCount.source)
+    if until is not None:
+        statement = statement.where(NewsHourlyCount.hour < until)
+    if source:
+        statement = statement.where(NewsHourlyCount.source == source)
+    db = next(get_read_db())
+    try:
+        return [
+            {"hour": hour.isoformat(), "source": source, "count": count}
+            for hour, source, count in db.execute(statement)
+        ]
+    finally:
+        db.close()
+
+
+def rebuild_hourly_counts(batch_size=10000):
+    """按 news_items 补算计数，用于该功能上线前已入库的新闻，返回补充的 (小时, 来源) 数
+
+    只补充还没有计数的 (小时, 来源)，已有的计数不变，其中可能包含已经归档、不在热表中的新闻。
+    """
+    counts = Counter()
+    statement = select(NewsItem.created_at, NewsItem.source).where(NewsItem.created_at.is_not(None))
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        for created_at, source in result:
+            counts[(_hour(created_at), source or "")] += 1
+
+    db = next(get_db())
+    try:
+        existing = set(db.execute(select(NewsHourlyCount.hour, NewsHourlyCount.source)).tuples())
+        missing = [
+            {"hour": hour, "source": source, "count": count}
+            for (hour, source), count in counts.items() if (hour, source) not in existing
+        ]
+        if missing:
+            db.execute(insert(NewsHourlyCount), missing)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    logger.info(f"补充了 {len(missing)} 个 (小时, 来源) 的新闻计数")
+    return len(missing)
@@ -1,5 +1,13 @@
-from scraper import scrape_cbs_news
+import argparse
+import asyncio
 import logging
+import sys
+
+from models import init_db
+from enrichment import enrich_pending, mark_pending
+from scraper import SOURCES, scrape_sources
+from scheduling import ScrapeScheduler
+from source_state import load_source_state
 
 # 配置日志
 logging.basicConfig(
@@ -8,18 +16,83 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-print('开始抓取新闻...')
-try:
-    result = scrape_cbs_news()
-    print(f'抓取完成，获取到 {len(result) if result else 0} 条新闻')
-    
-    if result:
-        print('\n抓取到的新闻标题:')
-        for i, item in enumerate(result, 1):
-            print(f"{i}. {item.get('title', '无标题')}")
+
+def run_once(keys):
+    """抓取一次指定的新闻源并打印结果，有来源抓取或保存失败时返回 1"""
+    print('开始抓取新闻...')
+    try:
+        results = scrape_sources(keys)
+    except Exception as e:
+        logger.error(f"抓取过程中出错: {e}", exc_info=True)
+        print(f"抓取过程中出错: {e}")
+        return 1
+
+    status = 0
+    for key, result in results.items():
+        # 抓取或保存失败时 scrape_source 返回空列表，并在来源状态中记录错误
+        state = load_source_state(key)
+        if state.get("consecutive_errors"):
+            print(f'{SOURCES[key].name} 抓取失败: {state.get("last_error")}')
+            status = 1
+            continue
+        print(f'{SOURCES[key].name} 抓取完成，获取到 {len(result) if result else 0} 条新闻')
+
+        if result:
+            print('\n抓取到的新闻标题:')
+            for i, item in enumerate(result, 1):
+                print(f"{i}. {item.get('title', '无标题')}")
+        else:
+            print('没有抓取到任何新闻')
+    return status
+
+
+def run_enrich(backfill):
+    """补充新闻详情，直到没有待处理的新闻；backfill 时先把之前入库的旧新闻标记为待补充"""
+    if backfill:
+        print(f'已将 {mark_pending()} 条旧新闻标记为待补充')
+    total = {"done": 0, "retry": 0, "failed": 0}
+    while True:
+        counts = asyncio.run(enrich_pending())
+        for key, value in counts.items():
+            total[key] += value
+        # 只剩失败待重试的新闻时停止，留给下一轮抓取
+        if not counts["done"]:
+            break
+    print(f'详情补充完成：成功 {total["done"]} 条，待重试 {total["retry"]} 条，放弃 {total["failed"]} 条')
+
+
+def run_worker():
+    """独立的抓取 worker：与 web 进程分开部署，通过 leader 选举保证多个 worker 不会重复抓取"""
+    scheduler = ScrapeScheduler(mode="leader", blocking=True)
+    scheduler.elector.try_acquire()
+    if scheduler.should_run():
+        scrape_sources()
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        logger.info("抓取 worker 退出")
+    finally:
+        scheduler.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="新闻抓取脚本")
+    parser.add_argument("--worker", action="store_true", help="以常驻 worker 模式运行定时抓取")
+    parser.add_argument("--enrich", action="store_true", help="只补充待处理新闻的详情（中断后重新运行会继续）")
+    parser.add_argument("--backfill", action="store_true", help="与 --enrich 一起使用，同时处理补充功能上线前入库的新闻")
+    parser.add_argument("--sources", nargs="+", choices=sorted(SOURCES), default=["cbs"],
+                        help="单次抓取的新闻源，默认只抓取CBS新闻")
+    args = parser.parse_args()
+
+    init_db()
+    if args.worker:
+        run_worker()
+    elif args.enrich:
+        run_enrich(args.backfill)
     else:
-        print('没有抓取到任何新闻')
-        
-except Exception as e:
-    logger.error(f"抓取过程中出错: {e}", exc_info=True)
-    print(f"抓取过程中出错: {e}")
\ No newline at end of file
+        return run_once(args.sources)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
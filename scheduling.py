@@ -0,0 +1,127 @@
+import datetime
+import logging
+import os
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from archive import RETENTION_INTERVAL_SECONDS, run_retention
+from leader import LeaderElector
+from polling import backoff_delay, interval_bounds, next_interval, with_jitter
+from scraper import SOURCES, scrape_sources
+from source_state import load_source_state, update_source_state
+
+logger = logging.getLogger(__name__)
+
+# 调度模式：
+#   leader - 默认，所有进程都启动调度器，但只有选举出的 leader 执行抓取任务
+#   all    - 每个进程都执行抓取任务（单进程部署时与旧行为一致）
+#   off    - 不在当前进程中调度抓取任务，由独立的 worker 进程负责（python run_scraper.py --worker）
+SCHEDULER_MODE = os.environ.get("SCHEDULER_MODE", "leader")
+
+# 新闻源首次调度时的抓取间隔（秒），之后按各来源的新增速率自适应调整，见 polling.py
+SCRAPE_INTERVAL_SECONDS = int(os.environ.get("SCRAPE_INTERVAL_SECONDS", "3600"))
+
+
+class ScrapeScheduler:
+    """定时抓取调度器，在多 worker / 多实例部署下保证每个抓取任务只执行一次
+
+    每个新闻源一个任务，每次抓取后根据新增条数和错误次数重新计算该来源的下一次抓取时间。
+    """
+
+    def __init__(self, mode=SCHEDULER_MODE, blocking=False):
+        if mode not in ("leader", "all", "off"):
+            raise ValueError(f"未知的调度模式: {mode}")
+        self.mode = mode
+        self.elector = LeaderElector() if mode == "leader" else None
+        self.scheduler = BlockingScheduler() if blocking else BackgroundScheduler()
+
+    def should_run(self):
+        """当前进程是否应该执行抓取任务"""
+        if self.mode == "all":
+            return True
+        return self.elector is not None and self.elector.is_leader
+
+    def _initial_interval(self, source):
+        state = load_source_state(source.key)
+        min_seconds, max_seconds = interval_bounds(source)
+        interval = state.get("interval_seconds") or SCRAPE_INTERVAL_SECONDS
+        return min(max(interval, min_seconds), max_seconds)
+
+    def run_source(self, key):
+        """抓取单个新闻源，并按抓取结果重新安排该来源的下一次抓取"""
+        if not self.should_run():
+            logger.debug(f"当前进程不是 leader，跳过抓取任务: {key}")
+            return
+
+        source = SOURCES[key]
+        try:
+            scrape_sources([key])
+        except Exception as e:
+            # 出错时也要按退避重新安排下一次抓取，否则该来源会一直按出错前的间隔抓取
+            logger.error(f"抓取{source.name}时出错: {e}", exc_info=True)
+
+        state = load_source_state(key)
+        min_seconds, max_seconds = interval_bounds(source)
+        current = state.get("interval_seconds") or SCRAPE_INTERVAL_SECONDS
+        errors = state.get("consecutive_errors", 0)
+        if errors:
+            # 出错时保持基础间隔不变，只推迟下一次抓取
+            interval = current
+            delay = backoff_delay(current, errors, max_seconds)
+        else:
+            interval = next_interval(current, state.get("last_new_items") or 0, min_seconds, max_seconds)
+            delay = interval
+        delay = with_jitter(delay)
+
+        next_run_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+        update_source_state(key, interval_seconds=interval, next_run_at=next_run_at)
+        self.scheduler.reschedule_job(f"scrape_{key}", trigger="interval", seconds=delay)
+        logger.info(f"{source.name}下一次抓取在 {delay} 秒后（基础间隔 {interval} 秒，连续错误 {errors} 次）")
+
+    def run_retention(self):
+        """归档超过保留期的新闻并清理过期的页面快照，只在 leader 进程中执行"""
+        if not self.should_run():
+            return
+        try:
+            run_retention()
+        except Exception as e:
+            logger.error(f"归档新闻时出错: {e}")
+
+    def start(self):
+        """启动调度器；BlockingScheduler 会阻塞直到退出"""
+        if self.mode == "off":
+            logger.info("调度模式为 off，当前进程不执行定时抓取")
+            return
+
+        if self.elector is not None:
+            self.elector.try_acquire()
+            # 每隔租约的三分之一续约一次，非 leader 进程也借此定期尝试接手
+            self.scheduler.add_job(self.elector.try_acquire, 'interval',
+                                   seconds=max(1, self.elector.lease_seconds // 3), id='leader_heartbeat')
+
+        for source in SOURCES.values():
+            self.scheduler.add_job(self.run_source, 'interval', seconds=with_jitter(self._initial_interval(source)),
+                                   args=[source.key], id=f"scrape_{source.key}")
+        self.scheduler.add_job(self.run_retention, 'interval', seconds=RETENTION_INTERVAL_SECONDS, id='retention')
+        logger.info(f"调度器已启动，模式: {self.mode}")
+        self.scheduler.start()
+
+    def shutdown(self):
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        if self.elector is not None:
+            self.elector.release()
+
+    def status(self):
+        jobs = {}
+        if self.scheduler.running:
+            for job in self.scheduler.get_jobs():
+                jobs[job.id] = job.next_run_time.isoformat() if job.next_run_time else None
+        return {
+            "mode": self.mode,
+            "running": self.scheduler.running,
+            "owner": self.elector.owner if self.elector else None,
+            "is_leader": self.should_run(),
+            "jobs": jobs,
+        }
@@ -1,11 +1,28 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import json
 import logging
+import os
+from dataclasses import dataclass
 from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
-from models import NewsItem, get_db
+from models import ArchivedUrl, NewsItem, get_db
+from fetcher import Fetcher, content_hash
+from extractors import extract_cbs_news, extract_zhitong_news
+from feeds import FEED_SEEN_LIMIT, parse_feed
+from enrichment import ENRICH_ENABLED, enrich_pending
+from cache import response_cache
+from broadcast import hub
+from metrics import SCRAPE_BYTES, SCRAPE_ITEMS, SCRAPE_RUNS, SCRAPE_STAGE_SECONDS, observe
+from search import ensure_search_index, index_news_rows
+from rollups import record_hourly_counts
+from snapshots import SNAPSHOT_ENABLED, save_snapshot
+from resilience import FetchPolicy
+from dedup import canonicalize_url, cluster_lock, plan_clusters, apply_clusters, remember
+from source_state import load_source_state, update_source_state, record_source_error
 
 # 配置日志
 logging.basicConfig(
@@ -14,223 +31,315 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 新闻源URL
-CBS_NEWS_URL = "https://www.cbsnews.com/world/"
-ZHITONG_NEWS_URL = "https://www.zhitongcaijing.com/content/recommend.html"
+# 新闻源URL，可通过环境变量覆盖（例如指向 benchmarks.stub_server 提供的本地样本）
+CBS_NEWS_URL = os.environ.get("CBS_NEWS_URL", "https://www.cbsnews.com/world/")
+ZHITONG_NEWS_URL = os.environ.get("ZHITONG_NEWS_URL", "https://www.zhitongcaijing.com/content/recommend.html")
+CBS_FEED_URL = os.environ.get("CBS_FEED_URL", "https://www.cbsnews.com/latest/rss/world")
+
+# 新闻源类型：html - 抓取页面并解析；feed / sitemap - 读取 RSS、Atom 或新闻站点地图（见 feeds.py）
+SOURCE_KINDS = ("html", "feed", "sitemap")
+
+def parse_cbs_news(html):
+    """从CBS新闻世界版块页面中解析新闻项，解析后端见 extractors.get_backend"""
+    return extract_cbs_news(html)
+
+def parse_zhitong_news(html):
+    """从智通财经推荐页面中解析新闻项，解析后端见 extractors.get_backend"""
+    return extract_zhitong_news(html)
+
+@dataclass
+class Source:
+    """一个已注册的新闻源"""
+    key: str
+    name: str
+    url: str
+    parser: object
+    min_interval: int = None  # 自适应抓取间隔的下限（秒），为空时使用 polling.POLL_MIN_SECONDS
+    max_interval: int = None  # 自适应抓取间隔的上限（秒），为空时使用 polling.POLL_MAX_SECONDS
+    kind: str = "html"  # 可通过环境变量 <KEY>_SOURCE_KIND 覆盖，例如 CBS_SOURCE_KIND=feed
+    feed_url: str = None  # kind 为 feed / sitemap 时读取的地址
+    fetch_policy: FetchPolicy = None  # 超时和重试，可通过环境变量 <KEY>_FETCH_TIMEOUT 等覆盖，见 resilience.py
+
+    def __post_init__(self):
+        self.fetch_policy = FetchPolicy.for_source(self.key, self.fetch_policy)
+        self.kind = os.environ.get(f"{self.key.upper()}_SOURCE_KIND", self.kind)
+        if self.kind not in SOURCE_KINDS:
+            raise ValueError(f"未知的新闻源类型: {self.kind}")
+        if self.kind != "html" and not self.feed_url:
+            logger.warning(f"{self.name}没有配置 feed 地址，改为抓取页面")
+            self.kind = "html"
+
+    @property
+    def fetch_url(self):
+        """实际抓取的地址"""
+        return self.url if self.kind == "html" else self.feed_url
+
+
+# 已注册的新闻源，新增站点时只需在此登记
+SOURCES = {
+    # CBS 有突发新闻，允许更频繁地抓取
+    "cbs": Source(key="cbs", name="CBS News", url=CBS_NEWS_URL, parser=parse_cbs_news, min_interval=180,
+                  feed_url=CBS_FEED_URL),
+    "zhitong": Source(key="zhitong", name="智通财经", url=ZHITONG_NEWS_URL, parser=parse_zhitong_news),
+}
+
+async def scrape_source(fetcher, source):
+    """抓取并解析单个新闻源，然后保存到数据库
+
+    请求时带上上次记录的 ETag / Last-Modified；服务器返回 304，或者返回 200
+    但页面规范化后的内容哈希与上次相同时，跳过解析和写库，返回空列表。
+    """
+    logger.info(f"开始抓取{source.name}: {source.fetch_url}")
 
-def scrape_cbs_news():
-    """抓取CBS新闻世界版块的新闻"""
-    logger.info(f"开始抓取CBS新闻: {CBS_NEWS_URL}")
-    
     try:
-        # 获取网页内容
-        response = requests.get(CBS_NEWS_URL, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        })
-        response.raise_for_status()
-        
-        # 解析HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 查找新闻项
-        news_items = []
-        articles = soup.select('article')
-        
-        for article in articles:
+        state = await asyncio.to_thread(load_source_state, source.key)
+        headers = {}
+        if state.get("etag"):
+            headers["If-None-Match"] = state["etag"]
+        if state.get("last_modified"):
+            headers["If-Modified-Since"] = state["last_modified"]
+
+        result = await fetcher.fetch(source.fetch_url, headers=headers, policy=source.fetch_policy)
+        SCRAPE_STAGE_SECONDS.labels(source=source.key, stage="fetch").observe(result.elapsed)
+        SCRAPE_BYTES.labels(source=source.key).inc(result.size)
+        if result.not_modified:
+            SCRAPE_RUNS.labels(source=source.key, result="not_modified").inc()
+            logger.info(f"{source.name}页面未更新（304），跳过解析")
+            await asyncio.to_thread(update_source_state, source.key, increments={
+                "fetch_count": 1, "not_modified_count": 1, "bytes_saved": state.get("content_length", 0),
+            }, last_new_items=0, consecutive_errors=0, last_error=None)
+            return []
+        if not result.ok:
+            logger.error(f"抓取{source.name}失败: {result.error}")
+            SCRAPE_RUNS.labels(source=source.key, result="error").inc()
+            await asyncio.to_thread(record_source_error, source.key, result.error)
+            return []
+
+        validators = {
+            "etag": result.headers.get("ETag"),
+            "last_modified": result.headers.get("Last-Modified"),
+            "content_length": result.size,
+        }
+        body_hash = content_hash(result.text)
+        if body_hash == state.get("content_hash"):
+            logger.info(f"{source.name}页面内容未变化，跳过解析")
+            SCRAPE_RUNS.labels(source=source.key, result="unchanged").inc()
+            await asyncio.to_thread(update_source_state, source.key, increments={
+                "fetch_count": 1, "unchanged_count": 1, "bytes_downloaded": result.size,
+            }, last_new_items=0, consecutive_errors=0, last_error=None, **validators)
+            return []
+
+        if SNAPSHOT_ENABLED:
+            # 保存原始页面，解析规则修改后可以离线重新解析（见 snapshots.py）
             try:
-                # 提取标题
-                title_element = article.select_one('h4')
-                if not title_element:
-                    continue
-                title = title_element.text.strip()
-                
-                # 提取摘要
-                summary_element = article.select_one('p')
-                summary = summary_element.text.strip() if summary_element else ""
-                
-                # 提取链接
-                link_element = article.select_one('a')
-                if not link_element or not link_element.has_attr('href'):
-                    continue
-                    
-                url = link_element['href']
-                if not url.startswith('http'):
-                    url = f"https://www.cbsnews.com{url}"
-                
-                # 提取图片URL
-                img_element = article.select_one('img')
-                image_url = img_element['src'] if img_element and img_element.has_attr('src') else None
-                
-                # 创建新闻项
-                news_item = {
-                    "title": title,
-                    "summary": summary,
-                    "url": url,
-                    "image_url": image_url,
-                    "source": "CBS News",  # 添加来源信息
-                    "published_at": datetime.utcnow()  # 实际应用中应该从文章中提取发布时间
-                }
-                
-                news_items.append(news_item)
+                await asyncio.to_thread(save_snapshot, source.key, source.kind, source.fetch_url, result.body,
+                                        result.encoding)
             except Exception as e:
-                logger.error(f"解析文章时出错: {e}")
-                continue
-        
-        # 保存到数据库
-        save_news_items(news_items)
-        
-        logger.info(f"成功抓取 {len(news_items)} 条新闻")
+                logger.warning(f"保存{source.name}页面快照失败: {e}")
+
+        # 解析和写库都是阻塞操作，放到线程中执行，避免拖慢其它来源的抓取
+        feed_state = {}
+        with observe(SCRAPE_STAGE_SECONDS, source=source.key, stage="parse"):
+            if source.kind == "html":
+                news_items = await asyncio.to_thread(source.parser, result.text)
+            else:
+                # feed 按从新到旧排列，读到上次已见过的条目即停止
+                seen = state.get("seen_ids") or []
+                news_items, guids = await asyncio.to_thread(parse_feed, result.body, source.name, seen)
+                if guids:
+                    feed_state["seen_ids"] = json.dumps((guids + seen)[:FEED_SEEN_LIMIT])
+        try:
+            with observe(SCRAPE_STAGE_SECONDS, source=source.key, stage="persist"):
+                stats = await asyncio.to_thread(save_news_items, news_items)
+        except Exception as e:
+            # 保留上次的 ETag / Last-Modified、内容哈希和 seen_ids，下一次抓取会重新下载并解析该页面；
+            # 记为出错而不是“没有新内容”，抓取间隔按出错退避，不会被放慢
+            logger.error(f"保存{source.name}新闻失败，下次抓取时重试: {e}")
+            SCRAPE_RUNS.labels(source=source.key, result="error").inc()
+            await asyncio.to_thread(record_source_error, source.key, f"保存失败: {e}")
+            return []
+        # 写入已提交，才记录新的校验信息
+        SCRAPE_RUNS.labels(source=source.key, result="ok").inc()
+        SCRAPE_ITEMS.labels(source=source.key, result="found").inc(len(news_items))
+        SCRAPE_ITEMS.labels(source=source.key, result="inserted").inc(stats["inserted"])
+        SCRAPE_ITEMS.labels(source=source.key, result="skipped").inc(stats["skipped"])
+        await asyncio.to_thread(update_source_state, source.key, increments={
+            "fetch_count": 1, "bytes_downloaded": result.size,
+        }, content_hash=body_hash, last_new_items=stats["inserted"], consecutive_errors=0, last_error=None,
+            **validators, **feed_state)
+
+        logger.info(f"成功抓取 {len(news_items)} 条{source.name}新闻，新增 {stats['inserted']} 条，耗时 {result.elapsed:.2f} 秒")
         return news_items
-    
+
     except Exception as e:
-        logger.error(f"抓取新闻时出错: {e}")
+        logger.error(f"抓取{source.name}新闻时出错: {e}")
+        SCRAPE_RUNS.labels(source=source.key, result="error").inc()
+        await asyncio.to_thread(record_source_error, source.key, str(e))
         return []
 
-def scrape_zhitong_news():
-    """抓取智通财经网站的头条新闻"""
-    logger.info(f"开始抓取智通财经新闻: {ZHITONG_NEWS_URL}")
-    
-    try:
-        # 获取网页内容
-        response = requests.get(ZHITONG_NEWS_URL, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        })
-        response.raise_for_status()
-        
-        # 解析HTML
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # 查找新闻项
-        news_items = []
-        
-        # 尝试不同的选择器来匹配智通财经网站的实际结构
-        # 首先尝试直接获取所有文本内容
-        articles = soup.select('div.content-box')
-        if not articles:
-            articles = soup.select('div.recommend-content')
-        if not articles:
-            articles = soup.select('div')
-        
-        # 记录HTML结构以便调试
-        logger.info(f"找到 {len(articles)} 个可能的文章容器")
-        
-        for article in articles:
+async def scrape_sources_async(keys=None):
+    """在同一个抓取周期内并发抓取多个新闻源
+
+    所有来源共享一个连接池，整个周期的耗时取决于最慢的来源，而不是各来源耗时之和。
+    之后为新插入的新闻补充详情（见 enrichment.py）。
+    返回 {来源key: 新闻项列表}。
+    """
+    sources = [SOURCES[key] for key in (keys or SOURCES)]
+    async with Fetcher() as fetcher:
+        results = await asyncio.gather(*(scrape_source(fetcher, source) for source in sources))
+        if ENRICH_ENABLED:
+            # 为新插入（以及上次没处理完）的新闻补充详情，复用同一个连接池
             try:
-                # 尝试多种方式提取标题
-                title_element = article.select_one('p') or article.select_one('div > p') or article.select_one('a')
-                if not title_element:
-                    continue
-                title = title_element.text.strip()
-                
-                # 如果标题太短或为空，则跳过
-                if len(title) < 5:
-                    continue
-                    
-                # 过滤掉下载、备案号和关于相关的标题
-                if '下载' in title or '备案' in title or '关于' in title or 'ICP' in title.upper():
-                    logger.info(f"跳过不需要的标题: {title}")
-                    continue
-                
-                # 提取链接
-                link_element = article.select_one('a')
-                if not link_element or not link_element.has_attr('href'):
-                    continue
-                    
-                url = link_element['href']
-                if not url.startswith('http'):
-                    url = f"https://www.zhitongcaijing.com{url}"
-                
-                # 过滤掉下载链接、备案号和关于页面
-                if 'downloadapp' in url or 'about' in url or 'beian' in url or 'icp' in url:
-                    logger.info(f"跳过不需要的链接: {url}")
-                    continue
-                
-                # 记录找到的URL以便调试
-                logger.info(f"找到文章URL: {url}")
-                
-                # 提取摘要 - 尝试多种选择器
-                summary = ""
-                summary_element = article.select_one('p:not(:first-child)') or article.select_one('div > p:not(:first-child)')
-                if summary_element:
-                    summary = summary_element.text.strip()
-                else:
-                    # 如果找不到摘要，尝试使用标题作为摘要
-                    summary = title
-                
-                # 不提取图片URL，因为图片显示不正常
-                image_url = ""
-                
-                # 创建新闻项
-                news_item = {
-                    "title": title,
-                    "summary": summary,
-                    "url": url,
-                    "image_url": image_url,
-                    "source": "智通财经",  # 添加来源信息
-                    "published_at": datetime.utcnow()  # 实际应用中应该从文章中提取发布时间
-                }
-                
-                news_items.append(news_item)
+                with observe(SCRAPE_STAGE_SECONDS, source="all", stage="enrich"):
+                    await enrich_pending(fetcher)
             except Exception as e:
-                logger.error(f"解析智通财经文章时出错: {e}")
-                continue
-        
-        # 保存到数据库
-        save_news_items(news_items)
-        
-        logger.info(f"成功抓取 {len(news_items)} 条智通财经新闻")
-        return news_items
-    
-    except Exception as e:
-        logger.error(f"抓取智通财经新闻时出错: {e}")
+                # 补充详情出错不影响本轮抓取的结果，待补充的新闻留到下一轮
+                logger.error(f"补充新闻详情时出错: {e}", exc_info=True)
+    return {source.key: items for source, items in zip(sources, results)}
+
+def scrape_sources(keys=None):
+    """scrape_sources_async 的同步入口，供调度器线程、后台任务和脚本调用"""
+    return asyncio.run(scrape_sources_async(keys))
+
+def scrape_all_news():
+    """并发抓取所有已注册的新闻源"""
+    return scrape_sources()
+
+def scrape_cbs_news():
+    """抓取CBS新闻世界版块的新闻"""
+    return scrape_sources(["cbs"])["cbs"]
+
+def scrape_zhitong_news():
+    """抓取智通财经网站的头条新闻"""
+    return scrape_sources(["zhitong"])["zhitong"]
+
+# 每条新闻写入数据库的列
+NEWS_COLUMNS = ("title", "summary", "url", "image_url", "source", "published_at")
+
+# 回退路径中 IN 查询每批的URL数量，避免超出数据库的参数个数限制
+IN_QUERY_CHUNK_SIZE = 500
+
+def _prepare_rows(news_items):
+    """把新闻项整理成统一的列字典，规范化URL并在批次内去重
+
+    新闻项带有 created_at 时（重新解析快照时为抓取时间）保留，否则为当前时间；
+    没有 published_at 时与 created_at 相同。
+    """
+    rows = {}
+    now = datetime.utcnow()
+    for item in news_items:
+        url = canonicalize_url(item.get("url"))
+        if not url or url in rows:
+            continue
+        row = {column: item.get(column) for column in NEWS_COLUMNS}
+        row["url"] = url
+        # 显式写入创建时间，推送给客户端的新闻才能带上完整的字段
+        row["created_at"] = item.get("created_at") or now
+        # 没有发布时间时用创建时间占位，两者相同表示占位值，补充详情时会替换（见 enrichment.py）
+        if row["published_at"] is None:
+            row["published_at"] = row["created_at"]
+        rows[url] = row
+    return list(rows.values())
+
+def insert_news_rows(db, rows):
+    """批量插入新闻行，已存在的URL会被跳过
+
+    SQLite 和 PostgreSQL 使用 INSERT ... ON CONFLICT (url) DO NOTHING RETURNING，
+    其它数据库先用一条 IN 查询找出已存在的URL再批量插入。已归档的URL（见 archive.py）同样跳过。
+    返回实际插入的行（包含 id），不提交事务。
+    """
+    if not rows:
         return []
 
+    urls = [row["url"] for row in rows]
+    archived = set()
+    for start in range(0, len(urls), IN_QUERY_CHUNK_SIZE):
+        chunk = urls[start:start + IN_QUERY_CHUNK_SIZE]
+        archived.update(db.scalars(select(ArchivedUrl.url).where(ArchivedUrl.url.in_(chunk))))
+    if archived:
+        rows = [row for row in rows if row["url"] not in archived]
+        if not rows:
+            return []
+
+    table = NewsItem.__table__
+    dialect = db.get_bind().dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        dialect_insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=["url"]).returning(table.c.id, table.c.url)
+        ids = {url: news_id for news_id, url in db.execute(stmt, rows)}
+    else:
+        urls = [row["url"] for row in rows]
+        existing = set()
+        for start in range(0, len(urls), IN_QUERY_CHUNK_SIZE):
+            chunk = urls[start:start + IN_QUERY_CHUNK_SIZE]
+            existing.update(db.scalars(select(table.c.url).where(table.c.url.in_(chunk))))
+        rows = [row for row in rows if row["url"] not in existing]
+        if not rows:
+            return []
+        db.execute(insert(table), rows)
+        ids = {}
+        new_urls = [row["url"] for row in rows]
+        for start in range(0, len(new_urls), IN_QUERY_CHUNK_SIZE):
+            chunk = new_urls[start:start + IN_QUERY_CHUNK_SIZE]
+            ids.update({url: news_id for news_id, url in db.execute(select(table.c.id, table.c.url).where(table.c.url.in_(chunk)))})
+
+    return [dict(row, id=ids[row["url"]]) for row in rows if row["url"] in ids]
+
 def save_news_items(news_items):
-    """将新闻项保存到数据库"""
+    """将新闻项批量保存到数据库
+
+    整批新闻只需一次插入语句和一次提交，已存在的URL自动跳过。
+    返回 {"inserted": 新插入条数, "skipped": 跳过条数}；写入失败时回滚并重新抛出异常，
+    调用方不会把失败当成“没有新新闻”。
+    """
+    stats = {"inserted": 0, "skipped": 0}
+    if not news_items:
+        logger.info("没有新的新闻需要保存")
+        return stats
+
+    # 全文索引的建表语句需要在写事务开始之前执行
+    ensure_search_index()
     db = next(get_db())
     
     try:
-        saved_count = 0
-        for item in news_items:
-            # 检查是否已存在相同URL的新闻
-            url = item["url"]
-            logger.info(f"处理新闻: {item['title'][:30]}..., URL: {url}")
-            
-            existing_news = db.query(NewsItem).filter(NewsItem.url == url).first()
-            
-            if existing_news:
-                logger.info(f"新闻已存在，跳过: {url}")
-                continue
-                
-            try:
-                news_item = NewsItem(
-                    title=item["title"],
-                    summary=item["summary"],
-                    url=url,
-                    image_url=item["image_url"],
-                    source=item["source"],
-                    published_at=item["published_at"]
-                )
-                
-                db.add(news_item)
-                db.flush()  # 尝试立即写入数据库但不提交事务
-                saved_count += 1
-                logger.info(f"新闻已添加到会话: ID={news_item.id}, 标题={item['title'][:30]}...")
-            except Exception as item_error:
-                logger.error(f"添加单条新闻时出错: {item_error}, 新闻标题: {item['title'][:30]}...")
-                # 继续处理其他新闻，不中断整个过程
-        
-        if saved_count > 0:
+        rows = _prepare_rows(news_items)
+        # 查重到提交之间持有 cluster_lock，并发入库的其它来源要等这一批提交后再查重
+        with cluster_lock:
+            # 与最近的新闻比较指纹，近似重复的新闻归入已有的簇（或直接丢弃，见 dedup.DEDUP_MODE）
+            rows, links = plan_clusters(rows)
+            inserted = insert_news_rows(db, rows)
+            apply_clusters(db, rows, inserted, links)
+            # 新插入的新闻在同一事务中写入全文索引
+            index_news_rows(db, inserted)
+            # 每小时计数在同一事务中累加，统计接口不需要扫描新闻表
+            record_hourly_counts(db, inserted)
             db.commit()
-            logger.info(f"成功保存 {saved_count} 条新闻到数据库")
+            remember(inserted)
+
+        stats["inserted"] = len(inserted)
+        stats["skipped"] = len(news_items) - len(inserted)
+        for row in inserted:
+            logger.debug(f"新闻已保存: ID={row['id']}, 标题={(row['title'] or '')[:30]}...")
+
+        if inserted:
+            # 有新数据写入，让读接口的响应缓存失效
+            response_cache.invalidate()
+            # 提交之后再推送，客户端收到的新闻一定已经能查到
+            hub.publish_items(inserted)
+            logger.info(f"成功保存 {stats['inserted']} 条新闻到数据库，跳过 {stats['skipped']} 条已存在的新闻")
         else:
             logger.info("没有新的新闻需要保存")
             
     except IntegrityError as e:
         logger.error(f"保存新闻时出现完整性错误: {e}")
         db.rollback()
+        raise
     except Exception as e:
         logger.error(f"保存新闻时出错: {e}")
         db.rollback()
+        raise
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+    return stats
@@ -0,0 +1,261 @@
+import argparse
+import datetime
+import logging
+import re
+import threading
+
+from sqlalchemy import delete, insert, literal_column, select, text
+from sqlalchemy.exc import DBAPIError
+
+from models import NewsItem, SchemaState, engine, get_db
+
+logger = logging.getLogger(__name__)
+
+# 标题在排序中的权重（相对于摘要）
+TITLE_WEIGHT = 5.0
+
+# 重建索引时每批处理的新闻条数
+REBUILD_BATCH_SIZE = 1000
+
+# 索引内容的版本，_document 的切分方式变化时加一，启动时发现已有索引的版本不同会自动重建
+# 2：中文等文字除相邻两字外，每个字也单独索引
+SEARCH_INDEX_VERSION = 2
+
+# 中日韩文字连续出现的片段，以及其它文字中的单词
+_TOKEN_PATTERN = re.compile(r"([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+)|([0-9a-z]+)")
+
+_ready = False
+_ready_lock = threading.Lock()
+
+
+def tokenize(value):
+    """把文本切分为检索用的词
+
+    英文和数字按单词切分并转为小写；中文等没有空格分词的文字按相邻两个字切分（bigram），
+    例如「港股大涨」切分为「港股」「股大」「大涨」，无需分词词典就能检索任意连续的两个字以上的词。
+    """
+    tokens = []
+    for cjk, word in _TOKEN_PATTERN.findall((value or "").lower()):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def _document(value):
+    """写入索引的词：tokenize 的结果之外，中文等文字的每个字也单独索引，
+    单字查询才能匹配只出现在两字片段末尾的字（例如「港股大涨」中的「涨」）"""
+    tokens = tokenize(value)
+    for cjk, word in _TOKEN_PATTERN.findall((value or "").lower()):
+        if len(cjk) > 1:
+            tokens.extend(cjk)
+    return " ".join(tokens)
+
+
+def _index_version():
+    """读取已有索引的版本，没有记录时返回 None"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                select(SchemaState.fingerprint).where(SchemaState.name == "search_index")
+            ).scalar_one_or_none()
+    except DBAPIError:
+        return None
+
+
+def _record_index_version(db):
+    db.execute(delete(SchemaState.__table__).where(SchemaState.name == "search_index"))
+    db.execute(insert(SchemaState.__table__).values(
+        name="search_index", fingerprint=str(SEARCH_INDEX_VERSION), applied_at=datetime.datetime.utcnow()))
+
+
+def _dialect():
+    return engine.dialect.name
+
+
+def ensure_search_index():
+    """创建全文索引（已存在时跳过）；首次创建或索引版本与 SEARCH_INDEX_VERSION 不同时，为已有新闻重建索引
+
+    SQLite 使用 FTS5 虚拟表 news_fts，PostgreSQL 使用 tsvector 列加 GIN 索引的 news_search 表。
+    """
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        dialect = _dialect()
+        with engine.begin() as conn:
+            if dialect == "sqlite":
+                exists = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'news_fts'"
+                )).first() is not None
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS news_fts USING fts5(title, summary, tokenize = 'unicode61')"
+                ))
+            elif dialect == "postgresql":
+                exists = conn.execute(text("SELECT to_regclass('news_search') IS NOT NULL")).scalar()
+                conn.execute(text(
+                    "CREATE TABLE IF NOT EXISTS news_search ("
+                    "news_id INTEGER PRIMARY KEY REFERENCES news_items(id) ON DELETE CASCADE, "
+                    "document TSVECTOR NOT NULL)"
+                ))
+                conn.execute(text(
+                    "CREATE INDEX IF NOT EXISTS ix_news_search_document ON news_search USING GIN (document)"
+                ))
+            else:
+                logger.warning(f"数据库 {dialect} 不支持全文索引，搜索将退化为 LIKE 查询")
+                exists = True
+        _ready = True
+
+    if not exists or (dialect in ("sqlite", "postgresql") and _index_version() != str(SEARCH_INDEX_VERSION)):
+        rebuild_search_index()
+
+
+def index_news_rows(db, rows):
+    """为新插入的新闻建立全文索引，在调用方的事务中执行
+
+    rows 中每一项需要包含 id、title 和 summary。
+    """
+    if not rows:
+        return
+    ensure_search_index()
+    params = [
+        {"id": row["id"], "title": _document(row.get("title")), "summary": _document(row.get("summary"))}
+        for row in rows
+    ]
+    dialect = _dialect()
+    if dialect == "sqlite":
+        db.execute(text("INSERT INTO news_fts (rowid, title, summary) VALUES (:id, :title, :summary)"), params)
+    elif dialect == "postgresql":
+        db.execute(text(
+            "INSERT INTO news_search (news_id, document) VALUES (:id, "
+            "setweight(to_tsvector('simple', :title), 'A') || setweight(to_tsvector('simple', :summary), 'B')) "
+            "ON CONFLICT (news_id) DO NOTHING"
+        ), params)
+
+
+def remove_from_index(db, news_ids):
+    """从全文索引中删除新闻，在调用方的事务中执行"""
+    if not news_ids:
+        return
+    ensure_search_index()
+    params = [{"id": news_id} for news_id in news_ids]
+    dialect = _dialect()
+    if dialect == "sqlite":
+        db.execute(text("DELETE FROM news_fts WHERE rowid = :id"), params)
+    elif dialect == "postgresql":
+        db.execute(text("DELETE FROM news_search WHERE news_id = :id"), params)
+
+
+def rebuild_search_index():
+    """清空并按批次重建全文索引"""
+    ensure_search_index()
+    dialect = _dialect()
+    if dialect not in ("sqlite", "postgresql"):
+        return 0
+
+    db = next(get_db())
+    try:
+        db.execute(text("DELETE FROM news_fts" if dialect == "sqlite" else "DELETE FROM news_search"))
+        total = 0
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(NewsItem.id, NewsItem.title, NewsItem.summary)
+                .where(NewsItem.id > last_id)
+                .order_by(NewsItem.id)
+                .limit(REBUILD_BATCH_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            index_news_rows(db, rows)
+            total += len(rows)
+            last_id = rows[-1]["id"]
+        _record_index_version(db)
+        db.commit()
+        logger.info(f"全文索引重建完成，共 {total} 条新闻")
+        return total
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _prefix(token):
+    """单个字母或数字按前缀匹配；单个汉字已经单独索引（见 _document），精确匹配即可"""
+    return len(token) == 1 and token.isascii()
+
+
+def _match_expression(tokens):
+    """把查询词转换成 FTS5 的 MATCH 表达式，所有词都需要出现"""
+    return " ".join(f'"{token}"*' if _prefix(token) else f'"{token}"' for token in tokens)
+
+
+def _tsquery_expression(tokens):
+    """把查询词转换成 PostgreSQL 的 tsquery 表达式"""
+    return " & ".join(f"'{token}':*" if _prefix(token) else f"'{token}'" for token in tokens)
+
+
+def search_news(db, query, limit=10, skip=0, source=None):
+    """全文检索新闻，按相关度排序，返回 NewsItem 列表"""
+    tokens = tokenize(query)
+    if not tokens:
+        return []
+    ensure_search_index()
+
+    dialect = _dialect()
+    if dialect == "sqlite":
+        ranked = select(
+            literal_column("rowid").label("news_id"),
+            literal_column(f"bm25(news_fts, {TITLE_WEIGHT}, 1.0)").label("rank"),
+        ).select_from(text("news_fts")).where(text("news_fts MATCH :match")).subquery()
+        order = ranked.c.rank.asc()  # bm25 越小越相关
+        params = {"match": _match_expression(tokens)}
+    elif dialect == "postgresql":
+        ranked = select(
+            literal_column("news_id").label("news_id"),
+            literal_column("ts_rank_cd(document, to_tsquery('simple', :tsquery))").label("rank"),
+        ).select_from(text("news_search")).where(text("document @@ to_tsquery('simple', :tsquery)")).subquery()
+        order = ranked.c.rank.desc()
+        params = {"tsquery": _tsquery_expression(tokens)}
+    else:
+        statement = db.query(NewsItem)
+        for token in tokens:
+            pattern = f"%{token}%"
+            statement = statement.filter(NewsItem.title.ilike(pattern) | NewsItem.summary.ilike(pattern))
+        if source:
+            statement = statement.filter(NewsItem.source == source)
+        return statement.order_by(NewsItem.published_at.desc()).offset(skip).limit(limit).all()
+
+    statement = select(NewsItem).join(ranked, NewsItem.id == ranked.c.news_id)
+    if source:
+        statement = statement.where(NewsItem.source == source)
+    statement = statement.order_by(order, NewsItem.published_at.desc()).offset(skip).limit(limit)
+    return db.scalars(statement, params).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="全文索引维护")
+    parser.add_argument("--rebuild", action="store_true", help="清空并重建全文索引")
+    parser.add_argument("--query", help="测试检索")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    if args.rebuild:
+        rebuild_search_index()
+    if args.query:
+        db = next(get_db())
+        try:
+            for item in search_news(db, args.query, limit=20):
+                print(f"{item.id}\t{item.source}\t{item.title}")
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import datetime
+import json
+
+from models import NewsItem
+
+try:
+    import orjson
+except ImportError:  # 未安装 orjson 时使用标准库，输出相同
+    orjson = None
+
+# 列表接口可以返回的字段，fields= 参数从中选择，默认返回全部
+NEWS_LIST_FIELDS = ("id", "title", "summary", "url", "image_url", "source", "story_id", "author",
+                    "published_at", "created_at")
+
+# 字段对应的列；story_id 由 cluster_id 和 id 得出
+_FIELD_COLUMNS = {
+    "id": NewsItem.id,
+    "title": NewsItem.title,
+    "summary": NewsItem.summary,
+    "url": NewsItem.url,
+    "image_url": NewsItem.image_url,
+    "source": NewsItem.source,
+    "story_id": NewsItem.cluster_id,
+    "author": NewsItem.author,
+    "published_at": NewsItem.published_at,
+    "created_at": NewsItem.created_at,
+}
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"无法序列化的类型: {type(value).__name__}")
+
+
+def dumps(content):
+    """把响应内容序列化为 UTF-8 编码的紧凑 JSON，datetime 输出为 ISO 格式"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def parse_fields(value):
+    """解析逗号分隔的 fields 参数，为空时返回全部字段，有未知字段时抛出 ValueError"""
+    if not value:
+        return NEWS_LIST_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in _FIELD_COLUMNS]
+    if unknown or not fields:
+        raise ValueError(f"未知的字段: {', '.join(unknown)}")
+    return fields
+
+
+def news_columns(fields):
+    """查询 fields 所需的列；id 和 published_at 总是查询，用于生成分页游标"""
+    columns = [NewsItem.id, NewsItem.published_at]
+    for field in fields:
+        column = _FIELD_COLUMNS[field]
+        # 列对象的 == 会生成 SQL 表达式，这里按对象本身比较
+        if not any(column is existing for existing in columns):
+            columns.append(column)
+    return columns
+
+
+def news_row(row, fields):
+    """把只查询列得到的行转换为响应字典，datetime 留给 dumps 处理"""
+    return {
+        field: (row.cluster_id or row.id) if field == "story_id" else getattr(row, field)
+        for field in fields
+    }
+
+
+def project(items, fields):
+    """从已生成的新闻字典中只保留 fields 中的字段"""
+    if fields == NEWS_LIST_FIELDS:
+        return items
+    return [{field: item[field] for field in fields if field in item} for item in items]
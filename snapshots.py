@@ -0,0 +1,308 @@
+"""原始页面快照：抓取到的页面按内容哈希压缩保存，解析规则修改后可以离线重新解析历史页面
+
+用法:
+    python snapshots.py --reparse                          # 重新解析所有快照
+    python snapshots.py --reparse --source zhitong --since 2024-05-01 --workers 8
+    python snapshots.py --prune                            # 删除超过 SNAPSHOT_RETENTION_DAYS 的快照
+
+重新解析在进程池中执行，结果按URL批量写回：已存在的新闻更新标题、摘要和图片，新出现的新闻直接插入。
+"""
+import argparse
+import datetime
+import gzip
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+
+from models import NewsItem, PageSnapshot, get_db
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_ENABLED = os.environ.get("SNAPSHOT_ENABLED", "true").lower() in ("1", "true", "yes")
+SNAPSHOT_DIR = Path(os.environ.get("SNAPSHOT_DIR", "./snapshots"))  # 快照目录
+SNAPSHOT_RETENTION_DAYS = int(os.environ.get("SNAPSHOT_RETENTION_DAYS", "90"))  # 快照保留天数，0 表示永久保留
+REPARSE_BATCH_SIZE = int(os.environ.get("REPARSE_BATCH_SIZE", "1000"))  # 重新解析时每次写回数据库的条数
+
+try:
+    import zstandard
+except ImportError:  # zstandard 是可选依赖，未安装时使用 gzip
+    zstandard = None
+
+# 新写入的快照使用的压缩格式，读取时按文件扩展名判断，两种格式可以混用
+SNAPSHOT_COMPRESSION = "zst" if zstandard is not None else "gz"
+
+
+def _compress(data, compression):
+    if compression == "zst":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(data, compression):
+    if compression == "zst":
+        if zstandard is None:
+            raise RuntimeError("读取 .zst 快照需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def snapshot_path(digest, compression=SNAPSHOT_COMPRESSION):
+    return SNAPSHOT_DIR / digest[:2] / f"{digest}.{compression}"
+
+
+def _find_snapshot(digest):
+    """返回快照文件路径和压缩格式，文件不存在时返回 (None, None)"""
+    for compression in ("zst", "gz"):
+        path = snapshot_path(digest, compression)
+        if path.exists():
+            return path, compression
+    return None, None
+
+
+def save_snapshot(source, kind, url, body, encoding=None, fetched_at=None):
+    """保存一次抓取到的原始页面并记录索引，返回内容哈希；内容相同的页面只保存一份文件"""
+    digest = hashlib.sha256(body).hexdigest()
+    if _find_snapshot(digest)[0] is None:
+        path = snapshot_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(_compress(body, SNAPSHOT_COMPRESSION))
+        os.replace(tmp, path)
+
+    db = next(get_db())
+    try:
+        db.add(PageSnapshot(source=source, kind=kind, url=url, content_hash=digest, encoding=encoding,
+                            size=len(body), fetched_at=fetched_at or datetime.datetime.utcnow()))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    return digest
+
+
+def load_snapshot(digest):
+    """读取快照的原始内容"""
+    path, compression = _find_snapshot(digest)
+    if path is None:
+        raise FileNotFoundError(f"快照不存在: {digest}")
+    return _decompress(path.read_bytes(), compression)
+
+
+def list_snapshots(source=None, since=None, until=None):
+    """按抓取时间顺序返回快照索引 (source, kind, url, fetched_at, content_hash, encoding)"""
+    statement = select(PageSnapshot.source, PageSnapshot.kind, PageSnapshot.url, PageSnapshot.fetched_at,
+                       PageSnapshot.content_hash, PageSnapshot.encoding).order_by(PageSnapshot.fetched_at, PageSnapshot.id)
+    if source:
+        statement = statement.where(PageSnapshot.source == source)
+    if since is not None:
+        statement = statement.where(PageSnapshot.fetched_at >= since)
+    if until is not None:
+        statement = statement.where(PageSnapshot.fetched_at < until)
+    db = next(get_db())
+    try:
+        return db.execute(statement).all()
+    finally:
+        db.close()
+
+
+def prune_snapshots(days=SNAPSHOT_RETENTION_DAYS):
+    """删除超过保留天数的快照索引，以及不再被任何索引引用的快照文件，返回删除的文件数"""
+    if days <= 0:
+        return 0
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    db = next(get_db())
+    try:
+        expired = set(db.scalars(select(PageSnapshot.content_hash).where(PageSnapshot.fetched_at < cutoff)))
+        if not expired:
+            return 0
+        db.execute(delete(PageSnapshot).where(PageSnapshot.fetched_at < cutoff))
+        # 相同内容的页面可能在保留期内被再次抓取，这类文件需要保留
+        still_used = set(db.scalars(select(PageSnapshot.content_hash).where(PageSnapshot.content_hash.in_(expired))))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    removed = 0
+    for digest in expired - still_used:
+        path, _ = _find_snapshot(digest)
+        if path is not None:
+            path.unlink(missing_ok=True)
+            removed += 1
+    logger.info(f"删除了 {removed} 个超过 {days} 天的页面快照")
+    return removed
+
+
+def _reparse_one(task):
+    """在子进程中解析一个快照，返回新闻项列表"""
+    from feeds import parse_feed
+    from scraper import SOURCES
+
+    key, kind, fetched_at, digest, encoding = task
+    source = SOURCES.get(key)
+    if source is None:
+        return []
+    try:
+        body = load_snapshot(digest)
+        if kind == "html":
+            items = source.parser(body.decode(encoding or "utf-8", errors="replace"))
+        else:
+            items, _ = parse_feed(body, source.name)
+    except Exception as e:
+        logger.error(f"重新解析快照 {digest} 时出错: {e}")
+        return []
+    for item in items:
+        # 页面中没有发布时间时，以抓取时间代替，而不是重新解析的时间
+        item.setdefault("published_at", None)
+        if item["published_at"] is None:
+            item["published_at"] = fetched_at
+        item["created_at"] = fetched_at
+    return items
+
+
+def upsert_news_items(news_items):
+    """按URL批量写回重新解析的结果，返回 {"inserted", "updated"}
+
+    已存在的新闻更新标题、摘要和图片（没有解析到图片时保留原值），发布时间和补充的详情不变；
+    新出现的新闻与抓取时一样经过 _prepare_rows 和近似去重（plan_clusters），以快照的抓取时间作为入库时间插入，
+    已归档的URL不会再次插入。全文索引在同一事务中同步更新。
+    """
+    # 延迟导入，避免 scraper -> snapshots -> scraper 的循环导入
+    from cache import response_cache
+    from dedup import apply_clusters, canonicalize_url, cluster_lock, plan_clusters, remember
+    from rollups import record_hourly_counts
+    from scraper import IN_QUERY_CHUNK_SIZE, _prepare_rows, insert_news_rows
+    from search import ensure_search_index, index_news_rows, remove_from_index
+
+    latest = {}
+    for item in news_items:
+        url = canonicalize_url(item.get("url"))
+        if url:
+            # 同一URL出现在多个快照中时，以最新的快照为准
+            latest[url] = item
+    rows = {row["url"]: row for row in _prepare_rows(latest.values())}
+    stats = {"inserted": 0, "updated": 0}
+    if not rows:
+        return stats
+
+    ensure_search_index()
+    table = NewsItem.__table__
+    db = next(get_db())
+    try:
+        urls = list(rows)
+        existing = {}
+        for start in range(0, len(urls), IN_QUERY_CHUNK_SIZE):
+            chunk = urls[start:start + IN_QUERY_CHUNK_SIZE]
+            existing.update({url: news_id for news_id, url in db.execute(
+                select(table.c.id, table.c.url).where(table.c.url.in_(chunk)))})
+
+        # executemany 的参数中与列同名的键会被加入 SET 子句，参数名需要与列名区分开
+        updates = [
+            {"news_id": news_id, "new_title": rows[url]["title"], "new_summary": rows[url]["summary"],
+             "new_image_url": rows[url]["image_url"]}
+            for url, news_id in existing.items()
+        ]
+        if updates:
+            db.execute(
+                update(table).where(table.c.id == bindparam("news_id")).values(
+                    title=bindparam("new_title"),
+                    summary=bindparam("new_summary"),
+                    image_url=func.coalesce(bindparam("new_image_url"), table.c.image_url),
+                    # 图片换了之后，缓存的原图哈希失效（见 images.py）
+                    image_hash=case((func.coalesce(bindparam("new_image_url"), table.c.image_url) == table.c.image_url,
+                                     table.c.image_hash), else_=None),
+                ),
+                updates,
+            )
+            remove_from_index(db, [row["news_id"] for row in updates])
+            index_news_rows(db, [{"id": row["news_id"], "title": row["new_title"], "summary": row["new_summary"]}
+                                 for row in updates])
+
+        with cluster_lock:
+            new_rows, links = plan_clusters([row for url, row in rows.items() if url not in existing])
+            inserted = insert_news_rows(db, new_rows)
+            apply_clusters(db, new_rows, inserted, links)
+            index_news_rows(db, inserted)
+            record_hourly_counts(db, inserted)
+            db.commit()
+            remember(inserted)
+        stats = {"inserted": len(inserted), "updated": len(updates)}
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    response_cache.invalidate()
+    return stats
+
+
+def reparse_snapshots(source=None, since=None, until=None, workers=None, batch_size=REPARSE_BATCH_SIZE):
+    """用当前的解析规则重新解析快照并写回数据库，返回 {"snapshots", "items", "inserted", "updated"}"""
+    snapshots = list_snapshots(source, since, until)
+    totals = {"snapshots": len(snapshots), "items": 0, "inserted": 0, "updated": 0}
+    if not snapshots:
+        return totals
+
+    # 同一内容的页面只解析一次，保留最后一次抓取的时间
+    tasks = {}
+    for key, kind, url, fetched_at, digest, encoding in snapshots:
+        tasks.pop((key, kind, digest), None)
+        tasks[(key, kind, digest)] = (key, kind, fetched_at, digest, encoding)
+
+    pending = []
+
+    def flush():
+        stats = upsert_news_items(pending)
+        totals["inserted"] += stats["inserted"]
+        totals["updated"] += stats["updated"]
+        pending.clear()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map 保持输入顺序，较新的快照后写入，覆盖较旧快照的解析结果
+        for items in executor.map(_reparse_one, tasks.values(), chunksize=8):
+            totals["items"] += len(items)
+            pending.extend(items)
+            if len(pending) >= batch_size:
+                flush()
+    if pending:
+        flush()
+    logger.info(f"重新解析 {len(tasks)} 个快照，得到 {totals['items']} 条新闻："
+                f"新增 {totals['inserted']} 条，更新 {totals['updated']} 条")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="原始页面快照")
+    parser.add_argument("--reparse", action="store_true", help="用当前的解析规则重新解析快照并写回数据库")
+    parser.add_argument("--prune", action="store_true", help="删除超过 SNAPSHOT_RETENTION_DAYS 天的快照")
+    parser.add_argument("--source", default=None, help="只处理该新闻源（key）的快照")
+    parser.add_argument("--since", type=datetime.datetime.fromisoformat, default=None, help="抓取时间下限（UTC）")
+    parser.add_argument("--until", type=datetime.datetime.fromisoformat, default=None, help="抓取时间上限（UTC）")
+    parser.add_argument("--workers", type=int, default=None, help="解析进程数，默认为 CPU 核数")
+    args = parser.parse_args()
+
+    from models import init_db
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    init_db()
+    if args.prune:
+        print(f"删除了 {prune_snapshots()} 个快照文件")
+    if args.reparse:
+        totals = reparse_snapshots(args.source, args.since, args.until, args.workers)
+        print(f"重新解析 {totals['snapshots']} 个快照，得到 {totals['items']} 条新闻："
+              f"新增 {totals['inserted']} 条，更新 {totals['updated']} 条")
+    if not (args.prune or args.reparse):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import logging
+
+from models import SourceState, get_db
+
+logger = logging.getLogger(__name__)
+
+# 累加型计数字段
+COUNTER_FIELDS = ("fetch_count", "not_modified_count", "unchanged_count", "bytes_downloaded", "bytes_saved",
+                  "consecutive_errors")
+
+
+def load_source_state(source):
+    """读取新闻源的抓取状态，不存在时返回空字典"""
+    db = next(get_db())
+    try:
+        state = db.get(SourceState, source)
+        return state.to_dict() if state else {}
+    finally:
+        db.close()
+
+
+def load_all_source_states():
+    """读取所有新闻源的抓取状态，返回 {来源key: 状态字典}"""
+    db = next(get_db())
+    try:
+        return {state.source: state.to_dict() for state in db.query(SourceState).all()}
+    finally:
+        db.close()
+
+
+def update_source_state(source, increments=None, **values):
+    """更新新闻源的抓取状态
+
+    values 中的字段直接覆盖，increments 中的计数字段在原值上累加。
+    """
+    db = next(get_db())
+    try:
+        state = db.get(SourceState, source)
+        if state is None:
+            state = SourceState(source=source, **{field: 0 for field in COUNTER_FIELDS})
+            db.add(state)
+        for field, value in values.items():
+            setattr(state, field, value)
+        for field, delta in (increments or {}).items():
+            setattr(state, field, (getattr(state, field) or 0) + delta)
+        db.commit()
+    except Exception as e:
+        logger.error(f"更新新闻源状态时出错: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def record_source_error(source, error):
+    """记录一次抓取失败，连续失败次数加一"""
+    update_source_state(source, increments={"consecutive_errors": 1}, last_error=error)